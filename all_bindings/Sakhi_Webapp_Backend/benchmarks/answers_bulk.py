@@ -0,0 +1,66 @@
+"""
+Benchmark: onboarding answer persistence, one insert per answer vs bulk upsert.
+
+Writes the same submission to sakhi_users_answer both ways against the
+configured Supabase project and reports wall time per submission. Rows use
+question keys prefixed with a random run id and are deleted afterwards. Needs
+the server's Supabase environment and an existing user id (answers reference
+sakhi_users):
+
+    python benchmarks/answers_bulk.py --user-id <uuid> [--answers 10] [--rounds 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase_client import supabase_delete  # noqa: E402
+from modules.user_answers import ANSWERS_TABLE, save_bulk_answers, save_user_answer  # noqa: E402
+
+
+def loop_insert(user_id, answers):
+    """The per-answer loop save_bulk_answers used before the bulk upsert."""
+    return [save_user_answer(user_id, a["question_key"], a["selected_options"]) for a in answers]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--answers", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    prefix = f"bench_{uuid.uuid4().hex[:8]}"
+    timings = {"loop insert": [], "bulk upsert": []}
+    try:
+        for r in range(args.rounds):
+            for label, write in (("loop insert", loop_insert), ("bulk upsert", save_bulk_answers)):
+                answers = [
+                    {"question_key": f"{prefix}_{label[0]}{r}_{i}", "selected_options": [f"option_{i % 4}"]}
+                    for i in range(args.answers)
+                ]
+                started = time.perf_counter()
+                write(args.user_id, answers)
+                timings[label].append((time.perf_counter() - started) * 1000)
+
+        # Resubmitting the same keys must update in place, not add rows
+        answers = [{"question_key": f"{prefix}_resubmit_{i}", "selected_options": ["a"]} for i in range(args.answers)]
+        first = save_bulk_answers(args.user_id, answers)[1]
+        again = save_bulk_answers(args.user_id, [{**a, "selected_options": ["b"]} for a in answers])[1]
+        same_rows = [row.get("id") for row in first] == [row.get("id") for row in again]
+        print(f"resubmit idempotent: {same_rows and all(row['selected_options'] == ['b'] for row in again)}")
+    finally:
+        supabase_delete(ANSWERS_TABLE, f"user_id=eq.{args.user_id}&question_key=like.{prefix}_*")
+
+    print(f"\n{args.answers} answers per submission, {args.rounds} rounds")
+    print(f"{'method':<14} {'p50 ms':>9} {'max ms':>9}")
+    for label, samples in timings.items():
+        print(f"{label:<14} {statistics.median(samples):9.1f} {max(samples):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Load test: /sakhi/chat throughput and latency under concurrent users.
+
+Each virtual user onboards through the chat itself (phone number -> name ->
+gender -> location), then sends --turns messages one after another, cycling
+through small talk and simple and complex medical questions, so every route is
+exercised. Users run concurrently; the test is repeated for each --users level.
+Start the server with its normal model and database configuration, run this
+before and after a change, and compare the tables:
+
+    uvicorn main:app --port 8000
+    python benchmarks/chat_load.py --url http://localhost:8000 [--users 1,8,32] [--turns 3]
+
+Onboarding creates sakhi_users rows whose phone numbers start with
+--phone-prefix, so point the server at a staging project.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+MESSAGES = [
+    "hi, how are you?",
+    "what foods are rich in iron?",
+    "where is your clinic in vizag?",
+    "my AMH is 0.8 and I had two failed IUIs, should we try IVF with ICSI?",
+    "thank you so much",
+    "is it safe to travel in the first trimester?",
+]
+ONBOARDING = ["Load Tester", "Female", "Vizag"]
+
+
+async def run_user(client: httpx.AsyncClient, phone: str, turns: int, latencies: list, errors: list) -> None:
+    async def send(message: str) -> dict:
+        response = await client.post("/sakhi/chat", json={"phone_number": phone, "message": message})
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        # First call creates the user; the next three answer the onboarding questions
+        await send("hello")
+        for answer in ONBOARDING:
+            await send(answer)
+    except Exception as e:
+        errors.append(f"onboarding: {e}")
+        return
+
+    for _ in range(turns):
+        started = time.perf_counter()
+        try:
+            await send(random.choice(MESSAGES))
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_level(url: str, users: int, turns: int, phone_prefix: str, timeout: float) -> dict:
+    latencies: list = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        run_id = random.randint(0, 9999)
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            run_user(client, f"{phone_prefix}{run_id:04d}{i:04d}", turns, latencies, errors)
+            for i in range(users)
+        ])
+        # Onboarding turns are included in wall time but not in the latency columns
+        wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "users": users,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan"),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per user after onboarding")
+    parser.add_argument("--phone-prefix", default="90000")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'turns':>6} {'errors':>7} {'wall s':>8} {'turns/s':>8} {'p50 s':>7} {'p95 s':>7}")
+    for users in [int(u) for u in args.users.split(",")]:
+        r = asyncio.run(run_level(args.url, users, args.turns, args.phone_prefix, args.timeout))
+        print(
+            f"{r['users']:>6} {r['turns']:>6} {r['errors']:>7} {r['wall']:8.1f} "
+            f"{r['throughput']:8.2f} {r['p50']:7.2f} {r['p95']:7.2f}"
+        )
+        if r["first_error"]:
+            print(f"       first error: {r['first_error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: list payload size and serialization time, before vs after projection.
+
+Compares what the Knowledge Hub and stories list endpoints used to send (full
+rows for every item, no paging) with the summary view (card columns, one page),
+raw and compressed. Uses synthetic rows sized like production content, so it
+needs no database or API keys:
+
+    python benchmarks/list_payloads.py [--items 100] [--page 20] [--rounds 200]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Mirrors KnowledgeHubSummary / StorySummary in main.py
+KNOWLEDGE_HUB_SUMMARY_FIELDS = (
+    "id", "slug", "title", "summary", "life_stage_id", "perspective_id", "author_name",
+    "read_time_minutes", "is_featured", "published_at", "updated_at",
+)
+STORY_SUMMARY_FIELDS = (
+    "id", "slug", "title", "summary", "name", "city", "stage", "journey_duration", "treatments",
+    "journey_outcome", "photo_url", "language", "status", "created_at",
+)
+
+PARAGRAPH = (
+    "Ovulation usually happens about 14 days before the next period. Tracking cycle length, "
+    "basal body temperature and cervical mucus together gives a clearer picture than any single sign. "
+)
+PARAGRAPH_TE = "అండోత్సర్గం సాధారణంగా తదుపరి పీరియడ్‌కు 14 రోజుల ముందు జరుగుతుంది. " * 3
+
+
+def text(seed: int, paragraph: str, paragraphs: int) -> str:
+    """Shuffled-word paragraphs, so compression ratios resemble real articles."""
+    rng = random.Random(seed)
+    words = paragraph.split()
+    return "\n\n".join(" ".join(rng.sample(words, len(words))) for _ in range(paragraphs))
+
+
+def make_articles(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": i,
+            "slug": f"article-{i}",
+            "title": f"Understanding your fertile window, part {i}",
+            "title_te": f"మీ ఫెర్టైల్ విండో, భాగం {i}",
+            "summary": "How to read the signs your body gives around ovulation.",
+            "summary_te": "అండోత్సర్గం సమయంలో శరీరం ఇచ్చే సంకేతాలు.",
+            "content": text(i, PARAGRAPH * 4, 8),
+            "content_te": text(i, PARAGRAPH_TE * 4, 8),
+            "life_stage_id": i % 5 + 1,
+            "perspective_id": i % 4 + 1,
+            "author_name": "Dr. Sakhi Team",
+            "read_time_minutes": 6,
+            "is_featured": i % 7 == 0,
+            "published_at": (now - timedelta(days=i)).isoformat(),
+            "updated_at": (now - timedelta(days=i)).isoformat(),
+        }
+        for i in range(n)
+    ]
+
+
+def make_stories(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "share_type": "public",
+            "name": "Lakshmi",
+            "city": "Hyderabad",
+            "journey_duration": "3 years",
+            "challenges": "PCOS and two failed IUI cycles. " * 5,
+            "emotions": ["hopeful", "anxious", "grateful"],
+            "treatments": ["IUI", "IVF"],
+            "emotion_description": "Some months felt endless. " * 10,
+            "journey_outcome": "Positive pregnancy",
+            "more_details": "We changed clinics after the second cycle. " * 10,
+            "hope_message": "Keep asking questions and lean on each other. " * 3,
+            "photo_url": None,
+            "summary": "Hope after a long wait",
+            "generated_story": text(i, PARAGRAPH * 4, 7),
+            "slug": f"story-{i}",
+            "title": "Our IVF journey",
+            "stage": "pregnant",
+            "language": "en",
+            "status": "published",
+            "consent": True,
+            "created_at": (now - timedelta(hours=i)).isoformat(),
+        }
+        for i in range(n)
+    ]
+
+
+def measure(label: str, build, rounds: int) -> None:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    per_call_ms = (time.perf_counter() - started) * 1000 / rounds
+
+    gz = len(gzip.compress(body, compresslevel=6))
+    br = len(brotli.compress(body, quality=5)) if brotli else None
+    br_text = f"{br / 1024:9.1f}" if br is not None else "      n/a"
+    print(f"{label:<34} {len(body) / 1024:9.1f} {gz / 1024:9.1f} {br_text} {per_call_ms:10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--items", type=int, default=100, help="rows in the table (old perPage default: 100)")
+    parser.add_argument("--page", type=int, default=20, help="page size of the new list endpoints")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    articles = make_articles(args.items)
+    stories = make_stories(args.items)
+
+    def project(rows, fields):
+        return [{field: row.get(field) for field in fields} for row in rows]
+
+    print(f"{'payload':<34} {'raw KiB':>9} {'gzip KiB':>9} {'br KiB':>9} {'json ms':>10}")
+    detail_fields = KNOWLEDGE_HUB_SUMMARY_FIELDS + ("content",)
+    measure("knowledge-hub before (full x all)", lambda: project(articles, detail_fields), args.rounds)
+    measure("knowledge-hub detail (one page)", lambda: project(articles[:args.page], detail_fields), args.rounds)
+    measure("knowledge-hub summary (one page)",
+            lambda: project(articles[:args.page], KNOWLEDGE_HUB_SUMMARY_FIELDS), args.rounds)
+    measure("stories before (full x all)", lambda: stories, args.rounds)
+    measure("stories summary (one page)",
+            lambda: project(stories[:args.page], STORY_SUMMARY_FIELDS), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
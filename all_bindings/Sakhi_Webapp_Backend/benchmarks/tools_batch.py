@@ -0,0 +1,116 @@
+"""
+Benchmark: batch date calculators vs one request per date, with an equivalence check.
+
+For random inputs, every /batch endpoint's output (columnar and NDJSON) is
+compared item by item with the single-item endpoint, and the script exits
+non-zero on any mismatch; cycle 1 of every /ovulation/calendar projection is
+checked against /ovulation the same way. It then times N single requests against one batch
+request. In-process through FastAPI's TestClient; needs no database or keys:
+
+    python benchmarks/tools_batch.py [--items 500] [--seed 7]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from modules import tools  # noqa: E402
+
+
+def random_inputs(rng: random.Random, n: int) -> dict:
+    today = date.today()
+
+    def day(lo, hi):
+        return str(today + timedelta(days=rng.randint(lo, hi)))
+
+    return {
+        "due-date": [{"lmp": day(-400, 30)} for _ in range(n)],
+        "ovulation": [{"lastPeriod": day(-60, 10), "cycleLength": rng.randint(21, 40)} for _ in range(n)],
+        "conception-calculator": [
+            {
+                "date": day(-400, 280),
+                "type": rng.choice(["LMP", "DUE_DATE"]),
+                "cycleLength": rng.choice([None, 0, 24, 28, 31, 35]),
+                "isIrregular": rng.choice([None, False, True]),
+                "dueDateConfidence": rng.choice([None, "DOCTOR", "ESTIMATED"]),
+            }
+            for _ in range(n)
+        ],
+        "pregnancy-week": [
+            {"referenceDate": day(-320, 300) + rng.choice(["", "T10:00:00Z"]), "type": rng.choice(["LMP", "DUE_DATE"])}
+            for _ in range(n)
+        ],
+    }
+
+
+def to_batch(items: list) -> dict:
+    """List of single requests -> one batch request (per-item columns)."""
+    return {key: [item[key] for item in items] for key in items[0]}
+
+
+def check(client: TestClient, name: str, items: list) -> None:
+    singles = [client.post(f"/api/tools/{name}", json=item).json() for item in items]
+
+    columnar = client.post(f"/api/tools/{name}/batch", json=to_batch(items)).json()
+    week_data = columnar.pop("weekData", None) if name == "pregnancy-week" else None
+    for i, single in enumerate(singles):
+        row = {key: values[i] for key, values in columnar.items()}
+        if week_data is not None:
+            row["weekData"] = week_data[str(row["currentWeek"])]
+        if row != single:
+            sys.exit(f"{name} columnar mismatch at {i}: {items[i]}\n  single: {single}\n  batch:  {row}")
+
+    lines = client.post(f"/api/tools/{name}/batch?format=ndjson", json=to_batch(items)).text.splitlines()
+    for i, (single, line) in enumerate(zip(singles, lines)):
+        if json.loads(line) != single:
+            sys.exit(f"{name} ndjson mismatch at {i}: {items[i]}")
+    print(f"{name:<24} {len(items)} items identical (columnar + ndjson)")
+
+
+def check_calendar(client: TestClient, items: list) -> None:
+    for i, item in enumerate(items):
+        single = client.post("/api/tools/ovulation", json=item).json()
+        first = client.post("/api/tools/ovulation/calendar", json={**item, "cycles": 12}).json()["cycles"][0]
+        if {key: first[key] for key in single} != single:
+            sys.exit(f"ovulation/calendar mismatch at {i}: {item}\n  single:   {single}\n  calendar: {first}")
+    print(f"{'ovulation/calendar':<24} {len(items)} items, cycle 1 identical to /ovulation")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    app = FastAPI()
+    app.include_router(tools.router)
+    client = TestClient(app)
+    inputs = random_inputs(random.Random(args.seed), args.items)
+
+    for name, items in inputs.items():
+        check(client, name, items)
+    check_calendar(client, inputs["ovulation"])
+
+    print(f"\n{'endpoint':<24} {'N singles ms':>13} {'1 batch ms':>11}")
+    for name, items in inputs.items():
+        started = time.perf_counter()
+        for item in items:
+            client.post(f"/api/tools/{name}", json=item)
+        singles_ms = (time.perf_counter() - started) * 1000
+        body = to_batch(items)
+        started = time.perf_counter()
+        client.post(f"/api/tools/{name}/batch", json=body)
+        batch_ms = (time.perf_counter() - started) * 1000
+        print(f"{name:<24} {singles_ms:13.1f} {batch_ms:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: latency of every /api/tools endpoint, plus the lookup tables.
+
+Endpoints are called in-process through FastAPI's TestClient (routing,
+validation and serialization included, no network). The second table compares
+the compiled lookups in modules/tools.py with the per-request scans they
+replaced. Needs no database or API keys:
+
+    python benchmarks/tools_endpoints.py [--rounds 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil.relativedelta import relativedelta  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from modules import tools  # noqa: E402
+
+TODAY = date.today()
+BABY_COST_REQUEST = {
+    "city_tier": "METRO", "hospital_type": "PVT_STD", "delivery_type": "NORMAL",
+    "feeding_type": "MIXED", "formula_tier": "STD", "diapers_per_day": 6, "diaper_brand": "BRANDED",
+    "wipes_enabled": True, "clothing_tier": "STANDARD", "health_type": "PVT_PED",
+    "childcare_type": "NONE", "gear_selection": {"cradle": "budget", "stroller": "premium"},
+}
+ENDPOINTS = [
+    ("GET", "/api/tools/pregnancy-weeks", None),
+    ("GET", "/api/tools/pregnancy-week/20", None),
+    ("GET", "/api/tools/safety-check", None),
+    ("GET", "/api/tools/safety-check?q=pap", None),
+    ("GET", "/api/tools/readiness-checklist", None),
+    ("POST", "/api/tools/vaccination-schedule", {"dob": str(TODAY - timedelta(days=200))}),
+    ("POST", "/api/tools/due-date", {"lmp": str(TODAY - timedelta(days=90))}),
+    ("POST", "/api/tools/ovulation", {"lastPeriod": str(TODAY - timedelta(days=10)), "cycleLength": 28}),
+    ("POST", "/api/tools/ovulation/calendar", {"lastPeriod": str(TODAY - timedelta(days=10)), "cycles": 12, "isIrregular": True}),
+    ("POST", "/api/tools/pregnancy-week", {"referenceDate": str(TODAY - timedelta(days=150)), "type": "LMP"}),
+    ("POST", "/api/tools/conception-calculator", {"date": str(TODAY - timedelta(days=60)), "type": "LMP"}),
+    ("POST", "/api/tools/am-i-pregnant", {
+        "q1_period": "LATE_1_4", "q2_sex": "YES", "q3_spotting": "NO", "q4_symptoms": "ONE_TWO", "q5_test": "NO",
+    }),
+    ("POST", "/api/tools/baby-cost-calculator", BABY_COST_REQUEST),
+]
+
+
+# Per-request implementations the lookup tables replaced
+def week_scan(week):
+    return next((w for w in tools.PREGNANCY_WEEKS if w["week"] == week), None)
+
+
+def safety_scan(q):
+    q_lower = q.lower()
+    return [i for i in tools.SAFETY_ITEMS if q_lower in i["name"].lower() or q_lower in i["category"].lower()]
+
+
+def vaccine_scan(dob):
+    out = []
+    for stage in tools.VACCINES:
+        offset = stage["offset"]
+        due = dob
+        if "days" in offset:
+            due = dob + timedelta(days=offset["days"])
+        if "weeks" in offset:
+            due = dob + timedelta(weeks=offset["weeks"])
+        if "months" in offset:
+            due = dob + relativedelta(months=offset["months"])
+        if "years" in offset:
+            due = dob + relativedelta(years=offset["years"])
+        out.append(due)
+    return out
+
+
+def time_us(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    app = FastAPI()
+    app.include_router(tools.router)
+    client = TestClient(app)
+
+    print(f"{'endpoint':<48} {'status':>6} {'p50 us':>9} {'p99 us':>9}")
+    for method, path, body in ENDPOINTS:
+        call = (lambda: client.get(path)) if method == "GET" else (lambda: client.post(path, json=body))
+        status = call().status_code
+        p50, p99 = time_us(call, args.rounds)
+        print(f"{method + ' ' + path:<48} {status:>6} {p50:9.1f} {p99:9.1f}")
+
+    etag = client.get("/api/tools/pregnancy-weeks").headers["etag"]
+    p50, p99 = time_us(lambda: client.get("/api/tools/pregnancy-weeks", headers={"If-None-Match": etag}), args.rounds)
+    print(f"{'GET /api/tools/pregnancy-weeks (304)':<48} {304:>6} {p50:9.1f} {p99:9.1f}")
+
+    dob = TODAY - timedelta(days=200)
+    rounds = args.rounds * 10
+    print(f"\n{'lookup':<28} {'scan p50 us':>12} {'table p50 us':>13}")
+    for label, before, after in [
+        ("pregnancy week", lambda: week_scan(39), lambda: tools.WEEK_TABLE[39]),
+        ("safety search 'fish'", lambda: safety_scan("fish"), lambda: tools._safety_search("fish")),
+        ("vaccine due dates", lambda: vaccine_scan(dob), lambda: [tools._add_offset(dob, d, m) for _, _, d, m in tools.VACCINE_OFFSETS]),
+    ]:
+        print(f"{label:<28} {time_us(before, rounds)[0]:12.2f} {time_us(after, rounds)[0]:13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: sakhi_users read size and latency, select="*" vs the projected views.
+
+Reads one user with select="*" and with each view in modules/user_profile.py
+(chat identity, profile, rewards) through the configured storage backend, and
+reports the JSON payload size and p50 latency per view. Against Supabase pass
+an existing --user-id. With STORAGE_BACKEND=sqlite and no --user-id, a
+synthetic user with a chat-sized context JSON is written first:
+
+    python benchmarks/user_projection.py [--user-id <uuid>] [--rounds 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase_client import supabase_insert, supabase_select  # noqa: E402
+from storage import STORAGE_BACKEND  # noqa: E402
+from modules.user_profile import CHAT_IDENTITY_COLUMNS, PROFILE_COLUMNS, REWARDS_COLUMNS  # noqa: E402
+
+VIEWS = [
+    ("select=*", "*"),
+    ("chat identity", CHAT_IDENTITY_COLUMNS),
+    ("profile", PROFILE_COLUMNS),
+    ("rewards", REWARDS_COLUMNS),
+]
+
+
+def synthetic_user() -> dict:
+    # Lead-flow and onboarding state accumulate in context over a conversation
+    context = {
+        "lead_flow": {"step": "ask_problem", "data": {"name": "Ravi", "phone": "9876543210", "age": "31"}},
+        "history": [{"q": f"question {i} about ovulation tracking", "a": "answer " * 40} for i in range(12)],
+    }
+    return {
+        "user_id": str(uuid.uuid4()), "name": "Deepthi", "email": "deepthi@example.com",
+        "phone_number": "9876543210", "password_hash": "x" * 60, "role": "USER",
+        "preferred_language": "Telugu", "relation_to_patient": "self", "gender": "Female",
+        "location": "Vizag", "rewards": 42, "sakhi_journey_stage": "TTC",
+        "sakhi_journey_date": "2026-01-01", "sakhi_journey_date_type": "LMP", "context": context,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--user-id")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id = args.user_id
+    if not user_id:
+        if STORAGE_BACKEND != "sqlite":
+            sys.exit("--user-id is required unless STORAGE_BACKEND=sqlite")
+        user_id = supabase_insert("sakhi_users", synthetic_user())[0]["user_id"]
+
+    print(f"{'view':<16} {'columns':>8} {'bytes':>7} {'p50 ms':>8}")
+    for label, columns in VIEWS:
+        rows = supabase_select("sakhi_users", select=columns, filters=f"user_id=eq.{user_id}")
+        if not rows:
+            sys.exit(f"user {user_id} not found")
+        size = len(json.dumps(rows, default=str).encode("utf-8"))
+        samples = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            supabase_select("sakhi_users", select=columns, filters=f"user_id=eq.{user_id}")
+            samples.append((time.perf_counter() - started) * 1000)
+        print(f"{label:<16} {len(rows[0]):>8} {size:>7} {statistics.median(samples):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 # main.py
-from fastapi import FastAPI, HTTPException, UploadFile, File, status
+from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, model_validator
 from uuid import UUID
 from enum import Enum
 from datetime import datetime
 import uuid as uuid_module
+import asyncio
 
 from modules.user_profile import (
     create_user,
@@ -14,6 +16,7 @@ from modules.user_profile import (
     get_user_profile,
     resolve_user_id_by_phone,
     get_user_by_phone,
+    get_chat_identity,
     create_partial_user,
     update_user_profile,
     login_user,
@@ -34,6 +37,27 @@ from modules.onboarding_engine import OnboardingRequest, get_next_question
 from modules.parent_profiles import create_parent_profile, update_parent_profile_answers
 from search_hierarchical import hierarchical_rag_query, format_hierarchical_context
 from modules.tools import router as tools_router
+from modules.story_jobs import get_story_job_queue
+from modules.knowledge_hub import get_knowledge_hub_cache, localize, listing_key, if_none_match
+from modules.pagination import (
+    encode_cursor, decode_cursor, clamp_page_size, of_type, timestamp, row_id, NEXT_CURSOR_HEADER,
+)
+from modules.compression import CompressionMiddleware
+from modules.recommendations import get_recommender, resolve_id, STAGE_MAP, LENS_MAP
+from modules.knowledge_search import get_search_index, tokenize, highlight
+from resilience import get_resilience, client_attempt
+from modules.pipeline import Pipeline, Stage
+from modules.session_tokens import (
+    SESSION_TOKEN_HEADER,
+    SESSION_TOKEN_TTL_SECONDS,
+    InvalidSession,
+    bearer_token,
+    is_onboarded,
+    issue_session_token,
+    session_from_header,
+    session_identity,
+    verify_session_token,
+)
 
 app = FastAPI()
 
@@ -47,11 +71,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", NEXT_CURSOR_HEADER, SESSION_TOKEN_HEADER],
 )
 
+# gzip / brotli for JSON payloads (brotli only if the package is installed)
+app.add_middleware(CompressionMiddleware)
+
 # Initialize model gateway and SLM client (singleton instances)
 model_gateway = get_model_gateway()
 slm_client = get_slm_client()
+story_jobs = get_story_job_queue()
+knowledge_hub = get_knowledge_hub_cache()
+recommender = get_recommender(knowledge_hub)
+search_index = get_search_index(knowledge_hub)
+
+
+@app.on_event("startup")
+async def start_story_workers():
+    # Resume story jobs persisted before a restart without waiting for a new story
+    story_jobs.start()
 
 class RegisterRequest(BaseModel):
     name: str  # full name
@@ -120,11 +158,15 @@ class LoginRequest(BaseModel):
 
 
 # ================== KNOWLEDGE HUB MODELS ==================
-class KnowledgeHubResponse(BaseModel):
+class ListView(str, Enum):
+    SUMMARY = "summary"  # card fields only
+    DETAIL = "detail"  # full rows, including long text
+
+
+class KnowledgeHubSummary(BaseModel):
     id: int
     slug: str
     title: str
-    content: str
     summary: str | None = None
     life_stage_id: int | None = None
     perspective_id: int | None = None
@@ -138,6 +180,17 @@ class KnowledgeHubResponse(BaseModel):
         from_attributes = True
 
 
+class KnowledgeHubResponse(KnowledgeHubSummary):
+    content: str
+
+
+class KnowledgeHubSearchHit(KnowledgeHubSummary):
+    score: float
+    # HTML-escaped, query terms wrapped in <mark>
+    title_highlight: str
+    snippet: str
+
+
 # ================== SUCCESS STORIES MODELS ==================
 class ShareType(str, Enum):
     NAMED = "named"
@@ -195,16 +248,57 @@ class StoryResponse(StoryBase):
     status: str
     consent: bool
     created_at: str
+    # Narrative job state: queued | generating | ready | fallback (None if no job is tracked)
+    generation_status: str | None = None
 
     class Config:
         from_attributes = True
 
 
+class StorySummary(BaseModel):
+    id: UUID
+    slug: str | None = None
+    title: str | None = None
+    summary: str | None = None
+    name: str | None = None
+    city: str | None = None
+    stage: str | None = None
+    journey_duration: str | None = None
+    treatments: list[str] | None = None
+    journey_outcome: str | None = None
+    photo_url: str | None = None
+    language: str = "en"
+    status: str
+    created_at: str
+
+
+# Columns fetched for the summary view of the stories list
+STORY_SUMMARY_COLUMNS = ",".join(StorySummary.model_fields)
+
+
 @app.get("/")
 def home():
     return {"message": "Sakhi API working!"}
 
 
+@app.get("/metrics/storage")
+def storage_metrics():
+    """
+    Circuit breaker state per table / RPC and bulkhead usage per pool
+    for database calls.
+    """
+    return get_resilience().stats()
+
+
+@app.get("/metrics/pipeline")
+def pipeline_metrics():
+    """
+    Per-stage timings and the most common critical paths of the chat turn
+    pipeline, plus the last few per-request traces.
+    """
+    return chat_pipeline.stats()
+
+
 @app.post("/user/register")
 def register_user(req: RegisterRequest):
     try:
@@ -243,7 +337,9 @@ def login(req: LoginRequest):
         return {
             "status": "success",
             "user_id": user.get("user_id"),
-            "user": user
+            "user": user,
+            "session_token": issue_session_token(user),
+            "expires_in": SESSION_TOKEN_TTL_SECONDS,
         }
         
     except ValueError as ve:
@@ -254,27 +350,77 @@ def login(req: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/sakhi/chat")
-async def sakhi_chat(req: ChatRequest):
-    # 1. Resolve or Create User
-    user = None
-    if req.user_id:
-        user = get_user_profile(req.user_id)
-    elif req.phone_number:
-        user = get_user_by_phone(req.phone_number)
+@app.post("/user/session/refresh")
+def refresh_session(authorization: str | None = Header(None)):
+    """
+    Exchange an unrevoked session token (expired ones included) for a new one
+    built from the current profile. The new token keeps the original issue
+    time, so refreshing stops SESSION_REFRESH_MAX_AGE_SECONDS after login.
+    """
+    token = bearer_token(authorization)
+    if not token:
+        raise HTTPException(status_code=401, detail="Bearer session token required")
+    try:
+        claims = verify_session_token(token, for_refresh=True)
+        user = get_chat_identity(user_id=claims["sub"])
+    except InvalidSession as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return {
+        "status": "success",
+        "user_id": user.get("user_id"),
+        "session_token": issue_session_token(user, original_issued_at=claims.get("oiat", claims["iat"])),
+        "expires_in": SESSION_TOKEN_TTL_SECONDS,
+    }
+
+
+# ===== Chat turn pipeline =====
+# Each stage declares its inputs; the pipeline runs every stage as soon as
+# they resolve. The gate stage answers the onboarding steps by raising
+# EarlyReply, which also stops everything downstream of it. Generation stages
+# are lazy: only the chosen route's runs.
+# Model calls use the async OpenAI / SLM clients and database calls run in
+# worker threads, so no stage blocks the event loop.
+
+class EarlyReply(Exception):
+    """Raised by the gate stage when the turn is answered before the normal flow."""
+
+    def __init__(self, reply: dict):
+        super().__init__(reply.get("mode"))
+        self.reply = reply
+
+
+async def _load_identity(req: ChatRequest, session, response: Response):
+    # A valid session token of an onboarded user carries the whole chat identity
+    if session and session["onboarded"]:
+        return session_identity(session)
+    if not (req.user_id or req.phone_number):
+        return None
+    user = await asyncio.to_thread(get_chat_identity, user_id=req.user_id, phone_number=req.phone_number)
+    if user and is_onboarded(user):
+        response.headers[SESSION_TOKEN_HEADER] = issue_session_token(user)
+    return user
+
+
+def _gate_turn(req: ChatRequest, response: Response, identity):
+    """Return the user row for the normal flow, or raise EarlyReply."""
+    user = identity
 
     # If new user (by phone), create them
     if not user:
         if req.phone_number:
             try:
                 user = create_partial_user(req.phone_number)
-                # Return Welcome Message
-                return {
-                    "reply": "Welcome to Sakhi! I'm here to support you on your health journey. ❤️ \n Let's get started! What should I call you? (Please type just your name, e.g., Deepthi)",
-                    "mode": "onboarding"
-                }
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to register user: {e}")
+            # Return Welcome Message
+            raise EarlyReply({
+                "reply": "Welcome to Sakhi! I'm here to support you on your health journey. ❤️ \n Let's get started! What should I call you? (Please type just your name, e.g., Deepthi)",
+                "mode": "onboarding"
+            })
         else:
              raise HTTPException(status_code=400, detail="user_id or phone_number is required")
 
@@ -291,23 +437,24 @@ async def sakhi_chat(req: ChatRequest):
     # STATE 1: WAITING FOR NAME (User sent Name)
     if not current_name:
         update_user_profile(user_id, {"name": msg})
-        return {
+        raise EarlyReply({
             "reply": f"Nice to meet you, {msg}! Can you let me know your gender ? (Please reply with 'Male' or 'Female')",
             "mode": "onboarding"
-        }
+        })
 
     # STATE 2: WAITING FOR GENDER (User sent Gender)
     elif not current_gender:
         update_user_profile(user_id, {"gender": msg})
-        return {
+        raise EarlyReply({
             "reply": "Got it. And finally, what's your location (City/Town)? (e.g., Vizag)",
             "mode": "onboarding"
-        }
+        })
 
     # STATE 3: WAITING FOR LOCATION (User sent Location)
     elif not current_location:
         # Update both keys to be safe
         update_user_profile(user_id, {"location": msg}) 
+        response.headers[SESSION_TOKEN_HEADER] = issue_session_token({**user, "location": msg})
         
         long_intro = (
             "Thank you! Your profile is all set.\n"
@@ -322,190 +469,259 @@ async def sakhi_chat(req: ChatRequest):
             "Visit the Website below for more information"
         )
         
-        return {
+        raise EarlyReply({
             "reply": long_intro, 
             "mode": "onboarding_complete",
             "image": "Sakhi_intro.png"
-        }
+        })
+
+    return user
 
-    # 3. Normal Flow
+
+def _save_user_message(req: ChatRequest, gate):
+    save_user_message(gate.get("user_id"), req.message, req.language)
+
+
+async def _decide_route(req: ChatRequest, gate):
     try:
-        save_user_message(user_id, req.message, req.language)
+        return await model_gateway.decide_route(req.message)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+        # Embedding or anchor failure: take the default (safest) route rather than fail the turn
+        print(f"Routing failed, defaulting to OPENAI_RAG: {e}")
+        return Route.OPENAI_RAG
+
+
+async def _classify(req: ChatRequest, gate):
+    return await classify_message(req.message)
+
+
+async def _generate_intent(req: ChatRequest, gate):
+    # Generate intent description dynamically (concurrently with generation)
+    return await generate_intent(req.message)
 
-    # STEP 0: Decide routing using Model Gateway
-    route = model_gateway.decide_route(req.message)
 
-    # Step 1: classify message
+def _load_history(gate):
+    # Only the OpenAI / small-talk fallback uses it; pruned on the SLM routes
+    return get_last_messages(gate.get("user_id"), limit=5)
+
+
+def _detected_language(req: ChatRequest, classification):
+    return classification.get("language", req.language)
+
+
+async def _generate_slm_direct(req: ChatRequest, gate, language):
     try:
-        classification = classify_message(req.message)
+        return await slm_client.generate_chat(
+            message=req.message,
+            language=language,
+            user_name=gate.get("name"),
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to classify message: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
 
-    detected_lang = classification.get("language", req.language)
-    signal = classification.get("signal", "NO")
 
-    # Fetch user name for personalization
-    user_name = None
+async def _generate_slm_rag(req: ChatRequest, gate, language):
+    # Perform RAG search
     try:
-        profile = get_user_profile(user_id)
-        if profile:
-            user_name = profile.get("name")
-    except Exception:
-        user_name = None
+        kb_results = await asyncio.to_thread(hierarchical_rag_query, req.message)
+        context_text = format_hierarchical_context(kb_results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
 
-    # Conversation history for both modes
-    history = get_last_messages(user_id, limit=5)
+    # Generate response using SLM with context
+    try:
+        final_ans = await slm_client.generate_rag_response(
+            context=context_text,
+            message=req.message,
+            language=language,
+            user_name=gate.get("name"),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
+    return final_ans, kb_results
 
-    # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
-    if route == Route.SLM_DIRECT:
-        try:
-            final_ans = await slm_client.generate_chat(
-                message=req.message,
-                language=detected_lang,
-                user_name=user_name,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
-        
+
+async def _generate_smalltalk(req: ChatRequest, gate, language, history):
+    # Small-talk mode: no RAG
+    try:
+        return await generate_smalltalk_response(
+            req.message,
+            language,
+            history,
+            user_name=gate.get("name"),
+            store_to_kb=False,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate small-talk response: {e}")
+
+
+async def _generate_openai_rag(req: ChatRequest, gate, language, history):
+    # Medical mode: RAG
+    try:
+        return await generate_medical_response(
+            prompt=req.message,
+            target_lang=language,
+            history=history,
+            user_name=gate.get("name"),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
+
+
+chat_pipeline = Pipeline(
+    "chat_turn",
+    [
+        Stage("identity", _load_identity, inputs=("req", "session", "response")),
+        Stage("gate", _gate_turn, inputs=("req", "response", "identity"), blocking=True),
+        Stage("save_user_message", _save_user_message, inputs=("req", "gate"), blocking=True),
+        Stage("route", _decide_route, inputs=("req", "gate")),
+        Stage("classification", _classify, inputs=("req", "gate")),
+        Stage("intent", _generate_intent, inputs=("req", "gate")),
+        Stage("history", _load_history, inputs=("gate",), blocking=True),
+        Stage("language", _detected_language, inputs=("req", "classification")),
+        Stage("slm_direct", _generate_slm_direct, inputs=("req", "gate", "language"), lazy=True),
+        Stage("slm_rag", _generate_slm_rag, inputs=("req", "gate", "language"), lazy=True),
+        Stage("smalltalk", _generate_smalltalk, inputs=("req", "gate", "language", "history"), lazy=True),
+        Stage("openai_rag", _generate_openai_rag, inputs=("req", "gate", "language", "history"), lazy=True),
+    ],
+    seeds=("req", "session", "response"),
+)
+
+# Generation stages each route may still use once it is known
+ROUTE_STAGES = {
+    Route.SLM_DIRECT: ("slm_direct",),
+    Route.SLM_RAG: ("slm_rag",),
+    Route.OPENAI_RAG: ("openai_rag", "smalltalk"),
+}
+
+
+@app.post("/sakhi/chat")
+async def sakhi_chat(req: ChatRequest, response: Response, authorization: str | None = Header(None)):
+    session = session_from_header(authorization, user_id=req.user_id)
+
+    async with chat_pipeline.run(req=req, session=session, response=response) as run:
+        # 1. Resolve or create the user and run onboarding
         try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Generate intent description dynamically
-        intent = generate_intent(req.message)
-        
-        return {
-            "intent": intent,
-            "reply": final_ans,
-            "mode": "general",
-            "language": detected_lang,
-            "route": "slm_direct"
-        }
-    
-    # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
-    elif route == Route.SLM_RAG:
-        # Perform RAG search
+            user = await run.result("gate")
+        except EarlyReply as e:
+            return e.reply
+
+        user_id = user.get("user_id")
+
+        # 2. Route; classification, intent and history are already running
+        route = await run.result("route")
+        run.prune(keep=ROUTE_STAGES[route] + ("save_user_message", "intent"))
+
         try:
-            kb_results = hierarchical_rag_query(req.message)
-            context_text = format_hierarchical_context(kb_results)
+            classification = await run.result("classification")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
-        
-        # Generate response using SLM with context
+            raise HTTPException(status_code=500, detail=f"Failed to classify message: {e}")
+        detected_lang = await run.result("language")
+        signal = classification.get("signal", "NO")
+
         try:
-            final_ans = await slm_client.generate_rag_response(
-                context=context_text,
-                message=req.message,
-                language=detected_lang,
-                user_name=user_name,
-            )
+            await run.result("save_user_message")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+
+        # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
+        if route == Route.SLM_DIRECT:
+            final_ans = await run.result("slm_direct")
+            
+            try:
+                await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            return {
+                "intent": await run.result("intent"),
+                "reply": final_ans,
+                "mode": "general",
+                "language": detected_lang,
+                "route": "slm_direct"
+            }
         
+        # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
+        elif route == Route.SLM_RAG:
+            final_ans, kb_results = await run.result("slm_rag")
+            
+            try:
+                await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            # Extract metadata from KB results
+            infographic_url = None
+            youtube_link = None
+            if kb_results:
+                for item in kb_results:
+                    if item.get("source_type") == "FAQ":
+                        if item.get("infographic_url"):
+                            infographic_url = item["infographic_url"]
+                        if item.get("youtube_link"):
+                            youtube_link = item["youtube_link"]
+                        if infographic_url or youtube_link:
+                            break
+            
+            response_payload = {
+                "intent": await run.result("intent"),
+                "reply": final_ans,
+                "mode": "medical",
+                "language": detected_lang,
+                "youtube_link": youtube_link,
+                "infographic_url": infographic_url,
+                "route": "slm_rag"
+            }
+            print(f"Response Payload: {response_payload}")
+            return response_payload
+
+        # Keep existing small talk logic as fallback (though routing should handle this)
+        if signal != "YES":
+            run.prune(keep=("smalltalk", "intent"))
+            final_ans = await run.result("smalltalk")
+
+            try:
+                await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+
+            return {"reply": final_ans, "mode": "general", "language": detected_lang}
+
+        # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
+        final_ans, _kb = await run.result("openai_rag")
+
         try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
+            await asyncio.to_thread(save_sakhi_message, user_id, final_ans, detected_lang)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Extract metadata from KB results
+
+        # Extract infographic_url and youtube_link if available in kb_results
         infographic_url = None
         youtube_link = None
-        if kb_results:
-            for item in kb_results:
+
+        if _kb:
+            for item in _kb:
                 if item.get("source_type") == "FAQ":
                     if item.get("infographic_url"):
                         infographic_url = item["infographic_url"]
                     if item.get("youtube_link"):
                         youtube_link = item["youtube_link"]
+                    # If we found an FAQ match, we likely want to use its metadata
                     if infographic_url or youtube_link:
                         break
-        
-        # Generate intent description dynamically
-        intent = generate_intent(req.message)
-        
+
         response_payload = {
-            "intent": intent,
-            "reply": final_ans,
-            "mode": "medical",
+            "intent": await run.result("intent"),
+            "reply": final_ans, 
+            "mode": "medical", 
             "language": detected_lang,
             "youtube_link": youtube_link,
             "infographic_url": infographic_url,
-            "route": "slm_rag"
+            "route": "openai_rag"
         }
         print(f"Response Payload: {response_payload}")
         return response_payload
 
-    # Keep existing small talk logic as fallback (though routing should handle this)
-    if signal != "YES":
-        # Small-talk mode: no RAG
-        try:
-            final_ans = generate_smalltalk_response(
-                req.message,
-                detected_lang,
-                history,
-                user_name=user_name,
-                store_to_kb=False,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate small-talk response: {e}")
-
-        try:
-            save_sakhi_message(user_id, final_ans, detected_lang)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-
-        return {"reply": final_ans, "mode": "general", "language": detected_lang}
-
-    # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
-    # Medical mode: RAG
-    try:
-        final_ans, _kb = generate_medical_response(
-            prompt=req.message,
-            target_lang=detected_lang,
-            history=history,
-            user_name=user_name,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
-
-    try:
-        save_sakhi_message(user_id, final_ans, detected_lang)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-
-    # Extract infographic_url and youtube_link if available in kb_results
-    infographic_url = None
-    youtube_link = None
-
-    if _kb:
-        for item in _kb:
-            if item.get("source_type") == "FAQ":
-                if item.get("infographic_url"):
-                    infographic_url = item["infographic_url"]
-                if item.get("youtube_link"):
-                    youtube_link = item["youtube_link"]
-                # If we found an FAQ match, we likely want to use its metadata
-                if infographic_url or youtube_link:
-                    break
-
-    # Generate intent description dynamically
-    intent = generate_intent(req.message)
-    
-    response_payload = {
-        "intent": intent,
-        "reply": final_ans, 
-        "mode": "medical", 
-        "language": detected_lang,
-        "youtube_link": youtube_link,
-        "infographic_url": infographic_url,
-        "route": "openai_rag"
-    }
-    print(f"Response Payload: {response_payload}")
-    return response_payload
-
 
 @app.post("/user/answers")
 def save_user_answers(req: UserAnswersRequest):
@@ -590,6 +806,8 @@ def update_user_journey(req: JourneyUpdateRequest):
         # logic: update user profile.
         
         update_user_profile(req.user_id, updates)
+        # Recommendations personalize on the journey stage
+        recommender.forget_user(req.user_id)
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -599,21 +817,22 @@ def update_user_journey(req: JourneyUpdateRequest):
 
 
 @app.get("/api/user/me")
-def get_current_user_profile(user_id: str):
+def get_current_user_profile(user_id: str | None = None, authorization: str | None = Header(None)):
     """
     Fetch current user profile including journey details.
+    The user comes from user_id or, if omitted, from the bearer session token.
     """
+    session = session_from_header(authorization, user_id=user_id)
+    user_id = user_id or (session["sub"] if session else None)
     if not user_id:
-        raise HTTPException(status_code=400, detail="user_id parameter is required")
+        raise HTTPException(status_code=400, detail="user_id parameter or session token is required")
 
     try:
         user = get_user_profile(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Ensure we return the new fields. 
-        # get_user_profile does select="*" so it should be there automatically 
-        # once the DB is updated.
+        # PROFILE_COLUMNS includes the journey fields
         return user
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -727,8 +946,28 @@ def onboarding_complete(req: OnboardingCompleteRequest):
 
 
 # ================== KNOWLEDGE HUB ROUTES ==================
-@app.get("/api/knowledge-hub/", response_model=list[KnowledgeHubResponse], tags=["knowledge-hub"])
+def _knowledge_hub_response(request: Request, params: tuple, build) -> Response:
+    """
+    Serve a cached Knowledge Hub body, or 304 if the client already has it.
+    The ETag and the body come from the same snapshot. `build` returns
+    (payload, extra_headers) and only runs on a cache miss.
+    """
+    snapshot = knowledge_hub.snapshot()
+    etag = knowledge_hub.etag(snapshot, *params)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body, extra_headers = knowledge_hub.render(snapshot, etag, build)
+    return Response(content=body, media_type="application/json", headers={**headers, **extra_headers})
+
+
+def _knowledge_hub_payload(rows: list, lang: str, model: type[BaseModel] = KnowledgeHubResponse) -> list:
+    return [model.model_validate(localize(row, lang)).model_dump(mode="json") for row in rows]
+
+
+@app.get("/api/knowledge-hub/", response_model=list[KnowledgeHubSummary] | list[KnowledgeHubResponse], tags=["knowledge-hub"])
 def get_knowledge_hub_items(
+    request: Request,
     lang: str = "en",
     life_stage_id: int | None = None,
     perspective_id: int | None = None,
@@ -736,55 +975,46 @@ def get_knowledge_hub_items(
     perspective: int | None = None,
     lifeStage: int | None = None,
     is_featured: bool | None = None,
-    perPage: int = 100,
-    search: str | None = None
+    perPage: int = 20,
+    search: str | None = None,
+    view: ListView = ListView.SUMMARY,
+    cursor: str | None = None,
 ):
-    """Get all knowledge hub items with language support and filtering"""
-    from supabase_client import supabase
-    query = supabase.table("sakhi_knowledge_hub").select("*")
-    
-    if search:
-        query = query.ilike("title", f"%{search}%")
-    
+    """
+    List knowledge hub items with language support and filtering.
+    Newest first; pass the X-Next-Cursor header back as `cursor` for the next page.
+    `view=detail` includes the full article content.
+    """
     ls_id = life_stage_id if life_stage_id is not None else (life_stage if life_stage is not None else lifeStage)
     p_id = perspective_id if perspective_id is not None else perspective
-    
-    if ls_id is not None:
-        query = query.eq("life_stage_id", ls_id)
-    if p_id is not None:
-        query = query.eq("perspective_id", p_id)
-    if is_featured is not None:
-        query = query.eq("is_featured", is_featured)
-        
-    import time
-    import httpx
-    
-    response = None
-    retries = 3
-    for i in range(retries):
-        try:
-            response = query.order("published_at", desc=True).limit(perPage).execute()
-            break
-        except Exception as e:
-            if i == retries - 1:
-                print(f"Failed to fetch knowledge hub items after {retries} attempts: {e}")
-                raise e
-            print(f"Attempt {i+1} failed: {e}. Retrying...")
-            time.sleep(0.5 * (i + 1))
-    
-    items = []
-    for item in response.data:
-        if lang == "te":
-            item["title"] = item.get("title_te") or item.get("title")
-            item["summary"] = item.get("summary_te") or item.get("summary")
-            item["content"] = item.get("content_te") or item.get("content")
-        items.append(KnowledgeHubResponse.model_validate(item))
-        
-    return items
+    page_size = clamp_page_size(perPage)
+    # Same shape as listing_key: (has published_at, published_at, id)
+    after = decode_cursor(cursor, of_type(bool), of_type(str), of_type(int))
+
+    params = ("list", lang, ls_id, p_id, is_featured, page_size, search, view.value, cursor)
+
+    def build():
+        rows = knowledge_hub.select(
+            life_stage_id=ls_id,
+            perspective_id=p_id,
+            is_featured=is_featured,
+            ids=search_index.match_ids(search, lang) if search else None,
+            limit=page_size + 1,
+            after=tuple(after) if after else None,
+        )
+        headers = {}
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(*listing_key(rows[-1]))
+        model = KnowledgeHubResponse if view == ListView.DETAIL else KnowledgeHubSummary
+        return _knowledge_hub_payload(rows, lang, model), headers
+
+    return _knowledge_hub_response(request, params, build)
 
 
 @app.get("/api/knowledge-hub/recommendations", response_model=list[KnowledgeHubResponse], tags=["knowledge-hub"])
 def get_knowledge_hub_recommendations(
+    request: Request,
     stage: str | None = None,
     lens: str | None = None,
     userId: str | None = None,
@@ -793,126 +1023,81 @@ def get_knowledge_hub_recommendations(
 ):
     """
     Get recommended knowledge hub items.
-    Priority:
-    1. Featured items matching stage and lens
-    2. Featured items matching stage only
-    3. Recent items matching stage
-    4. Any featured items
+    Items are ranked by one score combining stage match, featured flag,
+    lens match and recency (see modules/recommendations.py). If userId is
+    given, the user's journey stage personalizes the ranking.
     """
-    from supabase_client import supabase
-    import time
-    
-    # Map string stage/lens to IDs if necessary (assuming frontend sends names like 'ttc', 'medical')
-    # Or frontend can send IDs. Let's assume frontend sends IDs or we handle strings.
-    # For now, let's map common strings to IDs if the DB uses IDs.
-    # Based on previous context, DB uses IDs (1, 2, 3...)
-    
-    stage_map = {
-        'ttc': 1, 'pregnancy': 2, 'postpartum': 3, 'newborn': 4, 'early-years': 5,
-        'trying-to-conceive': 1, 'pregnant': 2, 'parent': 5 # simplified mapping
-    }
-    lens_map = {
-        'medical': 1, 'social': 2, 'nutrition': 3, 'financial': 4
-    }
-    
-    ls_id = None
-    if stage:
-        ls_id = stage_map.get(stage.lower(), None)
-        # If not in map, maybe it's already an ID (int)
-        if ls_id is None and stage.isdigit():
-            ls_id = int(stage)
-
-    p_id = None
-    if lens:
-        p_id = lens_map.get(lens.lower(), None)
-        if p_id is None and lens.isdigit():
-            p_id = int(lens)
-
-    items = []
-    seen_ids = set()
-
-    def fetch_and_add(query_base, limit_needed):
-        if limit_needed <= 0:
-            return
-        
-        # Add retry logic here as well
-        resp = None
-        for i in range(3):
-            try:
-                resp = query_base.limit(limit_needed).execute()
-                break
-            except Exception as e:
-                if i == 2: print(f"Rec fetch failed: {e}")
-                time.sleep(0.5)
-        
-        if resp and resp.data:
-            for item in resp.data:
-                if item['id'] not in seen_ids:
-                    if lang == "te":
-                        item["title"] = item.get("title_te") or item.get("title")
-                        item["summary"] = item.get("summary_te") or item.get("summary")
-                        item["content"] = item.get("content_te") or item.get("content")
-                    
-                    items.append(KnowledgeHubResponse.model_validate(item))
-                    seen_ids.add(item['id'])
-
-    # Strategy 1: Featured + Stage + Lens
-    if len(items) < limit and ls_id and p_id:
-        q = supabase.table("sakhi_knowledge_hub").select("*").eq("is_featured", True).eq("life_stage_id", ls_id).eq("perspective_id", p_id)
-        fetch_and_add(q, limit - len(items))
-
-    # Strategy 2: Featured + Stage
-    if len(items) < limit and ls_id:
-        q = supabase.table("sakhi_knowledge_hub").select("*").eq("is_featured", True).eq("life_stage_id", ls_id)
-        if p_id: q = q.neq("perspective_id", p_id) # Avoid dups if possible, though seen_ids handles it
-        fetch_and_add(q, limit - len(items))
-
-    # Strategy 3: Any Stage Match (Recent)
-    if len(items) < limit and ls_id:
-        q = supabase.table("sakhi_knowledge_hub").select("*").eq("life_stage_id", ls_id).order("published_at", desc=True)
-        fetch_and_add(q, limit - len(items))
-
-    # Strategy 4: Any Featured
-    if len(items) < limit:
-        q = supabase.table("sakhi_knowledge_hub").select("*").eq("is_featured", True).order("published_at", desc=True)
-        fetch_and_add(q, limit - len(items))
-        
-    # Strategy 5: Fallback to any recent
-    if len(items) < limit:
-        q = supabase.table("sakhi_knowledge_hub").select("*").order("published_at", desc=True)
-        fetch_and_add(q, limit - len(items))
+    ls_id = resolve_id(stage, STAGE_MAP)
+    p_id = resolve_id(lens, LENS_MAP)
+    user_stage_id = recommender.user_stage(userId)
+
+    params = ("recommendations", lang, ls_id, p_id, user_stage_id, limit)
+    return _knowledge_hub_response(
+        request, params,
+        lambda: (_knowledge_hub_payload(recommender.recommend(ls_id, p_id, user_stage_id, limit), lang), {}),
+    )
+
 
-    return items
+@app.get("/api/knowledge-hub/search", response_model=list[KnowledgeHubSearchHit], tags=["knowledge-hub"])
+def search_knowledge_hub(
+    request: Request,
+    q: str,
+    lang: str = "en",
+    limit: int = 10,
+    life_stage_id: int | None = None,
+    perspective_id: int | None = None,
+    semantic: bool = False,
+):
+    """
+    Full-text search over title, summary and content in the requested language.
+    semantic=true also ranks by embedding similarity (slower: embeds the query).
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    page_size = clamp_page_size(limit)
+
+    # Article vectors are built in the background: key semantic results by their version
+    vectors = search_index.semantic_version() if semantic else None
+    params = ("search", q, lang, page_size, life_stage_id, perspective_id, semantic, vectors)
+
+    def build():
+        allowed = None
+        if life_stage_id is not None or perspective_id is not None:
+            allowed = {row["id"] for row in knowledge_hub.select(life_stage_id=life_stage_id, perspective_id=perspective_id)}
+        terms = set(tokenize(q))
+        hits = []
+        for row, score in search_index.search(q, lang=lang, limit=page_size, semantic=semantic, allowed=allowed):
+            item = localize(row, lang)
+            hit = KnowledgeHubSummary.model_validate(item).model_dump(mode="json")
+            hit["score"] = round(score, 4)
+            hit["title_highlight"] = highlight(item.get("title") or "", terms)
+            hit["snippet"] = highlight(item.get("content") or item.get("summary") or "", terms, snippet=True)
+            hits.append(hit)
+        return hits, {}
+
+    return _knowledge_hub_response(request, params, build)
 
 
 @app.get("/api/knowledge-hub/{slug}", response_model=KnowledgeHubResponse, tags=["knowledge-hub"])
-def get_knowledge_hub_item_by_slug(slug: str, lang: str = "en"):
+def get_knowledge_hub_item_by_slug(request: Request, slug: str, lang: str = "en"):
     """Get a single knowledge hub item by slug with language support"""
-    from supabase_client import supabase
-    
-    import time
-    response = None
-    for i in range(3):
-        try:
-            response = supabase.table("sakhi_knowledge_hub").select("*").eq("slug", slug).limit(1).execute()
-            break
-        except Exception:
-            time.sleep(0.5)
-            
-    if not response or not response.data:
+    if not knowledge_hub.get_by_slug(slug):
         raise HTTPException(status_code=404, detail="Knowledge Hub item not found")
-    
-    item = response.data[0]
-    if lang == "te":
-        item["title"] = item.get("title_te") or item.get("title")
-        item["summary"] = item.get("summary_te") or item.get("summary")
-        item["content"] = item.get("content_te") or item.get("content")
-        
-    return KnowledgeHubResponse.model_validate(item)
+
+    def build():
+        # Looked up again in the snapshot the ETag came from
+        item = knowledge_hub.get_by_slug(slug)
+        if not item:
+            raise HTTPException(status_code=404, detail="Knowledge Hub item not found")
+        return KnowledgeHubResponse.model_validate(localize(item, lang)).model_dump(mode="json"), {}
+
+    return _knowledge_hub_response(request, ("item", lang, slug), build)
 
 
 # ================== SUCCESS STORIES ROUTES ==================
 STORIES_TABLE = "sakhi_success_stories"
+# Page size when a cursor is given without a limit
+DEFAULT_STORIES_PAGE_SIZE = 20
 
 
 @app.post("/stories/draft", status_code=status.HTTP_201_CREATED, tags=["stories"])
@@ -920,7 +1105,7 @@ STORIES_TABLE = "sakhi_success_stories"
 async def create_story_draft(story_in: StoryCreate):
     """Create a new story draft"""
     from supabase_client import supabase
-    from modules.story_generator import process_new_story
+    from modules.story_generator import fallback_narrative
 
     data = story_in.model_dump()
     
@@ -978,13 +1163,24 @@ async def create_story_draft(story_in: StoryCreate):
     for key in non_db_fields:
         if key in data:
             del data[key]
+
+    # Serve the rule-based narrative until the LLM version is ready
+    fallback = fallback_narrative(data)
+    data["summary"] = data.get("summary") or fallback["short"]
+    data["generated_story"] = data.get("generated_story") or fallback["long"]
     
-    response = supabase.table(STORIES_TABLE).insert(data).execute()
+    response = await get_resilience().acall(
+        STORIES_TABLE,
+        client_attempt(lambda: supabase.table(STORIES_TABLE).insert(data).execute()),
+        pool="client",
+        idempotent=False,
+    )
     
     if response.data:
-        # Generate narrative immediately
-        updated_story = await process_new_story(response.data[0]['id'], response.data[0])
-        story_response = StoryResponse.model_validate(updated_story)
+        # Generate the LLM narrative in the background
+        story_row = response.data[0]
+        generation_status = story_jobs.enqueue(story_row["id"], story_row)
+        story_response = StoryResponse.model_validate({**story_row, "generation_status": generation_status})
         return {"message": "Story saved", "data": story_response.model_dump()}
         
     story_response = StoryResponse.model_validate(response.data[0])
@@ -995,35 +1191,91 @@ async def create_story_draft(story_in: StoryCreate):
 async def record_consent(consent_in: StoryConsent):
     """Record user consent for a story"""
     from supabase_client import supabase
-    response = supabase.table(STORIES_TABLE).update({"consent": True}).eq("id", str(consent_in.id)).execute()
+    response = await get_resilience().acall(
+        STORIES_TABLE,
+        client_attempt(lambda: supabase.table(STORIES_TABLE).update({"consent": True}).eq("id", str(consent_in.id)).execute()),
+        pool="client",
+    )
     if not response.data:
         raise HTTPException(status_code=404, detail="Story not found")
     return StoryResponse.model_validate(response.data[0])
 
 
-@app.get("/stories/", response_model=list[StoryResponse], tags=["stories"])
-async def get_published_stories():
-    """Get all published stories"""
+@app.get("/stories/", response_model=list[StorySummary] | list[StoryResponse], tags=["stories"])
+async def get_published_stories(
+    view: ListView = ListView.DETAIL,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    """
+    Get published stories, newest first.
+    By default every story is returned in full, as before. Pass `limit` (or a
+    `cursor`) to page: the X-Next-Cursor header carries the next page's cursor.
+    `view=summary` returns card fields only.
+    """
     from supabase_client import supabase
-    response = supabase.table(STORIES_TABLE).select("*").eq("status", "published").order("created_at", desc=True).execute()
-    return [StoryResponse.model_validate(item) for item in response.data]
+    page_size = clamp_page_size(limit or DEFAULT_STORIES_PAGE_SIZE) if limit is not None or cursor else None
+    # Validated before it goes into the PostgREST filter below
+    after = decode_cursor(cursor, timestamp, row_id)
+
+    columns = "*" if view == ListView.DETAIL else STORY_SUMMARY_COLUMNS
+    query = supabase.table(STORIES_TABLE).select(columns).eq("status", "published")
+    if after:
+        created_at, last_id = after
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})')
+    query = query.order("created_at", desc=True).order("id", desc=True)
+    if page_size is not None:
+        query = query.limit(page_size + 1)
+    rows = (await get_resilience().acall(STORIES_TABLE, client_attempt(query.execute), pool="client", idempotent=True)).data or []
+
+    headers = {}
+    if page_size is not None and len(rows) > page_size:
+        rows = rows[:page_size]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    model = StoryResponse if view == ListView.DETAIL else StorySummary
+    return JSONResponse(content=[model.model_validate(item).model_dump(mode="json") for item in rows], headers=headers)
 
 
 @app.get("/stories/{id}", response_model=StoryResponse, tags=["stories"])
 async def get_story_by_id(id: UUID):
     """Get a story by ID"""
     from supabase_client import supabase
-    response = supabase.table(STORIES_TABLE).select("*").eq("id", str(id)).execute()
+    response = await get_resilience().acall(
+        STORIES_TABLE,
+        client_attempt(lambda: supabase.table(STORIES_TABLE).select("*").eq("id", str(id)).execute()),
+        pool="client",
+        idempotent=True,
+    )
     if not response.data:
         raise HTTPException(status_code=404, detail="Story not found")
-    return StoryResponse.model_validate(response.data[0])
+    return StoryResponse.model_validate({**response.data[0], "generation_status": story_jobs.status_of(id)})
+
+
+@app.get("/stories/{id}/generation", tags=["stories"])
+async def get_story_generation_status(id: UUID):
+    """Poll narrative generation for a story draft"""
+    job = story_jobs.get_job(id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No narrative generation job for this story")
+    return {
+        "story_id": job["story_id"],
+        "generation_status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "updated_at": datetime.fromtimestamp(job["updated_at"]).isoformat(),
+    }
 
 
 @app.put("/stories/{id}/status", response_model=StoryResponse, tags=["stories"])
 async def update_story_status(id: UUID, status_in: StoryUpdateStatus):
     """Update story status"""
     from supabase_client import supabase
-    response = supabase.table(STORIES_TABLE).update({"status": status_in.status}).eq("id", str(id)).execute()
+    response = await get_resilience().acall(
+        STORIES_TABLE,
+        client_attempt(lambda: supabase.table(STORIES_TABLE).update({"status": status_in.status}).eq("id", str(id)).execute()),
+        pool="client",
+    )
     if not response.data:
         raise HTTPException(status_code=404, detail="Story not found")
     return StoryResponse.model_validate(response.data[0])
@@ -0,0 +1,89 @@
+# modules/compression.py
+"""
+Response compression middleware (brotli when available, gzip otherwise).
+
+gzip is delegated to Starlette's GZipMiddleware. Brotli needs the optional
+`brotli` package; without it, clients that accept br simply get gzip.
+Brotli is only applied to complete (non-streaming) bodies.
+"""
+import logging
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are sent as-is (compression overhead dominates)
+MINIMUM_SIZE = 1024
+BROTLI_QUALITY = 5  # good ratio at JSON-API latency
+GZIP_LEVEL = 6
+
+
+class CompressionMiddleware:
+    """
+    Negotiates Content-Encoding from Accept-Encoding: br > gzip > identity.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and "br" in accept:
+            await _BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+
+class _BrotliResponder:
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_brotli)
+
+    async def send_with_brotli(self, message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until we know whether the body is compressible
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers
+            return
+
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self.send(message)
+            return
+
+        start, self.start_message = self.start_message, None
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough or more_body or len(body) < self.minimum_size:
+            await self.send(start)
+            await self.send(message)
+            return
+
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        headers = MutableHeaders(raw=start["headers"])
+        headers["Content-Encoding"] = "br"
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,344 @@
+# modules/kb_ingestion.py
+"""
+Incremental, batched ingestion of documents into `section_chunks`.
+
+Documents (markdown or plain text) are split on headings into chunks that
+carry their `header_path` ("Doc title > Section > Subsection"), long sections
+are split further on paragraph boundaries. Chunks are identified by a content
+hash (sha256 of source + header_path + normalized text), which makes ingestion
+idempotent:
+
+- identical text repeated within a flush is embedded once,
+- chunks already stored (same hash) are skipped without an embeddings call,
+- new chunks are embedded in batches of up to 2048 inputs and bulk-upserted.
+
+Work is flushed in batches as documents stream in. After every flush a JSON
+checkpoint records which documents (by source and document hash) are done,
+so an interrupted run restarts where it stopped, and unchanged documents are
+skipped without touching the network. With prune=True, chunks of a
+re-ingested document that no longer exist in it are deleted. The source is
+part of the hash, so two documents never share a row and pruning one cannot
+remove a chunk the other still contains. A checkpoint written under an older
+hash scheme is discarded, so every document is re-ingested once (run that
+pass with --prune to remove the rows stored under the old hashes).
+
+Expected columns on section_chunks (besides id/header_path/section_content/
+embedding): `content_hash text unique` and `source text`.
+
+Command line:
+
+    python -m modules.kb_ingestion docs/ extra.md [--checkpoint .kb_ingest.json] [--prune] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from supabase_client import supabase_delete, supabase_select, supabase_upsert
+from modules.openai_client import Priority
+from modules.rag_search import EMBED_MAX_INPUTS, embed_texts
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SECTION_CHUNKS_TABLE = os.getenv("SECTION_CHUNKS_TABLE", "section_chunks")
+# Longest chunk, in characters (~400 tokens)
+CHUNK_MAX_CHARS = int(os.getenv("KB_CHUNK_MAX_CHARS", "1600"))
+# Pending chunks that trigger a flush
+FLUSH_CHUNKS = EMBED_MAX_INPUTS
+# Rows per upsert request, hashes per existence lookup
+UPSERT_BATCH = 500
+LOOKUP_BATCH = 100
+HEADER_SEPARATOR = " > "
+DOCUMENT_EXTENSIONS = (".md", ".markdown", ".txt")
+
+# Bump when content_hash changes: older checkpoints are discarded
+HASH_VERSION = 2
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def content_hash(source: str, header_path: str, content: str) -> str:
+    return hashlib.sha256(f"{source}\n{header_path}\n{_normalize(content)}".encode("utf-8")).hexdigest()
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Pack paragraphs into pieces of at most max_chars (hard-splitting huge ones)."""
+    pieces: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            pieces.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_document(text: str, title: Optional[str] = None, max_chars: int = CHUNK_MAX_CHARS) -> List[Dict[str, str]]:
+    """
+    Split a markdown/plain-text document into {"header_path", "section_content"}
+    chunks following its heading hierarchy.
+    """
+    chunks: List[Dict[str, str]] = []
+    headers: List[str] = []
+    body: List[str] = []
+
+    def emit() -> None:
+        section = "\n".join(body).strip()
+        body.clear()
+        if not section:
+            return
+        header_path = HEADER_SEPARATOR.join([h for h in [title, *headers] if h]) or "Document"
+        for piece in _split_long(section, max_chars):
+            chunks.append({"header_path": header_path, "section_content": piece})
+
+    for line in (text or "").splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            emit()
+            level = len(match.group(1))
+            del headers[level - 1:]
+            headers.extend([""] * (level - 1 - len(headers)))
+            headers.append(match.group(2).strip())
+        else:
+            body.append(line)
+    emit()
+    return chunks
+
+
+class _Checkpoint:
+    """Completed documents (source -> document hash) plus running totals, stored as JSON."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.documents: Dict[str, str] = {}
+        self.totals: Dict[str, float] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("hash_version") != HASH_VERSION:
+                logger.info(f"Checkpoint {path} uses an older chunk hash; re-ingesting every document")
+                return
+            self.documents = data.get("documents", {})
+            self.totals = data.get("totals", {})
+            logger.info(f"Resuming from checkpoint {path}: {len(self.documents)} documents done")
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"hash_version": HASH_VERSION, "documents": self.documents, "totals": self.totals}, f)
+        os.replace(tmp, self.path)
+
+
+class KBIngestionPipeline:
+    """
+    Streams documents into section_chunks in embedding-sized batches.
+    """
+
+    def __init__(
+        self,
+        checkpoint_path: Optional[str] = None,
+        prune: bool = False,
+        dry_run: bool = False,
+        table: str = SECTION_CHUNKS_TABLE,
+    ):
+        self.table = table
+        self.prune = prune
+        self.dry_run = dry_run
+        self.checkpoint = _Checkpoint(checkpoint_path)
+        self._pending_docs: List[Dict[str, Any]] = []
+        self._pending_chunks = 0
+        self.stats = {
+            "documents": 0,
+            "documents_unchanged": 0,
+            "chunks": 0,
+            "duplicates": 0,
+            "already_stored": 0,
+            "embedded": 0,
+            "upserted": 0,
+            "pruned": 0,
+            "embed_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+        self._reported: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    # ------------------------------------------------------------------
+    # Input
+    # ------------------------------------------------------------------
+    def add(self, source: str, text: str, title: Optional[str] = None) -> None:
+        """Queue one document; flushes when enough chunks are pending."""
+        doc_hash = hashlib.sha256(f"{title or ''}\n{text}".encode("utf-8")).hexdigest()
+        if self.checkpoint.documents.get(source) == doc_hash:
+            self.stats["documents_unchanged"] += 1
+            return
+        chunks = chunk_document(text, title=title)
+        for chunk in chunks:
+            chunk["source"] = source
+            chunk["content_hash"] = content_hash(source, chunk["header_path"], chunk["section_content"])
+        self._pending_docs.append({"source": source, "hash": doc_hash, "chunks": chunks})
+        self._pending_chunks += len(chunks)
+        if self._pending_chunks >= FLUSH_CHUNKS:
+            self.flush()
+
+    def ingest(self, documents: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Ingest {"source", "text", "title"?} documents and return the throughput report.
+        """
+        for doc in documents:
+            self.add(doc["source"], doc.get("text") or "", doc.get("title"))
+        self.flush()
+        return self.report()
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+    def _stored_hashes(self, hashes: List[str]) -> set:
+        stored = set()
+        for start in range(0, len(hashes), LOOKUP_BATCH):
+            group = hashes[start:start + LOOKUP_BATCH]
+            rows = supabase_select(self.table, select="content_hash", filters=f"content_hash=in.({','.join(group)})")
+            stored.update(row["content_hash"] for row in rows or [])
+        return stored
+
+    def flush(self) -> None:
+        if not self._pending_docs:
+            return
+        docs, self._pending_docs, self._pending_chunks = self._pending_docs, [], 0
+
+        unique: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            for chunk in doc["chunks"]:
+                self.stats["chunks"] += 1
+                if chunk["content_hash"] in unique:
+                    self.stats["duplicates"] += 1
+                else:
+                    unique[chunk["content_hash"]] = chunk
+
+        if not self.dry_run:
+            stored = self._stored_hashes(list(unique))
+            self.stats["already_stored"] += len(stored)
+            new_chunks = [chunk for h, chunk in unique.items() if h not in stored]
+
+            # Documents sharing a chunk get a row each, but one embedding
+            texts = [f"{c['header_path']}\n{c['section_content']}" for c in new_chunks]
+            distinct = list(dict.fromkeys(texts))
+            started = time.perf_counter()
+            embeddings = embed_texts(distinct, priority=Priority.BACKGROUND) if distinct else []
+            self.stats["embed_seconds"] += time.perf_counter() - started
+            self.stats["embedded"] += len(embeddings)
+            by_text = dict(zip(distinct, embeddings))
+
+            started = time.perf_counter()
+            rows = [dict(chunk, embedding=by_text[text]) for chunk, text in zip(new_chunks, texts)]
+            for start in range(0, len(rows), UPSERT_BATCH):
+                supabase_upsert(self.table, rows[start:start + UPSERT_BATCH], on_conflict="content_hash")
+                self.stats["upserted"] += len(rows[start:start + UPSERT_BATCH])
+            if self.prune:
+                for doc in docs:
+                    self._prune(doc)
+            self.stats["write_seconds"] += time.perf_counter() - started
+
+        for doc in docs:
+            self.checkpoint.documents[doc["source"]] = doc["hash"]
+        self.stats["documents"] += len(docs)
+        self.checkpoint.totals = {
+            key: self.checkpoint.totals.get(key, 0) + value
+            for key, value in self._flush_deltas().items()
+        }
+        if not self.dry_run:
+            self.checkpoint.save()
+
+        report = self.report()
+        logger.info(
+            f"KB ingestion: {report['documents']} docs, {report['chunks']} chunks "
+            f"({report['embedded']} embedded, {report['already_stored']} already stored), "
+            f"{report['chunks_per_second']} chunks/s"
+        )
+
+    def _flush_deltas(self) -> Dict[str, float]:
+        # Totals across restarts: only add what this flush contributed
+        deltas = {key: value - self._reported.get(key, 0) for key, value in self.stats.items()}
+        self._reported = dict(self.stats)
+        return deltas
+
+    def _prune(self, doc: Dict[str, Any]) -> None:
+        """Delete chunks of this source whose hash is no longer in the document."""
+        keep = sorted({chunk["content_hash"] for chunk in doc["chunks"]})
+        match = f"source=eq.{quote(doc['source'], safe='')}"
+        if keep:
+            match += f"&content_hash=not.in.({','.join(keep)})"
+        deleted = supabase_delete(self.table, match)
+        self.stats["pruned"] += len(deleted or [])
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()},
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.stats["chunks"] / elapsed, 1) if elapsed else 0.0,
+            "embeddings_per_second": (
+                round(self.stats["embedded"] / self.stats["embed_seconds"], 1) if self.stats["embed_seconds"] else 0.0
+            ),
+        }
+
+
+def _iter_files(paths: List[str]) -> Iterable[Dict[str, Any]]:
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _dirs, names in os.walk(path)
+                for name in names
+                if name.lower().endswith(DOCUMENT_EXTENSIONS)
+            )
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, encoding="utf-8") as f:
+                text = f.read()
+            title = os.path.splitext(os.path.basename(file_path))[0].replace("_", " ").replace("-", " ").strip()
+            yield {"source": os.path.relpath(file_path), "text": text, "title": title}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest documents into section_chunks.")
+    parser.add_argument("paths", nargs="+", help="files or directories (.md, .markdown, .txt)")
+    parser.add_argument("--checkpoint", default=".kb_ingest.json", help="resume file ('' to disable)")
+    parser.add_argument("--prune", action="store_true", help="delete chunks removed from re-ingested documents")
+    parser.add_argument("--dry-run", action="store_true", help="chunk and count only; no API or database calls")
+    args = parser.parse_args()
+
+    pipeline = KBIngestionPipeline(checkpoint_path=args.checkpoint or None, prune=args.prune, dry_run=args.dry_run)
+    print(json.dumps(pipeline.ingest(_iter_files(args.paths)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
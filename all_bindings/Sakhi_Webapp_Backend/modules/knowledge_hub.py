@@ -0,0 +1,330 @@
+# modules/knowledge_hub.py
+"""
+Read-through cache for the Knowledge Hub (`sakhi_knowledge_hub`).
+
+The table is small and changes rarely, but every page view used to query it
+live (select * including both languages' content), with sleep-based retries.
+This cache keeps the whole table in memory:
+
+- Loaded once, then refreshed incrementally: rows with `updated_at` at or
+  after the newest one seen are re-fetched every KNOWLEDGE_HUB_REFRESH_SECONDS.
+  A full reload runs every KNOWLEDGE_HUB_FULL_RELOAD_SECONDS to drop deleted rows.
+- Indexed by slug, life_stage_id, perspective_id and is_featured, with one
+  pre-sorted (published_at desc) id list, so filters are set lookups.
+- Every dataset version gets a content tag. Responses derived from it carry a
+  strong ETag (dataset tag + request parameters) and their rendered JSON is
+  memoized, so repeat requests are served without touching the database.
+- Rows, indexes and the tag form one immutable snapshot, built off to the
+  side and swapped in with a single assignment. A response pins the snapshot
+  its ETag came from, so its body is rendered from that same version even if
+  a refresh lands meanwhile.
+- If a refresh fails, the last good snapshot keeps being served.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from supabase_client import supabase
+from resilience import get_resilience, client_attempt
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_HUB_TABLE = "sakhi_knowledge_hub"
+REFRESH_SECONDS = float(os.getenv("KNOWLEDGE_HUB_REFRESH_SECONDS", "60"))
+FULL_RELOAD_SECONDS = float(os.getenv("KNOWLEDGE_HUB_FULL_RELOAD_SECONDS", "3600"))
+# Rows per request when loading the full table
+PAGE_SIZE = 1000
+# Rendered responses kept per dataset version
+MAX_RENDERED_RESPONSES = 512
+
+# Fields replaced by their *_te variant for Telugu readers
+LOCALIZED_FIELDS = ("title", "summary", "content")
+
+
+def localize(item: Dict[str, Any], lang: str) -> Dict[str, Any]:
+    """Return a copy of a row with title/summary/content in the requested language."""
+    item = dict(item)
+    if lang == "te":
+        for field in LOCALIZED_FIELDS:
+            item[field] = item.get(f"{field}_te") or item.get(field)
+    return item
+
+
+def listing_key(item: Dict[str, Any]) -> Tuple[bool, str, int]:
+    """
+    Sort key of list views (sorted descending): newest published first,
+    undated rows last, id as tie-breaker. Also the pagination cursor.
+    """
+    published = item.get("published_at")
+    return (published is not None, published or "", item["id"])
+
+
+class Snapshot:
+    """One version of the table with its indexes. Never mutated once published."""
+
+    __slots__ = (
+        "rows", "by_slug", "by_life_stage", "by_perspective", "featured",
+        "ordered_ids", "version_tag", "high_water", "rendered",
+    )
+
+    def __init__(self, rows: Dict[int, Dict[str, Any]]):
+        by_slug: Dict[str, int] = {}
+        by_life_stage: Dict[Any, Set[int]] = {}
+        by_perspective: Dict[Any, Set[int]] = {}
+        featured: Set[int] = set()
+        for item_id, row in rows.items():
+            if row.get("slug"):
+                by_slug[row["slug"]] = item_id
+            by_life_stage.setdefault(row.get("life_stage_id"), set()).add(item_id)
+            by_perspective.setdefault(row.get("perspective_id"), set()).add(item_id)
+            if row.get("is_featured"):
+                featured.add(item_id)
+
+        fingerprint = hashlib.sha256()
+        for row in sorted(rows.values(), key=lambda r: r["id"]):
+            fingerprint.update(f"{row['id']}|{row.get('updated_at')}|".encode("utf-8"))
+
+        self.rows = rows
+        self.by_slug = by_slug
+        self.by_life_stage = by_life_stage
+        self.by_perspective = by_perspective
+        self.featured = frozenset(featured)
+        self.ordered_ids = tuple(row["id"] for row in sorted(rows.values(), key=listing_key, reverse=True))
+        self.version_tag = fingerprint.hexdigest()[:16] if rows else ""
+        self.high_water = max((r.get("updated_at") for r in rows.values() if r.get("updated_at")), default=None)
+        # Responses rendered from this version (the only mutable part, guarded by the cache)
+        self.rendered: "OrderedDict[str, Tuple[bytes, Dict[str, str]]]" = OrderedDict()
+
+
+class KnowledgeHubCache:
+    """
+    In-memory, incrementally refreshed copy of the Knowledge Hub table.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, full_reload_seconds: float = FULL_RELOAD_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+
+        self._snapshot = Snapshot({})
+        # Set while a response is rendered, so every read in it sees one version
+        self._pinned: contextvars.ContextVar = contextvars.ContextVar(f"knowledge_hub_{id(self)}", default=None)
+
+        self._checked_at = 0.0
+        self._full_loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._render_lock = threading.Lock()
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def _fetch_all(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = supabase.table(KNOWLEDGE_HUB_TABLE).select("*").order("id").range(start, start + PAGE_SIZE - 1)
+            resp = get_resilience().call(KNOWLEDGE_HUB_TABLE, client_attempt(query.execute), pool="client", idempotent=True)
+            batch = resp.data or []
+            rows.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def _fetch_changed(self) -> List[Dict[str, Any]]:
+        # gte, not gt: rows sharing the high-water timestamp must not be missed
+        query = supabase.table(KNOWLEDGE_HUB_TABLE).select("*").gte("updated_at", self._snapshot.high_water)
+        resp = get_resilience().call(KNOWLEDGE_HUB_TABLE, client_attempt(query.execute), pool="client", idempotent=True)
+        return resp.data or []
+
+    def refresh(self, force_full: bool = False) -> None:
+        """Pull changes from Supabase (full reload on first use or when due)."""
+        now = time.monotonic()
+        current = self._snapshot
+        full = force_full or not self._full_loaded_at or current.high_water is None \
+            or now - self._full_loaded_at >= self.full_reload_seconds
+        if full:
+            rows = self._fetch_all()
+            self._snapshot = Snapshot({row["id"]: row for row in rows})
+            self._full_loaded_at = now
+            logger.info(f"Knowledge Hub cache loaded ({len(rows)} items, tag {self._snapshot.version_tag})")
+        else:
+            changed = [row for row in self._fetch_changed() if current.rows.get(row["id"]) != row]
+            if changed:
+                rows = dict(current.rows)
+                for row in changed:
+                    rows[row["id"]] = row
+                self._snapshot = Snapshot(rows)
+                logger.info(f"Knowledge Hub cache updated ({len(changed)} changed, tag {self._snapshot.version_tag})")
+        self._checked_at = now
+        self.refreshes += 1
+
+    def ensure_fresh(self) -> None:
+        """Read-through: refresh if stale. Serves the last snapshot if Supabase fails."""
+        if time.monotonic() - self._checked_at < self.refresh_seconds and self._full_loaded_at:
+            return
+        # Only one thread refreshes; the others keep serving the current snapshot
+        if not self._refresh_lock.acquire(blocking=not self._full_loaded_at):
+            return
+        try:
+            if time.monotonic() - self._checked_at < self.refresh_seconds and self._full_loaded_at:
+                return
+            self.refresh()
+        except Exception as e:
+            self.refresh_failures += 1
+            # Back off until the next interval instead of hammering a failing DB
+            self._checked_at = time.monotonic()
+            if not self._full_loaded_at:
+                raise
+            logger.warning(f"Knowledge Hub refresh failed, serving cached snapshot: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def snapshot(self) -> Snapshot:
+        """The snapshot reads should use: the pinned one while rendering, else the latest."""
+        pinned = self._pinned.get()
+        if pinned is not None:
+            return pinned
+        self.ensure_fresh()
+        return self._snapshot
+
+    @property
+    def version_tag(self) -> str:
+        return self.snapshot().version_tag
+
+    def select(
+        self,
+        life_stage_id: Optional[int] = None,
+        perspective_id: Optional[int] = None,
+        is_featured: Optional[bool] = None,
+        ids: Optional[Set[int]] = None,
+        limit: Optional[int] = None,
+        after: Optional[Tuple] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows matching all filters, newest published first.
+        `ids` restricts the result to those article ids.
+        `after` is a listing_key: only rows that sort after it are returned.
+        """
+        snap = self.snapshot()
+        if ids is not None:
+            ids = set(ids)
+
+        def narrow(candidates: Set[int]) -> None:
+            nonlocal ids
+            ids = set(candidates) if ids is None else ids & candidates
+
+        if life_stage_id is not None:
+            narrow(snap.by_life_stage.get(life_stage_id, set()))
+        if perspective_id is not None:
+            narrow(snap.by_perspective.get(perspective_id, set()))
+        if is_featured is not None:
+            narrow(snap.featured if is_featured else set(snap.rows) - snap.featured)
+
+        results = []
+        for item_id in snap.ordered_ids:
+            if ids is not None and item_id not in ids:
+                continue
+            row = snap.rows[item_id]
+            if after is not None and listing_key(row) >= after:
+                continue
+            results.append(row)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def get_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        snap = self.snapshot()
+        item_id = snap.by_slug.get(slug)
+        return snap.rows.get(item_id) if item_id is not None else None
+
+    # ------------------------------------------------------------------
+    # ETags and rendered responses
+    # ------------------------------------------------------------------
+    @staticmethod
+    def etag(snapshot: Snapshot, *params: Any) -> str:
+        """Strong ETag for a response built from `snapshot` and `params`."""
+        digest = hashlib.sha256(json.dumps(params, default=str).encode("utf-8")).hexdigest()[:16]
+        return f'"{snapshot.version_tag}-{digest}"'
+
+    def render(
+        self, snapshot: Snapshot, etag: str, build: Callable[[], Tuple[Any, Dict[str, str]]]
+    ) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Rendered JSON body and extra headers for `etag`, built once per dataset version.
+        `build` returns (payload, headers); every cache read inside it sees `snapshot`.
+        """
+        with self._render_lock:
+            rendered = snapshot.rendered.get(etag)
+            if rendered is not None:
+                snapshot.rendered.move_to_end(etag)
+                return rendered
+
+        token = self._pinned.set(snapshot)
+        try:
+            payload, headers = build()
+        finally:
+            self._pinned.reset(token)
+        body = json.dumps(payload, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        rendered = (body, headers)
+        with self._render_lock:
+            snapshot.rendered[etag] = rendered
+            while len(snapshot.rendered) > MAX_RENDERED_RESPONSES:
+                snapshot.rendered.popitem(last=False)
+        return rendered
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            "items": len(snap.rows),
+            "version_tag": snap.version_tag,
+            "high_water_updated_at": snap.high_water,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "rendered_responses": len(snap.rendered),
+        }
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def if_none_match(header: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches `etag`."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in header.split(","))
+
+
+# Module-level singleton instance
+_cache_instance = None
+
+
+def get_knowledge_hub_cache() -> KnowledgeHubCache:
+    """
+    Get or create a singleton KnowledgeHubCache instance.
+
+    Returns:
+        KnowledgeHubCache instance
+    """
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = KnowledgeHubCache()
+    return _cache_instance
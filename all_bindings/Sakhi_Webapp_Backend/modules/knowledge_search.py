@@ -0,0 +1,398 @@
+# modules/knowledge_search.py
+"""
+Full-text (BM25) and optional semantic search over Knowledge Hub articles.
+
+An inverted index is kept per language: English over title/summary/content,
+Telugu over title_te/summary_te/content_te (falling back to English when a
+translation is missing, as the read API does). Fields are weighted
+(title > summary > content) in a BM25F-style score.
+
+The index follows the Knowledge Hub cache: when the snapshot changes, only
+articles whose `updated_at` moved are re-tokenized, and deleted ones are dropped.
+
+A query made only of stopwords ("how to", "what is") has no terms to score, so
+it falls back to a case-insensitive match on the title, as the list filter did
+before the index existed.
+
+With semantic=True the query is also embedded, and the two rankings are merged
+with reciprocal-rank fusion. Article embeddings (title + summary) are computed
+in batches on a background thread, only for changed articles, and only once
+semantic search is first used; until they are ready, semantic queries rank by
+BM25 alone. Plain BM25 queries never touch the network.
+
+Postings are only read and written under the index lock. Article vectors are
+published as an immutable (ids, matrix) pair, so a query reads them without
+locking while the embedder replaces them.
+"""
+import heapq
+import html
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from modules.knowledge_hub import KnowledgeHubCache
+from modules.openai_client import get_openai
+from modules.rag_search import EMBEDDING_MODEL
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ("en", "te")
+FIELD_WEIGHTS = {"title": 3.0, "summary": 2.0, "content": 1.0}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal-rank fusion constant
+RRF_K = 60
+# Candidates taken from each ranking before fusion
+FUSION_DEPTH = 50
+# Texts per embeddings request
+EMBED_BATCH_SIZE = 256
+
+SNIPPET_CHARS = 180
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+# Latin word characters plus the Telugu block (vowel signs are not matched by \w)
+_TOKEN_RE = re.compile(r"[\w\u0C00-\u0C7F]+", re.UNICODE)
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is", "it",
+    "my", "of", "on", "or", "the", "to", "what", "when", "with", "you", "your",
+}
+
+
+def _normalize(token: str) -> str:
+    token = token.lower()
+    # Light plural folding for English ("cycles" -> "cycle")
+    if token.isascii() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [
+        term for term in (_normalize(t) for t in _TOKEN_RE.findall(text))
+        if term not in _STOPWORDS
+    ]
+
+
+def _field_text(row: Dict[str, Any], field: str, lang: str) -> str:
+    if lang == "te":
+        return row.get(f"{field}_te") or row.get(field) or ""
+    return row.get(field) or ""
+
+
+def highlight(text: str, terms: Set[str], snippet: bool = False) -> str:
+    """
+    HTML-escape `text` and wrap query terms in <mark>. With snippet=True, return
+    a window of about SNIPPET_CHARS around the first match.
+    """
+    if not text:
+        return ""
+    matches = [m for m in _TOKEN_RE.finditer(text) if _normalize(m.group()) in terms]
+
+    start, end = 0, len(text)
+    if snippet:
+        anchor = matches[0].start() if matches else 0
+        start = max(0, anchor - SNIPPET_CHARS // 3)
+        end = min(len(text), start + SNIPPET_CHARS)
+        # Do not cut words at the window edges
+        if start > 0:
+            space = text.find(" ", start)
+            start = space + 1 if 0 <= space < anchor else start
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            end = space if space > start else end
+
+    parts = []
+    cursor = start
+    for m in matches:
+        if m.start() < start or m.end() > end:
+            continue
+        parts.append(html.escape(text[cursor:m.start()]))
+        parts.append(f"{HIGHLIGHT_OPEN}{html.escape(m.group())}{HIGHLIGHT_CLOSE}")
+        cursor = m.end()
+    parts.append(html.escape(text[cursor:end]))
+
+    out = "".join(parts)
+    if snippet:
+        out = ("… " if start > 0 else "") + out + (" …" if end < len(text) else "")
+    return out
+
+
+class _InvertedIndex:
+    """BM25F postings for one language."""
+
+    def __init__(self, lang: str):
+        self.lang = lang
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.doc_terms: Dict[int, Counter] = {}
+        self.doc_lengths: Dict[int, float] = {}
+        self.total_length = 0.0
+
+    def remove(self, doc_id: int) -> None:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0.0)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        doc_id = row["id"]
+        self.remove(doc_id)
+        weighted: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(_field_text(row, field, self.lang)):
+                weighted[term] += weight
+        self.doc_terms[doc_id] = weighted
+        length = sum(weighted.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        for term, tf in weighted.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def search(self, terms: Iterable[str], allowed: Optional[Set[int]] = None) -> Dict[int, float]:
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return {}
+        avg_length = self.total_length / n_docs or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+class KnowledgeHubSearchIndex:
+    """
+    Incrementally maintained BM25 (+ optional embedding) index over the Knowledge Hub.
+    """
+
+    def __init__(self, cache: KnowledgeHubCache):
+        self.cache = cache
+        self._indexes = {lang: _InvertedIndex(lang) for lang in LANGUAGES}
+        self._indexed_versions: Dict[int, Any] = {}
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._synced_tag: Optional[str] = None
+        self._lock = threading.Lock()
+
+        self._semantic_enabled = False
+        self._embedding = False
+        self._embeddings: Dict[int, Tuple[Any, np.ndarray]] = {}
+        self._vectors: Tuple[Tuple[int, ...], Optional[np.ndarray]] = ((), None)
+        # Bumped on every publish; semantic responses are cached per version
+        self._vectors_version = 0
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+    def sync(self) -> None:
+        """Bring the index up to date with the cache snapshot."""
+        self.cache.ensure_fresh()
+        if self.cache.version_tag == self._synced_tag:
+            return
+        with self._lock:
+            if self.cache.version_tag == self._synced_tag:
+                return
+            current = {row["id"]: row for row in self.cache.select()}
+            changed = [row for doc_id, row in current.items() if self._indexed_versions.get(doc_id) != row.get("updated_at")]
+            removed = [doc_id for doc_id in self._indexed_versions if doc_id not in current]
+
+            for doc_id in removed:
+                for index in self._indexes.values():
+                    index.remove(doc_id)
+                self._indexed_versions.pop(doc_id, None)
+                self._embeddings.pop(doc_id, None)
+            if removed:
+                self._publish_vectors()
+            for row in changed:
+                for index in self._indexes.values():
+                    index.add(row)
+                self._indexed_versions[row["id"]] = row.get("updated_at")
+
+            self._rows = current
+            self._synced_tag = self.cache.version_tag
+            if changed or removed:
+                logger.info(f"Knowledge Hub search index: {len(changed)} (re)indexed, {len(removed)} removed")
+
+        if self._semantic_enabled:
+            self._schedule_embedding()
+
+    def _publish_vectors(self) -> None:
+        """Replace the (ids, matrix) pair read by semantic queries. Caller holds the lock."""
+        ids = tuple(self._embeddings)
+        matrix = np.stack([self._embeddings[doc_id][1] for doc_id in ids]) if ids else None
+        self._vectors = (ids, matrix)
+        self._vectors_version += 1
+
+    def _stale_rows(self) -> List[Dict[str, Any]]:
+        return [row for row in self._rows.values() if self._embeddings.get(row["id"], (None,))[0] != row.get("updated_at")]
+
+    def _schedule_embedding(self) -> None:
+        """Start the background embedder if articles need vectors and it is not running."""
+        with self._lock:
+            if self._embedding or not self._stale_rows():
+                return
+            self._embedding = True
+        threading.Thread(target=self._embed_changed, name="kh-search-embed", daemon=True).start()
+
+    def _embed_changed(self) -> None:
+        try:
+            client = get_openai()
+            while client is not None:
+                with self._lock:
+                    batch = self._stale_rows()[:EMBED_BATCH_SIZE]
+                if not batch:
+                    break
+                texts = [f"{row.get('title') or ''}\n{row.get('summary') or ''}".strip() or row.get("slug", "") for row in batch]
+                # Network call outside the lock: queries and syncs keep running
+                resp = client.embed_sync(model=EMBEDDING_MODEL, input=texts)
+                with self._lock:
+                    for row, item in zip(batch, resp.data):
+                        # Skip articles that changed or were removed meanwhile
+                        if self._indexed_versions.get(row["id"], object()) != row.get("updated_at"):
+                            continue
+                        vector = np.asarray(item.embedding, dtype=np.float32)
+                        self._embeddings[row["id"]] = (row.get("updated_at"), vector / (np.linalg.norm(vector) or 1.0))
+                    self._publish_vectors()
+        except Exception as e:
+            logger.warning(f"Knowledge Hub embedding failed, will retry on next sync: {e}")
+        finally:
+            with self._lock:
+                self._embedding = False
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def match_ids(self, query: str, lang: str = "en") -> Set[int]:
+        """Ids of articles containing any query term (for list filtering)."""
+        self.sync()
+        with self._lock:
+            return set(self._lexical_scores(query, lang, None))
+
+    def _lexical_scores(self, query: str, lang: str, allowed: Optional[Set[int]]) -> Dict[int, float]:
+        """BM25 scores, or title matches for a stopword-only query. Caller holds the lock."""
+        terms = tokenize(query)
+        if terms:
+            return self._indexes[self._lang(lang)].search(terms, allowed)
+        needle = query.strip().lower()
+        if not needle:
+            return {}
+        return {
+            doc_id: 1.0 for doc_id, row in self._rows.items()
+            if (allowed is None or doc_id in allowed) and needle in _field_text(row, "title", self._lang(lang)).lower()
+        }
+
+    def semantic_version(self) -> Optional[int]:
+        """
+        Version of the article vectors semantic queries rank against (None
+        without an OpenAI client). Part of a semantic response's cache key:
+        results built while vectors are missing or partial must not outlive them.
+        """
+        self.sync()
+        if get_openai() is None:
+            return None
+        self._semantic_enabled = True
+        self._schedule_embedding()
+        return self._vectors_version
+
+    def _semantic_ranking(self, query: str, allowed: Optional[Set[int]]) -> List[int]:
+        client = get_openai()
+        if client is None:
+            return []
+        self._semantic_enabled = True
+        self._schedule_embedding()
+        ids, matrix = self._vectors
+        if matrix is None:
+            return []
+
+        resp = client.embed_sync(model=EMBEDDING_MODEL, input=query)
+        q = np.asarray(resp.data[0].embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        sims = matrix @ q
+        ranking = [ids[i] for i in np.argsort(-sims)]
+        if allowed is not None:
+            ranking = [doc_id for doc_id in ranking if doc_id in allowed]
+        return ranking[:FUSION_DEPTH]
+
+    def search(
+        self,
+        query: str,
+        lang: str = "en",
+        limit: int = 10,
+        semantic: bool = False,
+        allowed: Optional[Set[int]] = None,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Ranked (row, score) pairs for `query`."""
+        self.sync()
+        with self._lock:
+            bm25 = self._lexical_scores(query, lang, allowed)
+            rows = self._rows
+
+        if semantic:
+            try:
+                vector_ranking = self._semantic_ranking(query, allowed)
+            except Exception as e:
+                logger.warning(f"Semantic search unavailable, using BM25 only: {e}")
+                vector_ranking = []
+            lexical_ranking = [doc_id for doc_id, _ in heapq.nlargest(FUSION_DEPTH, bm25.items(), key=lambda kv: kv[1])]
+            fused: Dict[int, float] = {}
+            for ranking in (lexical_ranking, vector_ranking):
+                for rank, doc_id in enumerate(ranking):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            scores = fused
+        else:
+            scores = bm25
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+        return [(rows[doc_id], score) for doc_id, score in top if doc_id in rows]
+
+    @staticmethod
+    def _lang(lang: str) -> str:
+        return lang if lang in LANGUAGES else "en"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._indexed_versions),
+                "terms": {lang: len(index.postings) for lang, index in self._indexes.items()},
+                "embedded_documents": len(self._embeddings),
+            }
+
+
+# Module-level singleton instance
+_index_instance = None
+
+
+def get_search_index(cache: KnowledgeHubCache) -> KnowledgeHubSearchIndex:
+    """
+    Get or create a singleton KnowledgeHubSearchIndex instance.
+
+    Returns:
+        KnowledgeHubSearchIndex instance
+    """
+    global _index_instance
+    if _index_instance is None:
+        _index_instance = KnowledgeHubSearchIndex(cache)
+    return _index_instance
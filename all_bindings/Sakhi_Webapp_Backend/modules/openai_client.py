@@ -0,0 +1,393 @@
+# modules/openai_client.py
+"""
+Shared, rate-aware OpenAI client.
+
+Every module used to build its own OpenAI / AsyncOpenAI client with the SDK's
+default retries, so no one knew how much of the account's budget the process
+was already using and a burst of 429s was retried blindly by each caller.
+
+This module owns one sync and one async client for the whole process and puts
+a small limiter in front of them:
+
+- Requests-per-minute and tokens-per-minute token buckets, kept separately for
+  chat completions and embeddings.
+- 429 / 5xx / connection errors are retried with full-jitter exponential
+  backoff; a `retry-after` header from the API wins over the computed delay
+  and pauses the whole bucket, not just the failing call.
+- Interactive (chat) calls have priority: background work (story generation,
+  intent labels, ingestion) never spends the last share of the budget and
+  yields while interactive calls are waiting.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Account budgets (set these to the limits of the organisation's usage tier)
+CHAT_RPM = int(os.getenv("OPENAI_CHAT_RPM", "500"))
+CHAT_TPM = int(os.getenv("OPENAI_CHAT_TPM", "200000"))
+EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+
+# Share of each bucket that background calls may not consume
+BACKGROUND_RESERVE = float(os.getenv("OPENAI_BACKGROUND_RESERVE", "0.2"))
+
+# Retry policy
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "20"))
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+# Completion size assumed when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+# Rough characters-per-token ratio used to estimate prompt size up front
+CHARS_PER_TOKEN = 4
+
+# Longest single sleep while waiting for budget (re-checked afterwards)
+_POLL_SECONDS = 0.25
+
+
+class Priority(Enum):
+    """Scheduling class of an OpenAI call."""
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+class _TokenBucket:
+    """Continuously refilling bucket sized per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, floor: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `floor` of capacity."""
+        amount = min(amount, self.capacity * (1.0 - floor))
+        needed = amount + floor * self.capacity
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class _RateLimiter:
+    """RPM + TPM budget for one API surface, shared by sync and async callers."""
+
+    def __init__(self, name: str, rpm: int, tpm: int, background_reserve: float = BACKGROUND_RESERVE):
+        self.name = name
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+        self.background_reserve = background_reserve
+        self.blocked_until = 0.0
+        self.interactive_waiting = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int, priority: Priority) -> float:
+        """Reserve budget for one call. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                return self.blocked_until - now
+
+            floor = 0.0
+            if priority is Priority.BACKGROUND:
+                if self.interactive_waiting:
+                    return _POLL_SECONDS
+                floor = self.background_reserve
+
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1, floor), self.tokens.wait_time(tokens, floor))
+            if wait > 0:
+                return wait
+
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            return 0.0
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket once the real usage is known."""
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+    def block(self, seconds: float) -> None:
+        """Pause the whole bucket (the API told us to back off)."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def mark_waiting(self, priority: Priority, delta: int) -> None:
+        if priority is Priority.INTERACTIVE:
+            with self._lock:
+                self.interactive_waiting += delta
+
+
+# =============================================================================
+# HELPER FUNCTIONS
+# =============================================================================
+
+def _estimate_chat_tokens(kwargs: Dict[str, Any]) -> int:
+    chars = 0
+    for message in kwargs.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        chars += len(content) if isinstance(content, str) else len(str(content or ""))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return chars // CHARS_PER_TOKEN + int(completion)
+
+
+def _estimate_embedding_tokens(kwargs: Dict[str, Any]) -> int:
+    inputs = kwargs.get("input") or ""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return max(1, sum(len(str(i)) for i in inputs) // CHARS_PER_TOKEN)
+
+
+def _usage_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.RateLimitError):
+        # Quota exhaustion does not recover by waiting
+        return getattr(error, "code", None) != "insufficient_quota"
+    return isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read retry-after-ms / retry-after from the error response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return min(MAX_RETRY_AFTER_SECONDS, float(value) / 1000.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return min(MAX_RETRY_AFTER_SECONDS, float(value))
+    except ValueError:
+        try:
+            return min(MAX_RETRY_AFTER_SECONDS, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+class SharedOpenAI:
+    """
+    Process-wide OpenAI access with rate budgets, retries and priorities.
+    """
+
+    def __init__(self, api_key: str):
+        # Retries are handled here so they are visible to the shared budget
+        self.sync_client = OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.chat_limiter = _RateLimiter("chat", CHAT_RPM, CHAT_TPM)
+        self.embedding_limiter = _RateLimiter("embeddings", EMBEDDING_RPM, EMBEDDING_TPM)
+
+        self.calls = {p.value: 0 for p in Priority}
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.total_throttle_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Retry bookkeeping
+    # ------------------------------------------------------------------
+    def _next_delay(self, limiter: _RateLimiter, error: Exception, attempt: int) -> Optional[float]:
+        """Delay before the next attempt, or None if the error should surface."""
+        if attempt >= MAX_RETRIES or not _is_retryable(error):
+            self.failures += 1
+            return None
+
+        self.retries += 1
+        delay = _retry_after(error)
+        if isinstance(error, openai.RateLimitError):
+            self.rate_limited += 1
+            if delay is None:
+                delay = _backoff(attempt)
+            limiter.block(delay)
+        if delay is None:
+            delay = _backoff(attempt)
+        else:
+            delay += random.uniform(0, BACKOFF_BASE_SECONDS)
+
+        logger.warning(
+            f"OpenAI {limiter.name} call failed ({type(error).__name__}); "
+            f"retry {attempt + 1}/{MAX_RETRIES} in {delay:.2f}s"
+        )
+        return delay
+
+    # ------------------------------------------------------------------
+    # Async path
+    # ------------------------------------------------------------------
+    async def _acquire(self, limiter: _RateLimiter, tokens: int, priority: Priority) -> None:
+        wait = limiter.try_acquire(tokens, priority)
+        if wait <= 0:
+            return
+        started = time.monotonic()
+        limiter.mark_waiting(priority, 1)
+        try:
+            while wait > 0:
+                await asyncio.sleep(min(wait, _POLL_SECONDS))
+                wait = limiter.try_acquire(tokens, priority)
+        finally:
+            limiter.mark_waiting(priority, -1)
+            self.total_throttle_seconds += time.monotonic() - started
+
+    async def _arun(self, limiter: _RateLimiter, call: Callable, tokens: int, priority: Priority, kwargs: Dict[str, Any]):
+        self.calls[priority.value] += 1
+        attempt = 0
+        while True:
+            await self._acquire(limiter, tokens, priority)
+            try:
+                response = await call(**kwargs)
+            except Exception as e:
+                delay = self._next_delay(limiter, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            limiter.settle(tokens, _usage_tokens(response))
+            return response
+
+    async def chat(self, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        """Async chat completion (same kwargs as client.chat.completions.create)."""
+        return await self._arun(
+            self.chat_limiter, self.async_client.chat.completions.create,
+            _estimate_chat_tokens(kwargs), priority, kwargs,
+        )
+
+    async def embed(self, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        """Async embeddings call (same kwargs as client.embeddings.create)."""
+        return await self._arun(
+            self.embedding_limiter, self.async_client.embeddings.create,
+            _estimate_embedding_tokens(kwargs), priority, kwargs,
+        )
+
+    # ------------------------------------------------------------------
+    # Sync path
+    # ------------------------------------------------------------------
+    def _acquire_sync(self, limiter: _RateLimiter, tokens: int, priority: Priority) -> None:
+        wait = limiter.try_acquire(tokens, priority)
+        if wait <= 0:
+            return
+        started = time.monotonic()
+        limiter.mark_waiting(priority, 1)
+        try:
+            while wait > 0:
+                time.sleep(min(wait, _POLL_SECONDS))
+                wait = limiter.try_acquire(tokens, priority)
+        finally:
+            limiter.mark_waiting(priority, -1)
+            self.total_throttle_seconds += time.monotonic() - started
+
+    def _run_sync(self, limiter: _RateLimiter, call: Callable, tokens: int, priority: Priority, kwargs: Dict[str, Any]):
+        self.calls[priority.value] += 1
+        attempt = 0
+        while True:
+            self._acquire_sync(limiter, tokens, priority)
+            try:
+                response = call(**kwargs)
+            except Exception as e:
+                delay = self._next_delay(limiter, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            limiter.settle(tokens, _usage_tokens(response))
+            return response
+
+    def chat_sync(self, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        """Blocking chat completion (same kwargs as client.chat.completions.create)."""
+        return self._run_sync(
+            self.chat_limiter, self.sync_client.chat.completions.create,
+            _estimate_chat_tokens(kwargs), priority, kwargs,
+        )
+
+    def embed_sync(self, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        """Blocking embeddings call (same kwargs as client.embeddings.create)."""
+        return self._run_sync(
+            self.embedding_limiter, self.sync_client.embeddings.create,
+            _estimate_embedding_tokens(kwargs), priority, kwargs,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        def bucket(limiter: _RateLimiter) -> Dict[str, float]:
+            return {
+                "requests_available": round(limiter.requests.level, 1),
+                "tokens_available": round(limiter.tokens.level),
+                "interactive_waiting": limiter.interactive_waiting,
+                "blocked_for_s": round(max(0.0, limiter.blocked_until - time.monotonic()), 2),
+            }
+
+        return {
+            "calls": dict(self.calls),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "throttle_seconds": round(self.total_throttle_seconds, 2),
+            "chat": bucket(self.chat_limiter),
+            "embeddings": bucket(self.embedding_limiter),
+        }
+
+
+# Module-level singleton instance
+_openai_instance = None
+_openai_lock = threading.Lock()
+
+
+def get_openai() -> Optional[SharedOpenAI]:
+    """
+    Get or create the shared SharedOpenAI instance.
+
+    Returns:
+        SharedOpenAI instance, or None if OPENAI_API_KEY is not set
+    """
+    global _openai_instance
+    if _openai_instance is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        with _openai_lock:
+            if _openai_instance is None:
+                _openai_instance = SharedOpenAI(api_key)
+    return _openai_instance
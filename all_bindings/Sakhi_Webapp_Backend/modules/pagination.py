@@ -0,0 +1,79 @@
+# modules/pagination.py
+"""
+Opaque cursors for keyset pagination of list endpoints.
+
+A cursor encodes the sort key of the last row on a page (e.g. published_at
+and id). The next page starts strictly after it, so pages stay stable
+while rows are being added, unlike offset paging.
+
+Cursors come back from clients, so every value is checked by a field parser
+before it reaches a comparison or a PostgREST filter.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from fastapi import HTTPException
+
+# Header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def of_type(kind: type) -> Callable[[Any], Any]:
+    """Field parser accepting only values of exactly this JSON type."""
+    def parse(value: Any) -> Any:
+        if type(value) is not kind:
+            raise TypeError(f"expected {kind.__name__}")
+        return value
+    return parse
+
+
+def timestamp(value: Any) -> str:
+    """Field parser for an ISO-8601 timestamp; returns it normalized."""
+    if not isinstance(value, str):
+        raise TypeError("expected an ISO timestamp")
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).isoformat()
+
+
+def row_id(value: Any) -> str:
+    """Field parser for an integer or UUID primary key; returns it as a string."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise TypeError("expected an id")
+    return str(uuid.UUID(value))
+
+
+def decode_cursor(cursor: Optional[str], *fields: Callable[[Any], Any]) -> Optional[List[Any]]:
+    """
+    Decode a cursor produced by encode_cursor, passing each value through the
+    matching field parser (of_type, timestamp, row_id).
+
+    Raises:
+        HTTPException(400): if the cursor is malformed or a value fails its parser
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return [parse(value) for parse, value in zip(fields, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
@@ -0,0 +1,314 @@
+# modules/pipeline.py
+"""
+A small declarative DAG executor for request pipelines (the chat turn).
+
+Each Stage names the stages (or seed values) it takes as inputs. A run:
+
+- starts every eager stage as soon as all of its inputs have resolved, so
+  independent stages overlap without hand-written gather() ordering;
+- starts lazy stages (and whatever they still need) only when their result
+  is first requested, e.g. the generation stage of the chosen route;
+- prune(keep=...) cancels every pending or running stage that none of the
+  kept stages depends on, once the request knows which branch it takes;
+- cancels everything still running when the request returns early.
+
+A stage whose input raised does not run; awaiting it re-raises the input's
+exception, so a gate stage can raise to short-circuit the whole turn. stats()
+counts such a stage as skipped and the gate as raised (not necessarily an
+error).
+
+Every run records its critical path: starting from the last stage to finish,
+the chain of inputs that each stage waited on last. Paths and per-stage
+timings are aggregated in stats().
+"""
+import asyncio
+import inspect
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-request traces kept for stats()
+RECENT_TRACES = 20
+
+
+class Stage:
+    """
+    One node of a pipeline.
+
+    fn is called with the results of inputs as keyword arguments. Coroutine
+    functions are awaited; blocking=True runs a sync fn in a worker thread.
+    """
+
+    __slots__ = ("name", "fn", "inputs", "lazy", "blocking")
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        lazy: bool = False,
+        blocking: bool = False,
+    ):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.lazy = lazy
+        self.blocking = blocking
+
+
+class _StageStats:
+    __slots__ = ("completed", "raised", "skipped", "cancelled", "total_ms")
+
+    def __init__(self):
+        self.completed = 0
+        self.raised = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.total_ms = 0.0
+
+
+class Pipeline:
+    """A validated stage graph plus aggregate timings across its runs."""
+
+    def __init__(self, name: str, stages: Iterable[Stage], seeds: Iterable[str] = ()):
+        self.name = name
+        self.seeds = tuple(seeds)
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages or stage.name in self.seeds:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            unknown = [i for i in stage.inputs if i not in self.stages and i not in self.seeds]
+            if unknown:
+                raise ValueError(f"Stage {stage.name} has unknown inputs: {unknown}")
+        self._check_acyclic()
+
+        self.runs = 0
+        self._stage_stats = {name: _StageStats() for name in self.stages}
+        self._critical_paths: Counter = Counter()
+        self._recent: deque = deque(maxlen=RECENT_TRACES)
+
+    def _check_acyclic(self) -> None:
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(name: str, trail: List[str]) -> None:
+            if state.get(name) == 2 or name in self.seeds:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Cycle in pipeline {self.name}: {' -> '.join(trail + [name])}")
+            state[name] = 1
+            for dep in self.stages[name].inputs:
+                visit(dep, trail + [name])
+            state[name] = 2
+
+        for name in self.stages:
+            visit(name, [])
+
+    def dependencies(self, names: Iterable[str]) -> Set[str]:
+        """The given stages plus everything they transitively depend on."""
+        needed: Set[str] = set()
+        pending = [n for n in names if n in self.stages]
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(d for d in self.stages[name].inputs if d in self.stages)
+        return needed
+
+    def run(self, **seeds: Any) -> "PipelineRun":
+        """Start a run; use as `async with pipeline.run(seed=...) as run:`."""
+        missing = [s for s in self.seeds if s not in seeds]
+        if missing:
+            raise ValueError(f"Missing seeds for {self.name}: {missing}")
+        return PipelineRun(self, seeds)
+
+    def _record(self, trace: Dict[str, Any]) -> None:
+        self.runs += 1
+        for name, outcome in trace["stages"].items():
+            stats = self._stage_stats[name]
+            if outcome["status"] == "completed":
+                stats.completed += 1
+                stats.total_ms += outcome["ms"]
+            else:
+                setattr(stats, outcome["status"], getattr(stats, outcome["status"]) + 1)
+        if trace["critical_path"]:
+            self._critical_paths[" > ".join(step["stage"] for step in trace["critical_path"])] += 1
+        self._recent.append(trace)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "stages": {
+                name: {
+                    "completed": s.completed,
+                    "raised": s.raised,
+                    "skipped": s.skipped,
+                    "cancelled": s.cancelled,
+                    "mean_ms": round(s.total_ms / s.completed, 1) if s.completed else None,
+                }
+                for name, s in self._stage_stats.items()
+            },
+            "critical_paths": dict(self._critical_paths.most_common(5)),
+            "recent": list(self._recent),
+        }
+
+
+class PipelineRun:
+    """One execution of a Pipeline; stages run as asyncio tasks."""
+
+    def __init__(self, pipeline: Pipeline, seeds: Dict[str, Any]):
+        self.pipeline = pipeline
+        self.seeds = seeds
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started: Dict[str, float] = {}
+        self._finished: Dict[str, float] = {}
+        self._skipped: Set[str] = set()
+        self._t0 = time.perf_counter()
+
+    async def __aenter__(self) -> "PipelineRun":
+        for stage in self.pipeline.stages.values():
+            if not stage.lazy:
+                self._task(stage.name)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.cancel()
+        pending = [t for t in self._tasks.values() if not t.done()]
+        if pending:
+            await asyncio.wait(pending)
+        trace = self.trace()
+        self.pipeline._record(trace)
+        if trace["critical_path"]:
+            path = " > ".join(f"{step['stage']} {step['ms']:.0f}ms" for step in trace["critical_path"])
+            logger.info(f"{self.pipeline.name} critical path: {path} (total {trace['total_ms']:.0f}ms)")
+
+    def _task(self, name: str) -> asyncio.Task:
+        task = self._tasks.get(name)
+        if task is None:
+            task = asyncio.create_task(self._execute(self.pipeline.stages[name]))
+            self._tasks[name] = task
+        return task
+
+    async def _execute(self, stage: Stage) -> Any:
+        deps = {d: self._task(d) for d in stage.inputs if d not in self.seeds}
+        if deps:
+            # asyncio.wait, unlike gather, does not cancel shared inputs when this stage is cancelled
+            await asyncio.wait(deps.values())
+        kwargs = {}
+        for name in stage.inputs:
+            if name in self.seeds:
+                kwargs[name] = self.seeds[name]
+                continue
+            task = deps[name]
+            if task.cancelled() or task.exception() is not None:
+                self._skipped.add(stage.name)
+            kwargs[name] = task.result()
+
+        self._started[stage.name] = time.perf_counter()
+        if stage.blocking:
+            value = await asyncio.to_thread(stage.fn, **kwargs)
+        else:
+            value = stage.fn(**kwargs)
+            if inspect.isawaitable(value):
+                value = await value
+        self._finished[stage.name] = time.perf_counter()
+        return value
+
+    async def result(self, name: str) -> Any:
+        """The stage's result, starting it (and its inputs) if it has not started."""
+        if name in self.seeds:
+            return self.seeds[name]
+        # Shielded: a cancelled caller must not cancel a stage other stages share
+        return await asyncio.shield(self._task(name))
+
+    def start(self, *names: str) -> None:
+        """Start lazy stages now without waiting for them."""
+        for name in names:
+            self._task(name)
+
+    def prune(self, keep: Iterable[str]) -> List[str]:
+        """Cancel unfinished stages that none of keep depends on; returns their names."""
+        needed = self.pipeline.dependencies(keep)
+        pruned = []
+        for name, task in self._tasks.items():
+            if name not in needed and not task.done():
+                task.cancel()
+                pruned.append(name)
+        return pruned
+
+    def cancel(self) -> None:
+        """Cancel every unfinished stage."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def elapsed(self) -> float:
+        """Seconds since the run started."""
+        return time.perf_counter() - self._t0
+
+    def timing(self, name: str) -> Dict[str, Optional[float]]:
+        """When the stage started and finished, in seconds since the run started (None if not yet)."""
+        started, finished = self._started.get(name), self._finished.get(name)
+        return {
+            "started": started - self._t0 if started is not None else None,
+            "finished": finished - self._t0 if finished is not None else None,
+        }
+
+    def _status(self, name: str) -> str:
+        task = self._tasks[name]
+        if not task.done():
+            return "running"
+        if name in self._skipped:
+            return "skipped"
+        if task.cancelled():
+            # Cancelled while still waiting on an input that failed: it would never have run
+            deps = [d for d in self.pipeline.stages[name].inputs if d in self._tasks]
+            if name not in self._started and any(self._status(d) in ("raised", "skipped") for d in deps):
+                return "skipped"
+            return "cancelled"
+        return "raised" if task.exception() is not None else "completed"
+
+    def critical_path(self) -> List[Dict[str, Any]]:
+        """
+        From the last stage to finish, back through the input each stage
+        waited on last. wait_ms is the gap between that input finishing and
+        the stage starting (time spent before a lazy stage was requested).
+        """
+        if not self._finished:
+            return []
+        name: Optional[str] = max(self._finished, key=self._finished.get)
+        path = []
+        while name is not None:
+            deps = [d for d in self.pipeline.stages[name].inputs if d in self._finished]
+            gate = max(deps, key=self._finished.get) if deps else None
+            ready = self._finished[gate] if gate else self._t0
+            path.append({
+                "stage": name,
+                "ms": round((self._finished[name] - self._started[name]) * 1000, 1),
+                "wait_ms": round((self._started[name] - ready) * 1000, 1),
+            })
+            name = gate
+        path.reverse()
+        return path
+
+    def trace(self) -> Dict[str, Any]:
+        """Per-stage outcome and timing for this run, plus its critical path."""
+        stages = {}
+        for name in self._tasks:
+            status = self._status(name)
+            stages[name] = {"status": status}
+            if status == "completed":
+                stages[name]["ms"] = round((self._finished[name] - self._started[name]) * 1000, 1)
+        path = self.critical_path()
+        end = max(self._finished.values()) if self._finished else self._t0
+        return {
+            "stages": stages,
+            "critical_path": path,
+            "total_ms": round((end - self._t0) * 1000, 1),
+        }
@@ -0,0 +1,342 @@
+# modules/question_clustering.py
+"""
+Batch clustering of novel user questions (sakhi_new_questions) into FAQ candidates.
+
+Questions the KB could not answer well are stored one row per turn. This job
+turns that backlog into a short, ranked list of FAQ candidates:
+
+1. New rows since the last run are fetched (cursor on created_at, plus the ids
+   already seen at that exact timestamp, so rows sharing it are neither skipped
+   nor read twice) and exact repeats (after normalization) are collapsed before embedding.
+2. Unique questions are embedded in batches (rag_search.embed_texts).
+3. Incremental clustering: each batch is matched against the existing cluster
+   centroids with one matrix product; questions above CLUSTER_THRESHOLD join
+   their best cluster (running-mean centroid), the rest are grouped among
+   themselves (greedy leader clustering on the batch similarity matrix) and
+   become new clusters. State is saved between runs, so only new rows are
+   ever embedded.
+4. Clusters are ranked by frequency (questions and distinct users) decayed by
+   recency, and the top ones are emitted as FAQ candidates (JSONL), with an
+   optional drafted answer.
+
+Reviewed candidates (with an "answer") are turned into documents for
+kb_ingestion, so they land in section_chunks and become retrievable:
+
+    python -m modules.question_clustering run [--top 50] [--out faq_candidates.jsonl] [--draft-answers]
+    python -m modules.question_clustering ingest faq_candidates.jsonl
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+import numpy as np
+
+from supabase_client import supabase_select
+from modules.kb_ingestion import KBIngestionPipeline
+from modules.openai_client import Priority, get_openai
+from modules.rag_search import embed_texts
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NEW_QUESTIONS_TABLE = "sakhi_new_questions"
+STATE_PATH = os.getenv("QUESTION_CLUSTERS_STATE", ".question_clusters.npz")
+# Cosine similarity needed to join a cluster
+CLUSTER_THRESHOLD = float(os.getenv("QUESTION_CLUSTER_THRESHOLD", "0.82"))
+# Clusters smaller than this are not emitted as candidates
+MIN_CLUSTER_SIZE = int(os.getenv("QUESTION_CLUSTER_MIN_SIZE", "3"))
+# Recency half-life for ranking
+RECENCY_HALF_LIFE_DAYS = 14.0
+# Weight of distinct users relative to raw question count
+USER_WEIGHT = 2.0
+FETCH_PAGE_SIZE = 1000
+EXAMPLES_PER_CLUSTER = 5
+DRAFT_MODEL = "gpt-4o-mini"
+FAQ_SOURCE_PREFIX = "faq-candidates"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize_question(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", (text or "").strip().lower()).rstrip("?!. ")
+
+
+def _parse_time(value: Optional[str]) -> datetime:
+    if not value:
+        return datetime.now(timezone.utc)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class QuestionClusterer:
+    """
+    Incremental (leader-style) clustering with persisted centroids.
+    """
+
+    def __init__(self, state_path: Optional[str] = STATE_PATH, threshold: float = CLUSTER_THRESHOLD):
+        self.state_path = state_path
+        self.threshold = threshold
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.clusters: List[Dict[str, Any]] = []
+        self.cursor: Optional[str] = None
+        # Ids of rows already processed whose created_at equals the cursor
+        self.cursor_ids: List[Any] = []
+        self._load()
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+    def _load(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        with np.load(self.state_path, allow_pickle=False) as data:
+            self.centroids = data["centroids"].astype(np.float32)
+            meta = json.loads(str(data["meta"]))
+        self.clusters = meta["clusters"]
+        self.cursor = meta.get("cursor")
+        self.cursor_ids = meta.get("cursor_ids", [])
+        logger.info(f"Loaded {len(self.clusters)} question clusters (cursor {self.cursor})")
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        meta = json.dumps({"clusters": self.clusters, "cursor": self.cursor, "cursor_ids": self.cursor_ids})
+        tmp = f"{self.state_path}.tmp.npz"
+        np.savez_compressed(tmp, centroids=self.centroids, meta=np.array(meta))
+        os.replace(tmp, self.state_path)
+
+    # ------------------------------------------------------------------
+    # Clustering
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _new_cluster(question: str) -> Dict[str, Any]:
+        return {"question": question, "examples": [], "count": 0, "users": [], "first_seen": None, "last_seen": None}
+
+    @staticmethod
+    def _absorb(cluster: Dict[str, Any], question: str, rows: List[Dict[str, Any]]) -> None:
+        cluster["count"] += len(rows)
+        if question not in cluster["examples"] and len(cluster["examples"]) < EXAMPLES_PER_CLUSTER:
+            cluster["examples"].append(question)
+        users = set(cluster["users"])
+        users.update(str(r.get("user_id")) for r in rows if r.get("user_id"))
+        cluster["users"] = sorted(users)
+        for r in rows:
+            seen = r.get("created_at")
+            if seen and (cluster["first_seen"] is None or seen < cluster["first_seen"]):
+                cluster["first_seen"] = seen
+            if seen and (cluster["last_seen"] is None or seen > cluster["last_seen"]):
+                cluster["last_seen"] = seen
+
+    def add_batch(self, questions: List[str], vectors: np.ndarray, rows_per_question: List[List[Dict[str, Any]]]) -> int:
+        """
+        Assign unique questions (with their unit-norm embeddings and source rows)
+        to clusters. Returns the number of new clusters.
+        """
+        if not questions:
+            return 0
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.centroids.size == 0:
+            self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        weights = np.array([len(rows) for rows in rows_per_question], dtype=np.float32)
+
+        # 1. Match against existing centroids in one product
+        assigned = np.full(len(questions), -1)
+        if len(self.centroids):
+            sims = vectors @ self.centroids.T
+            best = sims.argmax(axis=1)
+            hit = sims[np.arange(len(questions)), best] >= self.threshold
+            assigned[hit] = best[hit]
+
+        # 2. Greedy leader clustering of the rest (most frequent questions lead)
+        rest = np.flatnonzero(assigned < 0)
+        new_clusters = 0
+        if rest.size:
+            rest = rest[np.argsort(-weights[rest], kind="stable")]
+            within = vectors[rest] @ vectors[rest].T
+            open_mask = np.ones(rest.size, dtype=bool)
+            for i in range(rest.size):
+                if not open_mask[i]:
+                    continue
+                members = np.flatnonzero(open_mask & (within[i] >= self.threshold))
+                open_mask[members] = False
+                cluster_index = len(self.clusters)
+                leader = int(rest[i])
+                self.clusters.append(self._new_cluster(questions[leader]))
+                assigned[rest[members]] = cluster_index
+                new_clusters += 1
+            self.centroids = np.vstack([self.centroids, np.zeros((new_clusters, vectors.shape[1]), dtype=np.float32)])
+
+        # 3. Running-mean centroid update, weighted by repeat counts
+        for cluster_index in np.unique(assigned):
+            idx = np.flatnonzero(assigned == cluster_index)
+            cluster = self.clusters[cluster_index]
+            previous = cluster["count"]
+            added = float(weights[idx].sum())
+            mean = (self.centroids[cluster_index] * previous + (vectors[idx] * weights[idx, None]).sum(axis=0)) / (previous + added)
+            self.centroids[cluster_index] = mean / max(float(np.linalg.norm(mean)), 1e-12)
+            for i in idx:
+                self._absorb(cluster, questions[i], rows_per_question[i])
+        return new_clusters
+
+    # ------------------------------------------------------------------
+    # Pipeline
+    # ------------------------------------------------------------------
+    def _fetch_new_rows(self) -> Iterable[List[Dict[str, Any]]]:
+        offset = 0
+        # gte, not gt: rows written in the same instant as the cursor row may not
+        # have been read yet. Those that were are dropped by id below.
+        since = f"&created_at=gte.{quote(self.cursor, safe='')}" if self.cursor else ""
+        seen = set(self.cursor_ids)
+        cursor = self.cursor
+        while True:
+            rows = supabase_select(
+                NEW_QUESTIONS_TABLE,
+                select="id,question,user_id,similarity_score,created_at",
+                filters=f"order=created_at.asc,id.asc&offset={offset}{since}",
+                limit=FETCH_PAGE_SIZE,
+            ) or []
+            fresh = [r for r in rows if not (r.get("created_at") == cursor and r.get("id") in seen)]
+            if fresh:
+                yield fresh
+            if len(rows) < FETCH_PAGE_SIZE:
+                return
+            offset += FETCH_PAGE_SIZE
+
+    def _advance_cursor(self, rows: List[Dict[str, Any]]) -> None:
+        latest = max((r.get("created_at") for r in rows if r.get("created_at")), default=None)
+        if latest is None or (self.cursor is not None and latest < self.cursor):
+            return
+        ids = [r.get("id") for r in rows if r.get("created_at") == latest]
+        self.cursor_ids = self.cursor_ids + ids if latest == self.cursor else ids
+        self.cursor = latest
+
+    def update(self) -> Dict[str, int]:
+        """Embed and cluster rows added since the last run, then save state."""
+        stats = {"rows": 0, "unique": 0, "new_clusters": 0}
+        for rows in self._fetch_new_rows():
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            display: Dict[str, str] = {}
+            for row in rows:
+                key = _normalize_question(row.get("question"))
+                if not key:
+                    continue
+                grouped.setdefault(key, []).append(row)
+                display.setdefault(key, (row.get("question") or "").strip())
+            keys = list(grouped)
+            if keys:
+                vectors = np.asarray(embed_texts([display[k] for k in keys], priority=Priority.BACKGROUND), dtype=np.float32)
+                stats["new_clusters"] += self.add_batch([display[k] for k in keys], vectors, [grouped[k] for k in keys])
+            stats["rows"] += len(rows)
+            stats["unique"] += len(keys)
+            self._advance_cursor(rows)
+            self.save()
+        logger.info(f"Question clustering: {stats}, {len(self.clusters)} clusters total")
+        return stats
+
+    def ranked(self, top: int = 50, min_size: int = MIN_CLUSTER_SIZE) -> List[Dict[str, Any]]:
+        """Clusters by (count + USER_WEIGHT * distinct users) x recency decay."""
+        now = datetime.now(timezone.utc)
+        scored = []
+        for index, cluster in enumerate(self.clusters):
+            if cluster["count"] < min_size:
+                continue
+            age_days = (now - _parse_time(cluster["last_seen"])).total_seconds() / 86400
+            frequency = cluster["count"] + USER_WEIGHT * len(cluster["users"])
+            score = frequency * math.pow(0.5, max(age_days, 0.0) / RECENCY_HALF_LIFE_DAYS)
+            scored.append((score, index, cluster))
+        scored.sort(key=lambda t: t[0], reverse=True)
+        return [
+            {
+                "cluster_id": index,
+                "score": round(score, 3),
+                # The question that founded the cluster (its most repeated wording at the time)
+                "question": cluster["question"],
+                "examples": cluster["examples"],
+                "count": cluster["count"],
+                "distinct_users": len(cluster["users"]),
+                "first_seen": cluster["first_seen"],
+                "last_seen": cluster["last_seen"],
+                "answer": None,
+            }
+            for score, index, cluster in scored[:top]
+        ]
+
+
+def draft_answers(candidates: List[Dict[str, Any]]) -> None:
+    """Fill "answer" with an LLM draft (for human review before ingestion)."""
+    client = get_openai()
+    if client is None:
+        logger.warning("OPENAI_API_KEY missing, answers not drafted")
+        return
+    for candidate in candidates:
+        variants = "\n".join(f"- {q}" for q in candidate["examples"])
+        resp = client.chat_sync(
+            priority=Priority.BACKGROUND,
+            model=DRAFT_MODEL,
+            temperature=0.2,
+            max_tokens=300,
+            messages=[
+                {"role": "system", "content": "You write short, accurate FAQ answers for a fertility and pregnancy care assistant. Advise seeing a doctor where appropriate."},
+                {"role": "user", "content": f"Question: {candidate['question']}\nAlso asked as:\n{variants}\n\nWrite the FAQ answer."},
+            ],
+        )
+        candidate["answer"] = resp.choices[0].message.content.strip()
+        candidate["answer_drafted"] = True
+
+
+def candidates_to_documents(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One kb_ingestion document per answered candidate (header_path "FAQ > question")."""
+    documents = []
+    for candidate in candidates:
+        answer = (candidate.get("answer") or "").strip()
+        if not answer:
+            continue
+        variants = [q for q in candidate.get("examples", []) if q != candidate["question"]]
+        body = answer + (("\n\nAlso asked as: " + "; ".join(variants)) if variants else "")
+        documents.append({
+            "source": f"{FAQ_SOURCE_PREFIX}/{candidate['cluster_id']}",
+            "title": "FAQ",
+            "text": f"# {candidate['question']}\n{body}",
+        })
+    return documents
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cluster sakhi_new_questions into FAQ candidates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="cluster new questions and write ranked candidates")
+    run.add_argument("--top", type=int, default=50)
+    run.add_argument("--min-size", type=int, default=MIN_CLUSTER_SIZE)
+    run.add_argument("--out", default="faq_candidates.jsonl")
+    run.add_argument("--draft-answers", action="store_true", help="draft answers with the LLM for review")
+    ingest = sub.add_parser("ingest", help="ingest reviewed candidates (with answers) into section_chunks")
+    ingest.add_argument("candidates")
+    ingest.add_argument("--checkpoint", default=".kb_ingest.json")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        clusterer = QuestionClusterer()
+        clusterer.update()
+        candidates = clusterer.ranked(top=args.top, min_size=args.min_size)
+        if args.draft_answers:
+            draft_answers(candidates)
+        with open(args.out, "w", encoding="utf-8") as f:
+            for candidate in candidates:
+                f.write(json.dumps(candidate, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(candidates)} FAQ candidates to {args.out}")
+    else:
+        with open(args.candidates, encoding="utf-8") as f:
+            candidates = [json.loads(line) for line in f if line.strip()]
+        pipeline = KBIngestionPipeline(checkpoint_path=args.checkpoint or None, prune=True)
+        print(json.dumps(pipeline.ingest(candidates_to_documents(candidates)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,72 @@
 import os
 from typing import List, Dict
 
-import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
+import tiktoken
 
+import supabase_client  # ensures .env is loaded once
 from supabase_client import supabase_rpc, supabase_insert
+from modules.openai_client import get_openai, Priority
 
 EMBEDDING_MODEL = "text-embedding-3-small"
+# Embeddings API limits per request: 2048 inputs, 300k tokens
+EMBED_MAX_INPUTS = 2048
+EMBED_MAX_TOKENS = 300_000
+
+_client = get_openai()
 
-_api_key = os.getenv("OPENAI_API_KEY")
-_client = None
-if _api_key:
-    _client = OpenAI(api_key=_api_key)
+try:
+    _encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+except KeyError:
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Tokens `text` costs the embeddings model."""
+    return len(_encoding.encode(text, disallowed_special=()))
 
 
 def _clean_text(text: str) -> str:
     return (text or "").strip().replace("\n", " ")
 
 
-def _generate_embedding(text: str) -> List[float]:
+def _generate_embedding(text: str, priority: Priority = Priority.INTERACTIVE) -> List[float]:
     if not _client:
         raise ValueError("OPENAI_API_KEY missing. Cannot generate embeddings.")
     cleaned = _clean_text(text)
-    resp = _client.embeddings.create(model=EMBEDDING_MODEL, input=cleaned)
+    resp = _client.embed_sync(priority=priority, model=EMBEDDING_MODEL, input=cleaned)
     return resp.data[0].embedding
 
 
+async def async_generate_embedding(text: str, priority: Priority = Priority.INTERACTIVE) -> List[float]:
+    """Embed one text on the shared async client (for coroutines on the chat path)."""
+    if not _client:
+        raise ValueError("OPENAI_API_KEY missing. Cannot generate embeddings.")
+    resp = await _client.embed(priority=priority, model=EMBEDDING_MODEL, input=_clean_text(text))
+    return resp.data[0].embedding
+
+
+def embed_texts(texts: List[str], priority: Priority = Priority.BACKGROUND) -> List[List[float]]:
+    """
+    Embed many texts with as few requests as possible (batches of up to
+    EMBED_MAX_INPUTS inputs / EMBED_MAX_TOKENS tokens). Order is preserved.
+    """
+    if not _client:
+        raise ValueError("OPENAI_API_KEY missing. Cannot generate embeddings.")
+    vectors: List[List[float]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in [_clean_text(t) for t in texts] + [None]:
+        tokens = count_tokens(text) if text is not None else 0
+        if batch and (text is None or len(batch) >= EMBED_MAX_INPUTS or batch_tokens + tokens > EMBED_MAX_TOKENS):
+            resp = _client.embed_sync(priority=priority, model=EMBEDDING_MODEL, input=batch)
+            vectors.extend(item.embedding for item in sorted(resp.data, key=lambda d: d.index))
+            batch, batch_tokens = [], 0
+        if text is not None:
+            batch.append(text)
+            batch_tokens += tokens
+    return vectors
+
+
 def search_sakhi_kb(text: str, limit: int = 3) -> List[dict]:
     """
     Generate an embedding and query both match_sakhi_kb and match_faq RPCs.
@@ -36,8 +77,9 @@ def search_sakhi_kb(text: str, limit: int = 3) -> List[dict]:
 
     payload = {"query_embedding": embedding, "match_count": limit}
 
-    kb_results = supabase_rpc("match_sakhi_kb", payload)
-    faq_results = supabase_rpc("match_faq", payload)
+    # Read-only searches: safe to retry
+    kb_results = supabase_rpc("match_sakhi_kb", payload, idempotent=True)
+    faq_results = supabase_rpc("match_faq", payload, idempotent=True)
 
     merged: List[Dict] = []
 
@@ -64,7 +106,7 @@ def add_kb_entry(title: str, content: str):
     """
     if not content.strip():
         return None
-    emb = _generate_embedding(content)
+    emb = _generate_embedding(content, priority=Priority.BACKGROUND)
     payload = {
         "title": title[:120] if title else "Sakhi note",
         "content": content,
@@ -73,6 +115,26 @@ def add_kb_entry(title: str, content: str):
     return supabase_insert("sakhi_bot_knowledge", payload)
 
 
+def add_kb_entries(entries: List[Dict[str, str]]):
+    """
+    Insert many KB entries ({"title", "content"}) with batched embeddings and
+    one bulk insert. Empty entries are skipped.
+    """
+    entries = [e for e in entries if (e.get("content") or "").strip()]
+    if not entries:
+        return []
+    embeddings = embed_texts([e["content"] for e in entries])
+    payload = [
+        {
+            "title": e["title"][:120] if e.get("title") else "Sakhi note",
+            "content": e["content"],
+            "embedding": emb,
+        }
+        for e, emb in zip(entries, embeddings)
+    ]
+    return supabase_insert("sakhi_bot_knowledge", payload)
+
+
 def format_context(results: List[dict]) -> str:
     """
     Format retrieved knowledge into numbered bullet list for the prompt.
@@ -0,0 +1,236 @@
+# modules/recommendations.py
+"""
+Scoring-based Knowledge Hub recommender.
+
+Replaces the five-step fallback cascade (featured+stage+lens, featured+stage,
+stage recent, any featured, any recent) with a single ranking pass over the
+Knowledge Hub snapshot:
+
+    score = W_STAGE * stage_match + W_FEATURED * featured + W_LENS * lens_match
+            + W_USER_STAGE * user_stage_match + W_RECENCY * recency
+
+The weights keep the cascade's order (stage beats featured beats lens, and
+recency only breaks ties within a tier). `recency` decays exponentially with
+article age. When a user id is given, their `sakhi_journey_stage` stands in
+for a missing stage, or adds a small boost when a different stage is browsed.
+
+Feature arrays are rebuilt only when the snapshot changes, and rankings are
+memoized per (snapshot, stage, lens, user stage, limit).
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from supabase_client import supabase_select
+from modules.knowledge_hub import KnowledgeHubCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Frontend stage / lens names -> Knowledge Hub ids
+STAGE_MAP = {
+    'ttc': 1, 'pregnancy': 2, 'postpartum': 3, 'newborn': 4, 'early-years': 5,
+    'trying-to-conceive': 1, 'pregnant': 2, 'parent': 5  # simplified mapping
+}
+LENS_MAP = {
+    'medical': 1, 'social': 2, 'nutrition': 3, 'financial': 4
+}
+# sakhi_users.sakhi_journey_stage -> life_stage_id
+JOURNEY_STAGE_MAP = {"TTC": 1, "PREGNANT": 2, "PARENT": 5}
+
+# Score weights (see module docstring)
+W_STAGE = 4.0
+W_FEATURED = 2.0
+W_LENS = 1.0
+W_USER_STAGE = 0.75
+W_RECENCY = 0.5
+RECENCY_HALF_LIFE_DAYS = 90.0
+
+USER_STAGE_TTL_SECONDS = 300
+# Users whose journey stage is cached (least recently used evicted first)
+MAX_CACHED_USER_STAGES = 10000
+MAX_MEMOIZED_RANKINGS = 1024
+
+
+def resolve_id(value: Optional[str], mapping: Dict[str, int]) -> Optional[int]:
+    """Map a stage/lens name to its id; numeric strings are taken as ids."""
+    if not value:
+        return None
+    mapped = mapping.get(value.lower())
+    if mapped is None and value.isdigit():
+        mapped = int(value)
+    return mapped
+
+
+def _timestamp(value: Any) -> float:
+    if not value:
+        return math.nan
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return math.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class Features:
+    """Feature arrays for one snapshot's rows. Never mutated once published."""
+
+    __slots__ = ("tag", "rows", "life_stage", "perspective", "featured", "published")
+
+    def __init__(self, tag: Optional[str], rows: List[Dict[str, Any]]):
+        def ids(field: str) -> np.ndarray:
+            # -1 never matches a requested id, so missing values score 0
+            return np.array([row.get(field) if row.get(field) is not None else -1 for row in rows], dtype=np.int64)
+
+        self.tag = tag
+        self.rows = rows
+        self.life_stage = ids("life_stage_id")
+        self.perspective = ids("perspective_id")
+        self.featured = np.array([bool(row.get("is_featured")) for row in rows], dtype=np.float64)
+        self.published = np.array([_timestamp(row.get("published_at")) for row in rows], dtype=np.float64)
+
+
+class KnowledgeHubRecommender:
+    """
+    Ranks Knowledge Hub items for a (stage, lens, user) request.
+    """
+
+    def __init__(self, cache: KnowledgeHubCache):
+        self.cache = cache
+        # Swapped with one assignment; readers keep the reference they took
+        self._features = Features(None, [])
+
+        self._rankings: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._rankings_lock = threading.Lock()
+        # user_id -> (expiry, stage id); LRU-bounded, dropped on journey updates
+        self._user_stages: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+        self._user_stages_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+    def _current_features(self) -> Features:
+        """Features of the snapshot this request reads (rebuilt when it changes)."""
+        snap = self.cache.snapshot()
+        features = self._features
+        if features.tag == snap.version_tag:
+            return features
+        features = Features(snap.version_tag, [snap.rows[item_id] for item_id in snap.ordered_ids])
+        self._features = features
+        return features
+
+    @staticmethod
+    def _recency(features: Features) -> np.ndarray:
+        age_days = np.maximum(0.0, (time.time() - features.published) / 86400.0)
+        # Undated items get no recency credit
+        return np.nan_to_num(np.exp2(-age_days / RECENCY_HALF_LIFE_DAYS), nan=0.0)
+
+    # ------------------------------------------------------------------
+    # Personalization
+    # ------------------------------------------------------------------
+    def user_stage(self, user_id: Optional[str]) -> Optional[int]:
+        """life_stage_id for the user's sakhi_journey_stage (cached briefly)."""
+        if not user_id:
+            return None
+        now = time.monotonic()
+        with self._user_stages_lock:
+            cached = self._user_stages.get(user_id)
+            if cached and cached[0] > now:
+                self._user_stages.move_to_end(user_id)
+                return cached[1]
+
+        stage_id = None
+        try:
+            rows = supabase_select("sakhi_users", select="sakhi_journey_stage", filters=f"user_id=eq.{user_id}")
+            if rows and isinstance(rows, list):
+                stage_id = JOURNEY_STAGE_MAP.get((rows[0].get("sakhi_journey_stage") or "").upper())
+        except Exception as e:
+            logger.warning(f"Could not load journey stage for {user_id}: {e}")
+        with self._user_stages_lock:
+            self._user_stages[user_id] = (now + USER_STAGE_TTL_SECONDS, stage_id)
+            self._user_stages.move_to_end(user_id)
+            while len(self._user_stages) > MAX_CACHED_USER_STAGES:
+                self._user_stages.popitem(last=False)
+        return stage_id
+
+    def forget_user(self, user_id: str) -> None:
+        """Drop a cached journey stage (call after the user's journey changes)."""
+        with self._user_stages_lock:
+            self._user_stages.pop(user_id, None)
+
+    # ------------------------------------------------------------------
+    # Ranking
+    # ------------------------------------------------------------------
+    def recommend(
+        self,
+        stage_id: Optional[int] = None,
+        lens_id: Optional[int] = None,
+        user_stage_id: Optional[int] = None,
+        limit: int = 3,
+    ) -> List[Dict[str, Any]]:
+        """Top `limit` rows by score (ties broken by newest published)."""
+        features = self._current_features()
+        if stage_id is None:
+            stage_id, user_stage_id = user_stage_id, None
+        if user_stage_id == stage_id:
+            user_stage_id = None
+
+        key = (features.tag, stage_id, lens_id, user_stage_id, limit)
+        with self._rankings_lock:
+            cached = self._rankings.get(key)
+            if cached is not None:
+                self._rankings.move_to_end(key)
+                return cached
+
+        n = len(features.rows)
+        if n == 0 or limit <= 0:
+            return []
+
+        score = W_FEATURED * features.featured + W_RECENCY * self._recency(features)
+        if stage_id is not None:
+            score += W_STAGE * (features.life_stage == stage_id)
+        if lens_id is not None:
+            score += W_LENS * (features.perspective == lens_id)
+        if user_stage_id is not None:
+            score += W_USER_STAGE * (features.life_stage == user_stage_id)
+
+        k = min(limit, n)
+        top = np.argpartition(-score, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-score[top], kind="stable")]
+        result = [features.rows[i] for i in top]
+
+        # Keys carry the snapshot tag, so entries of older snapshots just age out
+        with self._rankings_lock:
+            self._rankings[key] = result
+            while len(self._rankings) > MAX_MEMOIZED_RANKINGS:
+                self._rankings.popitem(last=False)
+        return result
+
+
+# Module-level singleton instance
+_recommender_instance = None
+
+
+def get_recommender(cache: KnowledgeHubCache) -> KnowledgeHubRecommender:
+    """
+    Get or create a singleton KnowledgeHubRecommender instance.
+
+    Returns:
+        KnowledgeHubRecommender instance
+    """
+    global _recommender_instance
+    if _recommender_instance is None:
+        _recommender_instance = KnowledgeHubRecommender(cache)
+    return _recommender_instance
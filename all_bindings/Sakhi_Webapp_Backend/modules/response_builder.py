@@ -1,19 +1,18 @@
 # modules/response_builder.py
+import asyncio
 import os
 from typing import List, Optional, Dict, Tuple
 
 import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
 
 from modules.rag_search import add_kb_entry
 from modules.text_utils import truncate_response
+from modules.openai_client import get_openai, Priority
 # Import from root (assuming running from main.py)
 from search_hierarchical import hierarchical_rag_query, format_hierarchical_context
 
-_api_key = os.getenv("OPENAI_API_KEY")
-client = None
-if _api_key:
-    client = OpenAI(api_key=_api_key)
+# Shared rate-limited client (None when OPENAI_API_KEY is missing)
+client = get_openai()
 
 # Classifier system prompt (must be exact)
 CLASSIFIER_PROMPT = """
@@ -40,7 +39,7 @@ General Output:
 """
 
 
-def classify_message(message: str) -> Dict[str, str]:
+async def classify_message(message: str) -> Dict[str, str]:
     """
     Run the classifier prompt and parse out language and signal.
     """
@@ -48,7 +47,7 @@ def classify_message(message: str) -> Dict[str, str]:
         # Default fallback if OpenAI is missing
         return {"language": "en", "signal": "NO"}
 
-    completion = client.chat.completions.create(
+    completion = await client.chat(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": CLASSIFIER_PROMPT},
@@ -106,7 +105,7 @@ def _build_history_block(history: Optional[List[Dict[str, str]]]) -> str:
     return "\n".join(lines)
 
 
-def generate_smalltalk_response(
+async def generate_smalltalk_response(
     prompt: str,
     target_lang: str,
     history: Optional[List[Dict[str, str]]],
@@ -141,7 +140,7 @@ def generate_smalltalk_response(
     if not client:
         return "I'm here to support you with warmth and care. (Missing API Key for full response)"
 
-    completion = client.chat.completions.create(
+    completion = await client.chat(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": system_content},
@@ -158,7 +157,7 @@ def generate_smalltalk_response(
     return final_text
 
 
-def generate_medical_response(
+async def generate_medical_response(
     prompt: str,
     target_lang: str,
     history: Optional[List[Dict[str, str]]],
@@ -168,8 +167,8 @@ def generate_medical_response(
     Medical path: RAG + history.
     Returns (final_text, kb_results)
     """
-    # Use Hierarchical RAG
-    kb_results = hierarchical_rag_query(prompt)
+    # Use Hierarchical RAG (synchronous retrieval, kept off the event loop)
+    kb_results = await asyncio.to_thread(hierarchical_rag_query, prompt)
     context_text = format_hierarchical_context(kb_results)
     
     history_block = _build_history_block(history)
@@ -229,7 +228,7 @@ def generate_medical_response(
     if not client:
         return "I understand your concern. Since my medical brain is currently offline (Missing API Key), I recommend consulting a doctor for specific guidance.", []
 
-    completion = client.chat.completions.create(
+    completion = await client.chat(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": system_content},
@@ -265,7 +264,7 @@ Based on the patient's question, generate a single warm, empathetic sentence tha
 IMPORTANT: Output ONLY the intent sentence, nothing else. No quotes, no labels, just the sentence."""
 
 
-def generate_intent(query: str) -> str:
+async def generate_intent(query: str) -> str:
     """
     Dynamically generate a warm, empathetic, patient-facing intent description
     using OpenAI based on the patient's query.
@@ -280,7 +279,9 @@ def generate_intent(query: str) -> str:
         return "We're here to support you with care and understanding — you're in a safe space."
 
     try:
-        completion = client.chat.completions.create(
+        # Intent labels are decorative; never let them crowd out chat replies
+        completion = await client.chat(
+            priority=Priority.BACKGROUND,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": INTENT_GENERATOR_PROMPT},
@@ -0,0 +1,232 @@
+# modules/session_tokens.py
+"""
+Signed, short-lived session tokens.
+
+/user/login issues a token carrying the user's chat identity (user_id, name,
+gender, location), preferred language and whether onboarding is complete.
+Clients send it as `Authorization: Bearer <token>`; endpoints verify it
+locally with one HMAC-SHA256 check instead of reading sakhi_users.
+
+Format: base64url(JSON claims) + "." + base64url(HMAC-SHA256(claims)).
+
+- Tokens expire after SESSION_TOKEN_TTL_SECONDS. /user/session/refresh
+  swaps an unrevoked token (expired ones included) for a new one built from
+  a fresh database read. Refreshed tokens keep the original issue time
+  (`oiat`), so a chain of refreshes ends SESSION_REFRESH_MAX_AGE_SECONDS
+  after the token was first issued and the user must then sign in again.
+- Profile updates revoke the user's outstanding tokens: tokens issued before
+  the update are rejected and callers fall back to the database. Revocations
+  are written to the sakhi_session_revocations table, so every worker sees
+  them. Verification reads a local copy that a background thread re-syncs
+  every SESSION_REVOCATION_SYNC_SECONDS; refresh reads the table directly.
+- An invalid, expired or revoked token is never an error on its own:
+  endpoints that also accept user_id simply take the database path.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from supabase_client import supabase_select, supabase_upsert
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", "900"))
+# How old (since issue) a token may be and still be refreshed
+SESSION_REFRESH_MAX_AGE_SECONDS = int(os.getenv("SESSION_REFRESH_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+# How stale this process's copy of the shared revocation list may get
+SESSION_REVOCATION_SYNC_SECONDS = float(os.getenv("SESSION_REVOCATION_SYNC_SECONDS", "15"))
+REVOCATIONS_TABLE = "sakhi_session_revocations"
+# Response header carrying a fresh token when a request had to hit the database
+SESSION_TOKEN_HEADER = "X-Session-Token"
+
+_secret_env = os.getenv("SESSION_TOKEN_SECRET")
+if not _secret_env:
+    logger.warning("SESSION_TOKEN_SECRET not set; session tokens will not survive a restart or work across workers")
+_SECRET = (_secret_env or secrets.token_hex(32)).encode("utf-8")
+
+# user_id -> time of the last profile update; older tokens are rejected.
+# A local copy of REVOCATIONS_TABLE, limited to the last TTL (older
+# revocations only concern expired tokens).
+_revoked_before: Dict[str, float] = {}
+_revoked_lock = threading.Lock()
+_synced_at = 0.0
+_syncing = False
+
+
+class InvalidSession(Exception):
+    """Raised when a token is malformed, has a bad signature, is expired or was revoked."""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def is_onboarded(profile: Dict[str, Any]) -> bool:
+    """Chat onboarding is complete once name, gender and location are set."""
+    return bool(profile.get("name") and profile.get("gender") and (profile.get("location") or profile.get("Location")))
+
+
+def issue_session_token(profile: Dict[str, Any], original_issued_at: Optional[float] = None) -> str:
+    """
+    Sign a token for a sakhi_users row (chat identity + preferred_language).
+    Refresh passes the replaced token's original_issued_at.
+    """
+    now = time.time()
+    claims = {
+        "sub": profile["user_id"],
+        "name": profile.get("name"),
+        "gender": profile.get("gender"),
+        "location": profile.get("location") or profile.get("Location"),
+        "lang": profile.get("preferred_language"),
+        "onboarded": is_onboarded(profile),
+        "iat": round(now, 3),
+        "oiat": original_issued_at or round(now, 3),
+        "exp": int(now) + SESSION_TOKEN_TTL_SECONDS,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str, for_refresh: bool = False) -> Dict[str, Any]:
+    """
+    Return the token's claims, or raise InvalidSession.
+
+    for_refresh accepts expired tokens up to SESSION_REFRESH_MAX_AGE_SECONDS
+    after their original issue, and checks revocation against the shared
+    table rather than the local copy.
+    """
+    payload, _, signature = (token or "").partition(".")
+    try:
+        valid = bool(payload) and hmac.compare_digest(signature.encode("utf-8"), _sign(payload).encode("ascii"))
+        claims = json.loads(_b64decode(payload)) if valid else None
+    except ValueError:
+        raise InvalidSession("malformed token")
+    if not valid:
+        raise InvalidSession("bad signature")
+
+    now = time.time()
+    if for_refresh:
+        if now - claims.get("oiat", claims["iat"]) > SESSION_REFRESH_MAX_AGE_SECONDS:
+            raise InvalidSession("token too old to refresh")
+        revoked_at = _shared_revocation(claims["sub"])
+    else:
+        if now >= claims["exp"]:
+            raise InvalidSession("token expired")
+        _sync_revocations()
+        revoked_at = _revoked_before.get(claims["sub"], 0)
+    if claims["iat"] < revoked_at:
+        raise InvalidSession("token revoked")
+    return claims
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """The token from an `Authorization: Bearer <token>` header, if any."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+def session_from_header(authorization: Optional[str], user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Claims of a valid bearer token, or None. A token for a different user
+    than an explicit user_id is ignored.
+    """
+    token = bearer_token(authorization)
+    if not token:
+        return None
+    try:
+        claims = verify_session_token(token)
+    except InvalidSession as e:
+        logger.info(f"Ignoring session token: {e}")
+        return None
+    if user_id and claims["sub"] != user_id:
+        return None
+    return claims
+
+
+def session_identity(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """The chat identity a token carries, shaped like a sakhi_users row."""
+    return {
+        "user_id": claims["sub"],
+        "name": claims.get("name"),
+        "gender": claims.get("gender"),
+        "location": claims.get("location"),
+        "preferred_language": claims.get("lang"),
+    }
+
+
+def revoke_sessions(user_id: str) -> None:
+    """Reject the user's tokens issued before now (call after profile updates)."""
+    now = round(time.time(), 3)
+    with _revoked_lock:
+        _revoked_before[user_id] = now
+    try:
+        supabase_upsert(REVOCATIONS_TABLE, [{"user_id": user_id, "revoked_at": now}], on_conflict="user_id")
+    except Exception as e:
+        # Still rejected here; other workers keep accepting old tokens until they expire
+        logger.warning(f"Failed to record session revocation for {user_id}: {e}")
+
+
+def _shared_revocation(user_id: str) -> float:
+    """The user's revocation time from REVOCATIONS_TABLE (falls back to the local copy)."""
+    try:
+        rows = supabase_select(REVOCATIONS_TABLE, select="revoked_at", filters=f"user_id=eq.{user_id}")
+    except Exception as e:
+        logger.warning(f"Failed to read session revocations: {e}")
+        return _revoked_before.get(user_id, 0)
+    shared = float(rows[0]["revoked_at"]) if rows else 0
+    return max(shared, _revoked_before.get(user_id, 0))
+
+
+def _sync_revocations() -> None:
+    """Re-sync the local copy in the background once it is older than SESSION_REVOCATION_SYNC_SECONDS."""
+    global _syncing
+    with _revoked_lock:
+        if _syncing or time.time() - _synced_at < SESSION_REVOCATION_SYNC_SECONDS:
+            return
+        _syncing = True
+    threading.Thread(target=_load_revocations, daemon=True).start()
+
+
+def _load_revocations() -> None:
+    global _synced_at, _syncing
+    started = time.time()
+    try:
+        rows = supabase_select(
+            REVOCATIONS_TABLE,
+            select="user_id,revoked_at",
+            filters=f"revoked_at=gt.{started - SESSION_TOKEN_TTL_SECONDS}",
+        )
+    except Exception as e:
+        logger.warning(f"Failed to sync session revocations: {e}")
+        rows = None
+    with _revoked_lock:
+        if rows is not None:
+            for row in rows:
+                at = float(row["revoked_at"])
+                if at > _revoked_before.get(row["user_id"], 0):
+                    _revoked_before[row["user_id"]] = at
+            # Entries older than the TTL no longer reject anything
+            for stale in [uid for uid, at in _revoked_before.items() if started - at > SESSION_TOKEN_TTL_SECONDS]:
+                del _revoked_before[stale]
+        # A failed sync is retried after the same interval
+        _synced_at = time.time()
+        _syncing = False
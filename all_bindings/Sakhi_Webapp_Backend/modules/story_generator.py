@@ -3,15 +3,16 @@ import re
 import logging
 import asyncio
 from typing import Dict, Any, Optional, Tuple, List
-from openai import AsyncOpenAI
 from supabase_client import supabase  # Use the client directly
+from resilience import get_resilience, client_attempt
+from modules.openai_client import get_openai, Priority
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared rate-limited OpenAI client (None when OPENAI_API_KEY is missing)
+client = get_openai()
 
 def constrain_summary(value: Optional[str]) -> Optional[str]:
     """
@@ -140,7 +141,9 @@ STORY RULES:
 """.strip()
 
     try:
-        response = await client.chat.completions.create(
+        # Background work: yields the rate budget to interactive chat
+        response = await client.chat(
+            priority=Priority.BACKGROUND,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -195,9 +198,33 @@ def ensure_narrative(result: Dict[str, Optional[str]], fallback: Dict[str, str])
     return {"short": final_short, "long": final_long}
 
 
+def save_narrative(story_id: str, narrative: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Write summary / generated_story for a story.
+    Returns the updated row, or None if the update failed.
+    """
+    try:
+        query = supabase.table("sakhi_success_stories").update({
+            "summary": narrative["short"],
+            "generated_story": narrative["long"]
+        }).eq("id", story_id)
+        response = get_resilience().call("sakhi_success_stories", client_attempt(query.execute), pool="client")
+
+        if response.data and len(response.data) > 0:
+            logger.info("Story updated successfully.")
+            return response.data[0]
+        logger.error("Failed to update story in database (no data returned).")
+        return None
+
+    except Exception as e:
+        logger.error(f"Database update failed: {e}")
+        return None
+
+
 async def process_new_story(story_id: str, story_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Main entry point to generate narrative and update database.
+    Generate narrative and update database inline.
+    The API queues this work instead (see modules/story_jobs.py).
     """
     logger.info(f"Processing story generation for ID: {story_id}")
     
@@ -209,25 +236,12 @@ async def process_new_story(story_id: str, story_data: Dict[str, Any]) -> Dict[s
     
     logger.info("Updating story with generated narrative...")
     
-    # Update Supabase
-    try:
-        response = supabase.table("sakhi_success_stories").update({
-            "summary": final_narrative["short"],
-            "generated_story": final_narrative["long"]
-        }).eq("id", story_id).execute()
-        
-        if response.data and len(response.data) > 0:
-            logger.info("Story updated successfully.")
-            return response.data[0]
-        else:
-            logger.error("Failed to update story in database (no data returned).")
-            # Return original data with generated fields manually added so response is correct
-            story_data_copy = story_data.copy()
-            story_data_copy["summary"] = final_narrative["short"]
-            story_data_copy["generated_story"] = final_narrative["long"]
-            return story_data_copy
-            
-    except Exception as e:
-        logger.error(f"Database update failed: {e}")
-        # Return original data if update fails
-        return story_data
+    updated = save_narrative(story_id, final_narrative)
+    if updated is not None:
+        return updated
+
+    # Return original data with generated fields manually added so response is correct
+    story_data_copy = story_data.copy()
+    story_data_copy["summary"] = final_narrative["short"]
+    story_data_copy["generated_story"] = final_narrative["long"]
+    return story_data_copy
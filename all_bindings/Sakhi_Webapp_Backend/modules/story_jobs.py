@@ -0,0 +1,270 @@
+# modules/story_jobs.py
+"""
+Background job queue for success-story narrative generation.
+
+Generating a narrative is a multi-second gpt-4o call, so it must not run
+inside the POST /stories request. Drafts are saved with the rule-based
+fallback narrative, a job is queued here, and a small worker pool replaces
+the fallback with the LLM narrative once it is ready.
+
+- One job per story id (enqueueing the same story twice is a no-op).
+- Failed generations are retried with backoff; after the last attempt the
+  fallback narrative simply stays in place.
+- Set STORY_JOBS_DB to a file path to persist jobs in SQLite, so queued
+  work survives a restart. Without it the queue is in-memory only. The app
+  calls start() on startup, which resumes persisted pending jobs right away.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from modules.story_generator import generate_narrative, fallback_narrative, ensure_narrative, save_narrative
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STORY_WORKERS = int(os.getenv("STORY_WORKERS", "2"))
+STORY_MAX_ATTEMPTS = int(os.getenv("STORY_MAX_ATTEMPTS", "3"))
+STORY_RETRY_BACKOFF_SECONDS = float(os.getenv("STORY_RETRY_BACKOFF_SECONDS", "2"))
+STORY_JOBS_DB = os.getenv("STORY_JOBS_DB")
+# Finished jobs kept in memory for status polling (oldest evicted first)
+MAX_TRACKED_JOBS = 5000
+
+
+class GenerationStatus:
+    """Values of `generation_status` reported to clients."""
+    QUEUED = "queued"
+    GENERATING = "generating"
+    READY = "ready"  # LLM narrative saved
+    FALLBACK = "fallback"  # LLM failed on every attempt; fallback narrative kept
+
+    PENDING = (QUEUED, GENERATING)
+
+
+class _SQLiteJobStore:
+    """Optional durable copy of the job table."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS story_jobs (
+                story_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                payload TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def save(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO story_jobs (story_id, status, attempts, error, payload, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job["story_id"],
+                    job["status"],
+                    job["attempts"],
+                    job["error"],
+                    json.dumps(job["payload"], default=str) if job["status"] in GenerationStatus.PENDING else None,
+                    job["updated_at"],
+                ),
+            )
+            self._conn.commit()
+
+    def load(self, story_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT story_id, status, attempts, error, payload, updated_at FROM story_jobs WHERE story_id = ?",
+                (story_id,),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def load_pending(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT story_id, status, attempts, error, payload, updated_at FROM story_jobs "
+                "WHERE status IN (?, ?) ORDER BY updated_at",
+                GenerationStatus.PENDING,
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        story_id, status, attempts, error, payload, updated_at = row
+        return {
+            "story_id": story_id,
+            "status": status,
+            "attempts": attempts,
+            "error": error,
+            "payload": json.loads(payload) if payload else {},
+            "updated_at": updated_at,
+        }
+
+
+class StoryJobQueue:
+    """
+    In-process queue + worker pool for narrative generation.
+    """
+
+    def __init__(
+        self,
+        workers: int = STORY_WORKERS,
+        max_attempts: int = STORY_MAX_ATTEMPTS,
+        backoff_seconds: float = STORY_RETRY_BACKOFF_SECONDS,
+        db_path: Optional[str] = STORY_JOBS_DB,
+    ):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self._store = _SQLiteJobStore(db_path) if db_path else None
+
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+
+    # ------------------------------------------------------------------
+    # Job records
+    # ------------------------------------------------------------------
+    def _update(self, job: Dict[str, Any], **changes) -> None:
+        job.update(changes, updated_at=time.time())
+        self._jobs[job["story_id"]] = job
+        self._jobs.move_to_end(job["story_id"])
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest["status"] in GenerationStatus.PENDING:
+                break
+            self._jobs.pop(oldest_id)
+        if self._store:
+            self._store.save(job)
+
+    def get_job(self, story_id: str) -> Optional[Dict[str, Any]]:
+        story_id = str(story_id)
+        job = self._jobs.get(story_id)
+        if job is None and self._store:
+            job = self._store.load(story_id)
+        return job
+
+    def status_of(self, story_id: str) -> Optional[str]:
+        job = self.get_job(story_id)
+        return job["status"] if job else None
+
+    # ------------------------------------------------------------------
+    # Worker pool
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """
+        Start the workers on the running loop and re-queue persisted pending
+        jobs. Called from the app's startup hook; enqueue() also calls it, so
+        it is idempotent.
+        """
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self._store:
+            for job in self._store.load_pending():
+                if job["story_id"] not in self._jobs:
+                    self._update(job, status=GenerationStatus.QUEUED)
+                    self._queue.put_nowait(job["story_id"])
+                    logger.info(f"Re-queued story generation for {job['story_id']}")
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            story_id = await self._queue.get()
+            try:
+                await self._run(story_id)
+            except Exception as e:
+                logger.error(f"Story worker {index} crashed on {story_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, story_id: str) -> None:
+        job = self._jobs.get(story_id)
+        if job is None or job["status"] != GenerationStatus.QUEUED:
+            return
+
+        story = job["payload"]
+        result: Dict[str, Optional[str]] = {"short": None, "long": None}
+        while job["attempts"] < self.max_attempts:
+            self._update(job, status=GenerationStatus.GENERATING, attempts=job["attempts"] + 1)
+            result = await generate_narrative(story)
+            if result.get("long"):
+                break
+            if job["attempts"] < self.max_attempts:
+                delay = self.backoff_seconds * (2 ** (job["attempts"] - 1))
+                logger.warning(f"Narrative generation failed for {story_id} (attempt {job['attempts']}); retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+        if not result.get("long"):
+            # The draft was saved with the fallback narrative; keep it
+            self._update(job, status=GenerationStatus.FALLBACK, error="LLM generation failed")
+            logger.error(f"Giving up on narrative for {story_id} after {job['attempts']} attempts")
+            return
+
+        final_narrative = ensure_narrative(result, fallback_narrative(story))
+        saved = await asyncio.to_thread(save_narrative, story_id, final_narrative)
+        if saved is None:
+            self._update(job, status=GenerationStatus.FALLBACK, error="Database update failed")
+            return
+        self._update(job, status=GenerationStatus.READY, error=None)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def enqueue(self, story_id: str, story_data: Dict[str, Any]) -> str:
+        """
+        Queue narrative generation for a story. Idempotent per story id.
+
+        Returns:
+            The story's generation_status after the call.
+        """
+        self.start()
+        story_id = str(story_id)
+        existing = self.get_job(story_id)
+        if existing and existing["status"] != GenerationStatus.FALLBACK:
+            return existing["status"]
+
+        job = {"story_id": story_id, "status": GenerationStatus.QUEUED, "attempts": 0, "error": None, "payload": story_data}
+        self._update(job)
+        self._queue.put_nowait(story_id)
+        return GenerationStatus.QUEUED
+
+    def stats(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            **counts,
+        }
+
+
+# Module-level singleton instance
+_queue_instance = None
+
+
+def get_story_job_queue() -> StoryJobQueue:
+    """
+    Get or create a singleton StoryJobQueue instance.
+
+    Returns:
+        StoryJobQueue instance
+    """
+    global _queue_instance
+    if _queue_instance is None:
+        _queue_instance = StoryJobQueue()
+    return _queue_instance
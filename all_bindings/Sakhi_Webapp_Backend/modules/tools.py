@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from datetime import datetime, date, timedelta
-from typing import List, Optional, Dict
-from dateutil.relativedelta import relativedelta
+from enum import Enum
+from typing import List, Optional, Dict, Tuple, Union
+from functools import lru_cache
+import calendar
+import hashlib
+import json
 import math
 
+import numpy as np
+
 router = APIRouter(prefix="/api/tools", tags=["tools"])
 
 # ================= DATA CONSTANTS =================
@@ -122,6 +129,98 @@ SAFETY_ITEMS = [
     { "id": "safe_10", "name": "Retinol/Vitamin A", "category": "Beauty", "status": "AVOID", "note": "High doses can cause birth defects. Switch to Bakuchiol." }
 ]
 
+# ================= COMPILED LOOKUP TABLES =================
+# The datasets above are static, so they are indexed once at import.
+
+MIN_WEEK, MAX_WEEK = 4, 40
+
+# week number -> record (None for weeks without data)
+WEEK_TABLE: List[Optional[Dict]] = [None] * (MAX_WEEK + 1)
+for _week in PREGNANCY_WEEKS:
+    WEEK_TABLE[_week["week"]] = _week
+
+# (age, items, days, months): offsets parsed once into plain day/month counts
+VACCINE_OFFSETS: List[Tuple[str, List[str], int, int]] = [
+    (
+        stage["age"],
+        stage["items"],
+        stage["offset"].get("days", 0) + 7 * stage["offset"].get("weeks", 0),
+        stage["offset"].get("months", 0) + 12 * stage["offset"].get("years", 0),
+    )
+    for stage in VACCINES
+]
+
+
+def _add_offset(start: date, days: int, months: int) -> date:
+    """start + relativedelta(months=months, days=days), without the relativedelta overhead."""
+    if months:
+        month_index = start.month - 1 + months
+        year, month = start.year + month_index // 12, month_index % 12 + 1
+        start = start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+    return start + timedelta(days=days) if days else start
+
+# Lowercased search text per safety item, and an n-gram index over it:
+# every substring of length 1-3 maps to the items containing it, so a query
+# only has to be verified against items sharing all its n-grams.
+SAFETY_NGRAM = 3
+_SAFETY_FIELDS: List[Tuple[str, str]] = [(item["name"].lower(), item["category"].lower()) for item in SAFETY_ITEMS]
+_SAFETY_INDEX: Dict[str, set] = {}
+for _i, _fields in enumerate(_SAFETY_FIELDS):
+    for _text in _fields:
+        for _n in range(1, SAFETY_NGRAM + 1):
+            for _start in range(len(_text) - _n + 1):
+                _SAFETY_INDEX.setdefault(_text[_start:_start + _n], set()).add(_i)
+
+
+def _safety_candidates(q_lower: str) -> List[int]:
+    n = min(len(q_lower), SAFETY_NGRAM)
+    grams = {q_lower[i:i + n] for i in range(len(q_lower) - n + 1)}
+    candidates = None
+    for gram in grams:
+        postings = _SAFETY_INDEX.get(gram)
+        if not postings:
+            return []
+        candidates = set(postings) if candidates is None else candidates & postings
+    return sorted(candidates or [])
+
+
+@lru_cache(maxsize=1024)
+def _safety_search(q_lower: str) -> Tuple[int, ...]:
+    # Same matching as a substring scan over name/category, original order kept
+    return tuple(
+        i for i in _safety_candidates(q_lower)
+        if q_lower in _SAFETY_FIELDS[i][0] or q_lower in _SAFETY_FIELDS[i][1]
+    )
+
+
+# Static GET responses are serialized once and served with cache headers
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+SEARCH_CACHE_CONTROL = "public, max-age=3600"
+
+
+def _serialize(payload) -> Tuple[bytes, str]:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+_ALL_WEEKS_JSON = _serialize(PREGNANCY_WEEKS)
+_WEEK_JSON: List[Optional[Tuple[bytes, str]]] = [_serialize(w) if w else None for w in WEEK_TABLE]
+_SAFETY_ALL_JSON = _serialize(SAFETY_ITEMS)
+_READINESS_JSON = _serialize(TTC_READINESS_ITEMS)
+
+
+@lru_cache(maxsize=1024)
+def _safety_search_json(q_lower: str) -> Tuple[bytes, str]:
+    return _serialize([SAFETY_ITEMS[i] for i in _safety_search(q_lower)])
+
+
+def _json_response(serialized: Tuple[bytes, str], if_none_match: Optional[str], cache_control: str = STATIC_CACHE_CONTROL) -> Response:
+    body, etag = serialized
+    headers = {"Cache-Control": cache_control, "ETag": etag}
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # ================= MODELS =================
 
 class VaccinationRequest(BaseModel):
@@ -163,22 +262,12 @@ def get_vaccination_schedule(req: VaccinationRequest):
     today = date.today()
     schedule = []
     
-    for stage in VACCINES:
-        due_date = dob
-        offset = stage["offset"]
-        
-        if "days" in offset:
-            due_date = dob + timedelta(days=offset["days"])
-        if "weeks" in offset:
-            due_date = dob + timedelta(weeks=offset["weeks"])
-        if "months" in offset:
-            due_date = dob + relativedelta(months=offset["months"])
-        if "years" in offset:
-            due_date = dob + relativedelta(years=offset["years"])
+    for age, items, days, months in VACCINE_OFFSETS:
+        due_date = _add_offset(dob, days, months)
             
         schedule.append({
-            "age": stage["age"],
-            "items": stage["items"],
+            "age": age,
+            "items": items,
             "dueDate": due_date,
             "isPast": due_date < today
         })
@@ -261,10 +350,10 @@ def get_pregnancy_week_calculation(req: PregnancyWeekRequest):
         week = days_diff // 7
         
     # Clamp
-    week = max(4, min(40, week))
+    week = max(MIN_WEEK, min(MAX_WEEK, week))
     
     # Find data
-    week_data = next((w for w in PREGNANCY_WEEKS if w["week"] == week), None)
+    week_data = WEEK_TABLE[week]
     
     return {
         "currentWeek": week,
@@ -272,32 +361,26 @@ def get_pregnancy_week_calculation(req: PregnancyWeekRequest):
     }
 
 @router.get("/pregnancy-week/{week_num}")
-def get_pregnancy_week_detail(week_num: int):
-    week_data = next((w for w in PREGNANCY_WEEKS if w["week"] == week_num), None)
-    if not week_data:
+def get_pregnancy_week_detail(week_num: int, if_none_match: Optional[str] = Header(None)):
+    week_json = _WEEK_JSON[week_num] if 0 <= week_num <= MAX_WEEK else None
+    if not week_json:
         raise HTTPException(status_code=404, detail="Week not found")
-    return week_data
+    return _json_response(week_json, if_none_match)
 
 @router.get("/pregnancy-weeks")
-def get_all_pregnancy_weeks():
+def get_all_pregnancy_weeks(if_none_match: Optional[str] = Header(None)):
     # Only return summary or full? Full is fine, it's small.
-    return PREGNANCY_WEEKS
+    return _json_response(_ALL_WEEKS_JSON, if_none_match)
 
 @router.get("/safety-check")
-def safety_check(q: Optional[str] = None):
+def safety_check(q: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
     if not q:
-        return SAFETY_ITEMS
-    
-    q_lower = q.lower()
-    results = [
-        item for item in SAFETY_ITEMS
-        if q_lower in item["name"].lower() or q_lower in item["category"].lower()
-    ]
-    return results
+        return _json_response(_SAFETY_ALL_JSON, if_none_match)
+    return _json_response(_safety_search_json(q.lower()), if_none_match, SEARCH_CACHE_CONTROL)
 
 @router.get("/readiness-checklist")
-def get_readiness_checklist():
-    return TTC_READINESS_ITEMS
+def get_readiness_checklist(if_none_match: Optional[str] = Header(None)):
+    return _json_response(_READINESS_JSON, if_none_match)
 
 # ================= CONCEPTION CALCULATOR =================
 
@@ -698,3 +781,274 @@ def calculate_baby_cost(req: BabyCostRequest):
         "firstYearTotal": int(first_year),
         "oneTime": int(one_time)
     }
+
+# ================= BATCH CALCULATORS =================
+# Array variants of the date calculators for cohort and calendar views.
+# Inputs are arrays (scalar options are broadcast), the arithmetic is done in
+# one shot on NumPy datetime64[D] arrays, and the results are identical to
+# calling the single-item endpoint once per element.
+#
+# Output is columnar by default ({"field": [v0, v1, ...]}); with
+# ?format=ndjson each element is streamed as one JSON line shaped exactly
+# like the single-item response.
+
+MAX_BATCH_SIZE = 10000
+DUE_DATE_DAYS = 280
+CONCEPTION_TO_DUE_DAYS = 266
+LUTEAL_PHASE_DAYS = 14
+FERTILE_DAYS_BEFORE_OVULATION = 5
+
+
+class BatchFormat(str, Enum):
+    COLUMNAR = "columnar"
+    NDJSON = "ndjson"
+
+
+class DueDateBatchRequest(BaseModel):
+    lmp: List[date]
+
+class OvulationBatchRequest(BaseModel):
+    lastPeriod: List[date]
+    cycleLength: Union[int, List[int]] = 28
+
+class ConceptionBatchRequest(BaseModel):
+    date: List[date]
+    type: Union[str, List[str]] = "LMP"
+    cycleLength: Union[Optional[int], List[Optional[int]]] = 28
+    isIrregular: Union[Optional[bool], List[Optional[bool]]] = False
+    dueDateConfidence: Union[Optional[str], List[Optional[str]]] = None
+
+class PregnancyWeekBatchRequest(BaseModel):
+    referenceDate: List[str]
+    type: Union[str, List[str]] = "LMP"
+
+
+def _batch_size(values: list) -> int:
+    if len(values) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+    return len(values)
+
+
+def _broadcast(value, n: int, name: str) -> list:
+    """A per-item list of length n, or a scalar repeated n times."""
+    if isinstance(value, list):
+        if len(value) != n:
+            raise HTTPException(status_code=400, detail=f"'{name}' must have {n} items")
+        return value
+    return [value] * n
+
+
+def _days(values) -> np.ndarray:
+    return np.array(values, dtype="datetime64[D]")
+
+
+def _today64() -> np.datetime64:
+    return np.datetime64(date.today(), "D")
+
+
+def _iso(values: np.ndarray) -> List[str]:
+    return np.datetime_as_string(values, unit="D").tolist()
+
+
+def _batch_response(columns: Dict[str, list], fmt: BatchFormat, extra: Optional[Dict] = None) -> Response:
+    if fmt == BatchFormat.NDJSON:
+        names = list(columns)
+
+        def rows():
+            for values in zip(*columns.values()):
+                yield json.dumps(dict(zip(names, values)), ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+    payload = {**columns, **(extra or {})}
+    return Response(
+        content=json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        media_type="application/json",
+    )
+
+
+@router.post("/due-date/batch")
+def calculate_due_date_batch(req: DueDateBatchRequest, format: BatchFormat = BatchFormat.COLUMNAR):
+    _batch_size(req.lmp)
+    lmp = _days(req.lmp)
+    weeks = np.maximum(0, (_today64() - lmp).astype(np.int64) // 7)
+    trimester = 1 + (weeks >= 13) + (weeks >= 27)
+    return _batch_response({
+        "dueDate": _iso(lmp + DUE_DATE_DAYS),
+        "weeksPregnant": weeks.tolist(),
+        "trimester": trimester.astype(np.int64).tolist(),
+    }, format)
+
+
+@router.post("/ovulation/batch")
+def calculate_ovulation_batch(req: OvulationBatchRequest, format: BatchFormat = BatchFormat.COLUMNAR):
+    n = _batch_size(req.lastPeriod)
+    cycle = np.array(_broadcast(req.cycleLength, n, "cycleLength"), dtype=np.int64)
+    next_period = _days(req.lastPeriod) + cycle
+    ovulation = next_period - LUTEAL_PHASE_DAYS
+    return _batch_response({
+        "ovulationDate": _iso(ovulation),
+        "fertileWindowStart": _iso(ovulation - FERTILE_DAYS_BEFORE_OVULATION),
+        "fertileWindowEnd": _iso(ovulation),
+        "nextPeriod": _iso(next_period),
+    }, format)
+
+
+@router.post("/conception-calculator/batch")
+def calculate_conception_batch(req: ConceptionBatchRequest, format: BatchFormat = BatchFormat.COLUMNAR):
+    n = _batch_size(req.date)
+    is_due = np.array([t == "DUE_DATE" for t in _broadcast(req.type, n, "type")], dtype=bool)
+    raw_cycle = _broadcast(req.cycleLength, n, "cycleLength")
+    # None behaves like the default 28-day cycle; 0 is "falsy" for the confidence rule
+    cycle = np.array([28 if c is None else c for c in raw_cycle], dtype=np.int64)
+    irregular = np.array([bool(v) for v in _broadcast(req.isIrregular, n, "isIrregular")], dtype=bool)
+    estimated = np.array([v == "ESTIMATED" for v in _broadcast(req.dueDateConfidence, n, "dueDateConfidence")], dtype=bool)
+
+    base = _days(req.date)
+    conception = np.where(is_due, base - CONCEPTION_TO_DUE_DAYS, base + (cycle - LUTEAL_PHASE_DAYS))
+
+    atypical_cycle = (cycle != 0) & ((cycle < 26) | (cycle > 30))
+    low = ~is_due & irregular
+    medium = np.where(is_due, estimated, ~irregular & atypical_cycle)
+    confidence = np.where(low, "Low", np.where(medium, "Medium", "High"))
+    window = np.where(low, 5, np.where(medium, 4, 3))
+
+    due_explanation = "We calculated this by counting back 38 weeks from your due date, which is the average time from conception to birth."
+    explanations = [
+        due_explanation if due else
+        f"Based on a {c or 28}-day cycle, conception likely occurred around the time of ovulation, which is typically 14 days before your next period."
+        for due, c in zip(is_due.tolist(), raw_cycle)
+    ]
+    return _batch_response({
+        "conceptionWindowStart": _iso(conception - window),
+        "conceptionWindowEnd": _iso(conception + window),
+        "probableConceptionDate": _iso(conception),
+        "confidenceLevel": confidence.tolist(),
+        "explanation": explanations,
+    }, format)
+
+
+@router.post("/pregnancy-week/batch")
+def get_pregnancy_week_batch(req: PregnancyWeekBatchRequest, format: BatchFormat = BatchFormat.COLUMNAR):
+    """
+    Columnar output carries `currentWeek` plus a `weekData` map keyed by week
+    number (each record once); NDJSON rows repeat `weekData` per item like the
+    single-item endpoint.
+    """
+    n = _batch_size(req.referenceDate)
+    parsed = []
+    for i, value in enumerate(req.referenceDate):
+        try:
+            parsed.append(datetime.strptime(value[:10], "%Y-%m-%d").date())
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date format at index {i}: {value}. Use YYYY-MM-DD.")
+    ref = _days(parsed)
+    today = _today64()
+    is_due = np.array([t == "DUE_DATE" for t in _broadcast(req.type, n, "type")], dtype=bool)
+
+    until_due = (ref - today).astype(np.int64)
+    since_lmp = (today - ref).astype(np.int64)
+    week = np.where(is_due, np.where(ref > today, MAX_WEEK - until_due // 7, MAX_WEEK), since_lmp // 7)
+    weeks = np.clip(week, MIN_WEEK, MAX_WEEK).tolist()
+
+    if format == BatchFormat.NDJSON:
+        return _batch_response({"currentWeek": weeks, "weekData": [WEEK_TABLE[w] for w in weeks]}, format)
+    return _batch_response(
+        {"currentWeek": weeks},
+        format,
+        extra={"weekData": {str(w): WEEK_TABLE[w] for w in sorted(set(weeks))}},
+    )
+
+
+# ================= FERTILITY CALENDAR =================
+# N future cycles from one request, built on the calculate_ovulation rules
+# (next period = start + cycle length, ovulation = next period - 14 days,
+# fertile window = 5 days before ovulation through ovulation day).
+# Irregular cycles use a range of cycle lengths: each date gets an earliest
+# and latest value, and the uncertainty grows with every projected cycle.
+
+MAX_CALENDAR_CYCLES = 24
+# Cycle-length spread (+/- days) assumed for irregular cycles without a range
+IRREGULAR_CYCLE_SPREAD = 4
+
+
+class FertilityCalendarRequest(BaseModel):
+    lastPeriod: date
+    cycleLength: int = Field(28, ge=15, le=90)
+    cycles: int = Field(12, ge=1, le=MAX_CALENDAR_CYCLES)
+    isIrregular: bool = False
+    cycleLengthMin: Optional[int] = Field(None, ge=15, le=90)
+    cycleLengthMax: Optional[int] = Field(None, ge=15, le=90)
+
+
+class FertilityCycle(BaseModel):
+    cycle: int
+    periodStart: date
+    periodStartEarliest: date
+    periodStartLatest: date
+    ovulationDate: date
+    ovulationEarliest: date
+    ovulationLatest: date
+    fertileWindowStart: date
+    fertileWindowEnd: date
+    nextPeriod: date
+    nextPeriodEarliest: date
+    nextPeriodLatest: date
+
+
+class FertilityCalendarResponse(BaseModel):
+    cycleLength: int
+    cycleLengthRange: List[int]
+    isIrregular: bool
+    cycles: List[FertilityCycle]
+
+
+def _cycle_range(req: FertilityCalendarRequest) -> Tuple[int, int]:
+    low = req.cycleLengthMin if req.cycleLengthMin is not None else req.cycleLength
+    high = req.cycleLengthMax if req.cycleLengthMax is not None else req.cycleLength
+    if req.isIrregular and req.cycleLengthMin is None and req.cycleLengthMax is None:
+        low, high = req.cycleLength - IRREGULAR_CYCLE_SPREAD, req.cycleLength + IRREGULAR_CYCLE_SPREAD
+    low, high = min(low, req.cycleLength), max(high, req.cycleLength)
+    return max(low, 15), high
+
+
+@lru_cache(maxsize=4096)
+def _project_cycles(last_period: date, cycle_length: int, n: int, low: int, high: int) -> bytes:
+    """Serialized calendar for the given inputs (vectorized over cycles, memoized)."""
+    k = np.arange(n, dtype=np.int64)
+    start = np.datetime64(last_period, "D")
+    lengths = np.array([cycle_length, low, high], dtype=np.int64)[:, None]
+
+    period_start = start + k * lengths               # rows: expected, earliest, latest
+    next_period = period_start + lengths
+    ovulation = next_period - LUTEAL_PHASE_DAYS
+    fertile_start = ovulation[1] - FERTILE_DAYS_BEFORE_OVULATION
+
+    columns = {
+        "periodStart": period_start[0], "periodStartEarliest": period_start[1], "periodStartLatest": period_start[2],
+        "ovulationDate": ovulation[0], "ovulationEarliest": ovulation[1], "ovulationLatest": ovulation[2],
+        "fertileWindowStart": fertile_start, "fertileWindowEnd": ovulation[2],
+        "nextPeriod": next_period[0], "nextPeriodEarliest": next_period[1], "nextPeriodLatest": next_period[2],
+    }
+    as_text = {name: np.datetime_as_string(values, unit="D").tolist() for name, values in columns.items()}
+    cycles = [
+        {"cycle": i + 1, **{name: values[i] for name, values in as_text.items()}}
+        for i in range(n)
+    ]
+    payload = {
+        "cycleLength": cycle_length,
+        "cycleLengthRange": [low, high],
+        "isIrregular": low != high,
+        "cycles": cycles,
+    }
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+@router.post("/ovulation/calendar", response_model=FertilityCalendarResponse)
+def project_fertility_calendar(req: FertilityCalendarRequest):
+    """
+    Ovulation dates, fertile windows and next periods for the next `cycles`
+    cycles. Cycle 1 matches /ovulation for the same lastPeriod and cycleLength.
+    """
+    low, high = _cycle_range(req)
+    body = _project_cycles(req.lastPeriod, req.cycleLength, req.cycles, low, high)
+    return Response(content=body, media_type="application/json")
@@ -1,13 +1,14 @@
 # modules/user_answers.py
 from typing import List, Tuple
 
-from supabase_client import supabase_insert
+from supabase_client import supabase_insert, supabase_upsert
 
+ANSWERS_TABLE = "sakhi_users_answer"
+# Rows per upsert request; larger submissions are written in chunks of this size
+ANSWER_BATCH_SIZE = 500
 
-def save_user_answer(user_id: str, question_key: str, selected_options: List[str]):
-    """
-    Save a single answer row to sakhi_users_answer.
-    """
+
+def _answer_row(user_id: str, question_key: str, selected_options: List[str]) -> dict:
     if not user_id:
         raise ValueError("user_id is required")
     if not question_key:
@@ -15,31 +16,57 @@ def save_user_answer(user_id: str, question_key: str, selected_options: List[str
     if not selected_options or not isinstance(selected_options, list):
         raise ValueError("selected_options must be a non-empty list of strings")
 
-    payload = {
+    return {
         "user_id": user_id,
         "question_key": question_key,
         "selected_options": selected_options,
     }
 
-    return supabase_insert("sakhi_users_answer", payload)
+
+def save_user_answer(user_id: str, question_key: str, selected_options: List[str]):
+    """
+    Save a single answer row to sakhi_users_answer.
+    """
+    return supabase_insert(ANSWERS_TABLE, _answer_row(user_id, question_key, selected_options))
 
 
 def save_bulk_answers(user_id: str, answers: List[dict]) -> Tuple[int, List]:
     """
     Save multiple answers for a user. Returns (saved_count, raw_results).
+
+    Rows are upserted on (user_id, question_key) (unique; see
+    all_bindings/migrations), one request per
+    ANSWER_BATCH_SIZE answers, so resubmitting replaces earlier answers
+    instead of duplicating them. raw_results has one entry per answer, in
+    order: the stored row, or {"question_key", "error"} if its chunk failed.
     """
     if not answers:
         raise ValueError("answers cannot be empty")
 
-    saved = 0
-    results = []
-
+    # Validate everything before writing anything; a repeated question_key
+    # keeps its last answer (one upsert cannot touch the same row twice).
+    rows = {}
     for answer in answers:
-        q_key = answer.get("question_key")
-        opts = answer.get("selected_options")
+        row = _answer_row(user_id, answer.get("question_key"), answer.get("selected_options"))
+        rows.pop(row["question_key"], None)
+        rows[row["question_key"]] = row
+
+    stored = {}
+    last_error = None
+    pending = list(rows.values())
+    for start in range(0, len(pending), ANSWER_BATCH_SIZE):
+        chunk = pending[start:start + ANSWER_BATCH_SIZE]
+        try:
+            for result in supabase_upsert(ANSWERS_TABLE, chunk, on_conflict="user_id,question_key"):
+                stored[result.get("question_key")] = result
+        except Exception as e:
+            last_error = e
+            for row in chunk:
+                stored[row["question_key"]] = {"question_key": row["question_key"], "error": str(e)}
 
-        result = save_user_answer(user_id, q_key, opts)
-        results.append(result)
-        saved += 1
+    saved = sum(1 for result in stored.values() if "error" not in result)
+    if not saved and last_error is not None:
+        raise last_error
 
+    results = [stored.get(answer["question_key"], rows[answer["question_key"]]) for answer in answers]
     return saved, results
@@ -1,5 +1,6 @@
 # modules/user_profile.py
 import re
+from typing import Optional, TypedDict
 
 from supabase_client import (
     generate_user_id,
@@ -7,6 +8,40 @@ from supabase_client import (
     supabase_select,
     supabase_update,
 )
+from modules.session_tokens import revoke_sessions
+
+
+# Column projections for sakhi_users reads. Callers ask for the view they need
+# instead of select="*", which also pulls the context JSON and password_hash.
+CHAT_IDENTITY_COLUMNS = "user_id,name,gender,location,preferred_language"
+PROFILE_COLUMNS = (
+    "user_id,name,email,phone_number,role,preferred_language,relation_to_patient,"
+    "gender,location,rewards,sakhi_journey_stage,sakhi_journey_date,sakhi_journey_date_type"
+)
+REWARDS_COLUMNS = "rewards"
+# Login also reads password_hash to check it; it is never returned
+LOGIN_COLUMNS = f"{PROFILE_COLUMNS},password_hash"
+
+
+class ChatIdentity(TypedDict, total=False):
+    """What a chat turn needs: who the user is and whether onboarding is done."""
+    user_id: str
+    name: Optional[str]
+    gender: Optional[str]
+    location: Optional[str]
+    preferred_language: Optional[str]
+
+
+class UserProfile(ChatIdentity, total=False):
+    """The user's profile as returned to clients (no password_hash or context)."""
+    email: Optional[str]
+    phone_number: Optional[str]
+    role: Optional[str]
+    relation_to_patient: Optional[str]
+    rewards: Optional[int]
+    sakhi_journey_stage: Optional[str]
+    sakhi_journey_date: Optional[str]
+    sakhi_journey_date_type: Optional[str]
 
 
 def _normalize_phone(phone: str | None) -> str | None:
@@ -73,14 +108,16 @@ def update_preferred_language(user_id: str, preferred_language: str):
     if not preferred_language:
         raise ValueError("preferred_language is required")
     match = f"user_id=eq.{user_id}"
-    return supabase_update("sakhi_users", match, {"preferred_language": preferred_language})
+    updated = supabase_update("sakhi_users", match, {"preferred_language": preferred_language})
+    revoke_sessions(user_id)
+    return updated
 
 
-def get_user_profile(user_id: str):
+def get_user_profile(user_id: str, columns: str = PROFILE_COLUMNS) -> Optional[UserProfile]:
     """
-    Fetch complete user profile.
+    Fetch the user profile (PROFILE_COLUMNS unless another projection is given).
     """
-    rows = supabase_select("sakhi_users", select="*", filters=f"user_id=eq.{user_id}")
+    rows = supabase_select("sakhi_users", select=columns, filters=f"user_id=eq.{user_id}")
 
     if not rows or not isinstance(rows, list):
         return None
@@ -88,7 +125,7 @@ def get_user_profile(user_id: str):
     return rows[0]
 
 
-def get_user_by_phone(phone_number: str):
+def get_user_by_phone(phone_number: str, columns: str = PROFILE_COLUMNS) -> Optional[UserProfile]:
     """
     Fetch user by phone_number (or phone).
     """
@@ -98,14 +135,23 @@ def get_user_by_phone(phone_number: str):
     if not norm:
         return None
     # try phone_number first
-    rows = supabase_select("sakhi_users", select="*", filters=f"phone_number=eq.{norm}")
+    rows = supabase_select("sakhi_users", select=columns, filters=f"phone_number=eq.{norm}")
     if rows and isinstance(rows, list) and rows:
         return rows[0]
     return None
 
 
+def get_chat_identity(user_id: str | None = None, phone_number: str | None = None) -> Optional[ChatIdentity]:
+    """
+    Fetch only what a chat turn needs (CHAT_IDENTITY_COLUMNS), by user_id or phone.
+    """
+    if user_id:
+        return get_user_profile(user_id, columns=CHAT_IDENTITY_COLUMNS)
+    return get_user_by_phone(phone_number, columns=CHAT_IDENTITY_COLUMNS)
+
+
 def resolve_user_id_by_phone(phone_number: str) -> str | None:
-    user = get_user_by_phone(phone_number)
+    user = get_user_by_phone(phone_number, columns="user_id")
     if user:
         return user.get("user_id")
     return None
@@ -140,13 +186,16 @@ def update_user_profile(user_id: str, updates: dict):
         raise ValueError("user_id is required")
     
     match = f"user_id=eq.{user_id}"
-    return supabase_update("sakhi_users", match, updates)
+    updated = supabase_update("sakhi_users", match, updates)
+    # Session tokens carry name/gender/location/language; make clients refresh
+    revoke_sessions(user_id)
+    return updated
 
 
 def login_user(email: str, password: str):
     """
     Authenticate user by email and password.
-    Returns user profile if credentials are valid, None otherwise.
+    Returns the user profile (without password_hash) if credentials are valid, None otherwise.
     
     Args:
         email: User's email address
@@ -164,7 +213,7 @@ def login_user(email: str, password: str):
         raise ValueError("password is required")
     
     # Fetch user by email
-    rows = supabase_select("sakhi_users", select="*", filters=f"email=eq.{email}")
+    rows = supabase_select("sakhi_users", select=LOGIN_COLUMNS, filters=f"email=eq.{email}")
     
     if not rows or not isinstance(rows, list) or len(rows) == 0:
         return None
@@ -177,6 +226,7 @@ def login_user(email: str, password: str):
     
     if stored_password != password:
         return None
+    user.pop("password_hash", None)
     
     # Authentication successful
     return user
@@ -0,0 +1,331 @@
+# resilience.py
+"""
+Timeouts, retries, circuit breakers and bulkheads for database calls.
+
+Every Supabase / PostgREST call (the supabase_client helpers and direct
+supabase-py queries) runs through Resilience:
+
+- Deadline: each operation has a total budget (STORAGE_DEADLINE_SECONDS);
+  every attempt gets a read timeout capped by what is left of it. Calls that
+  take no timeout of their own (client_attempt) are abandoned when it passes.
+- Retries: transient failures (timeouts, connection errors, 429/5xx) are
+  retried with full-jitter exponential backoff. Retrying after the request
+  reached the server is opt-in (idempotent=True, for reads and writes that
+  are safe to repeat); everything else, RPCs and PATCHes included, is only
+  retried when the request never got there. The async path backs off with
+  asyncio.sleep.
+- Circuit breaker per table / RPC: after BREAKER_FAILURE_THRESHOLD
+  consecutive transient failures calls fail fast for BREAKER_RESET_SECONDS,
+  then a single probe decides whether to close it again.
+- Bulkheads: a concurrency limit per pool (REST, RPC, supabase-py client)
+  so one slow dependency cannot take every worker thread.
+
+State is exposed through stats() (served at /metrics/storage).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-attempt connect / read timeouts (seconds)
+STORAGE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("STORAGE_CONNECT_TIMEOUT_SECONDS", "3.05"))
+STORAGE_READ_TIMEOUT_SECONDS = float(os.getenv("STORAGE_READ_TIMEOUT_SECONDS", "10"))
+
+# Total budget for one operation, retries and backoff included (seconds)
+STORAGE_DEADLINE_SECONDS = float(os.getenv("STORAGE_DEADLINE_SECONDS", "15"))
+
+# Retries after the first attempt
+STORAGE_MAX_RETRIES = int(os.getenv("STORAGE_MAX_RETRIES", "2"))
+
+# Backoff before retry n: uniform(0, min(cap, base * 2**n))
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_CAP_SECONDS = 2.0
+
+# Consecutive transient failures that open a breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("STORAGE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("STORAGE_BREAKER_RESET_SECONDS", "30"))
+
+# Concurrent calls per pool
+BULKHEAD_LIMITS = {
+    "rest": int(os.getenv("STORAGE_REST_CONCURRENCY", "32")),
+    "rpc": int(os.getenv("STORAGE_RPC_CONCURRENCY", "8")),
+    "client": int(os.getenv("STORAGE_CLIENT_CONCURRENCY", "16")),
+}
+
+
+class ResilienceError(Exception):
+    """Base class for failures raised by the resilience layer."""
+
+
+class TransientError(ResilienceError):
+    """
+    A failure worth retrying. sent=False means the request never reached the
+    server (connect failure), so even non-idempotent calls may be retried.
+    """
+
+    def __init__(self, message: str, sent: bool = True):
+        super().__init__(message)
+        self.sent = sent
+
+
+class CircuitOpen(ResilienceError):
+    """The breaker for this table / RPC is open; the call was not attempted."""
+
+
+class BulkheadFull(ResilienceError):
+    """No slot in the pool freed up before the deadline."""
+
+
+class DeadlineExceeded(ResilienceError):
+    """The operation's time budget ran out."""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe -> closed."""
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def before_call(self, key: str) -> None:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "open" or (self.state == "half_open" and self._probing):
+                self.rejected += 1
+                raise CircuitOpen(f"Circuit open for {key}")
+            if self.state == "half_open":
+                self._probing = True
+            self.calls += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """End a half-open probe without a verdict (the call never ran)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, key: str) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.consecutive_failures >= self.threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened for {key} after {self.consecutive_failures} failures")
+                    self.opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
+class Bulkhead:
+    """A bounded pool of concurrent calls."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self, deadline: float):
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFull(f"All {self.limit} slots busy")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+def backoff_delay(retry: int) -> float:
+    """Full-jitter exponential backoff for the given retry number (0-based)."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * (2 ** retry)))
+
+
+# Runs client_attempt calls. A call abandoned at its timeout keeps its thread
+# until it returns; calls still queued behind those are cancelled instead.
+_attempt_executor = ThreadPoolExecutor(max_workers=sum(BULKHEAD_LIMITS.values()), thread_name_prefix="storage-attempt")
+
+
+def client_attempt(fn: Callable[[], Any]) -> Callable[[float], Any]:
+    """
+    Adapt a blocking client call that takes no timeout of its own (e.g. a
+    supabase-py lambda: query.execute()) for Resilience.call. The call runs on
+    a worker thread and is abandoned when the per-attempt timeout passes.
+    Transport errors (httpx, requests) become TransientError.
+    """
+    def attempt(timeout: float):
+        future = _attempt_executor.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Never started (cancelled in the queue) means it was never sent
+            raise TransientError(f"No response within {timeout:.1f}s", sent=not future.cancel())
+        except Exception as e:
+            module = type(e).__module__.split(".")[0]
+            if isinstance(e, (TimeoutError, ConnectionError)) or module in ("httpx", "httpcore", "requests", "urllib3"):
+                raise TransientError(str(e), sent=not type(e).__name__.startswith("Connect")) from e
+            raise
+    return attempt
+
+
+class Resilience:
+    """Runs operations under a deadline, retry policy, breaker and bulkhead."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._bulkheads = {pool: Bulkhead(limit) for pool, limit in BULKHEAD_LIMITS.items()}
+        self._lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker()
+            return self._breakers[key]
+
+    def _attempt(self, key: str, fn: Callable[[float], Any], pool: str, deadline: float) -> Any:
+        breaker = self.breaker(key)
+        breaker.before_call(key)
+        try:
+            with self._bulkheads[pool].slot(deadline):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"{key}: deadline exceeded")
+                result = fn(min(STORAGE_READ_TIMEOUT_SECONDS, remaining))
+        except TransientError:
+            breaker.record_failure(key)
+            raise
+        except (BulkheadFull, DeadlineExceeded):
+            # Not the dependency's fault; release a half-open probe untouched
+            breaker.release_probe()
+            raise
+        except Exception:
+            # The server answered (e.g. a 4xx): the dependency is healthy
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    def _next_delay(self, key: str, error: TransientError, retry: int, idempotent: bool, deadline: float) -> Optional[float]:
+        if retry >= STORAGE_MAX_RETRIES or not (idempotent or not error.sent):
+            return None
+        delay = backoff_delay(retry)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self.breaker(key).retries += 1
+        logger.info(f"Retrying {key} in {delay:.2f}s after: {error}")
+        return delay
+
+    def call(
+        self,
+        key: str,
+        fn: Callable[[float], Any],
+        pool: str = "rest",
+        idempotent: bool = False,
+        deadline_seconds: Optional[float] = None,
+    ) -> Any:
+        """
+        Run fn(timeout) for the table / RPC named by key. fn raises
+        TransientError for failures worth retrying. Pass idempotent=True only
+        when repeating a call the server may already have applied is safe.
+        """
+        deadline = time.monotonic() + (deadline_seconds or STORAGE_DEADLINE_SECONDS)
+        retry = 0
+        while True:
+            try:
+                return self._attempt(key, fn, pool, deadline)
+            except TransientError as e:
+                delay = self._next_delay(key, e, retry, idempotent, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            retry += 1
+
+    async def acall(
+        self,
+        key: str,
+        fn: Callable[[float], Any],
+        pool: str = "rest",
+        idempotent: bool = False,
+        deadline_seconds: Optional[float] = None,
+    ) -> Any:
+        """call() for async code: attempts run in a worker thread, backoff on the event loop."""
+        deadline = time.monotonic() + (deadline_seconds or STORAGE_DEADLINE_SECONDS)
+        retry = 0
+        while True:
+            try:
+                return await asyncio.to_thread(self._attempt, key, fn, pool, deadline)
+            except TransientError as e:
+                delay = self._next_delay(key, e, retry, idempotent, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            retry += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "breakers": {key: breaker.stats() for key, breaker in sorted(breakers.items())},
+            "bulkheads": {pool: bulkhead.stats() for pool, bulkhead in self._bulkheads.items()},
+        }
+
+
+_resilience_instance = None
+
+
+def get_resilience() -> Resilience:
+    """
+    Get or create a singleton Resilience instance.
+
+    Returns:
+        Resilience instance
+    """
+    global _resilience_instance
+    if _resilience_instance is None:
+        _resilience_instance = Resilience()
+    return _resilience_instance
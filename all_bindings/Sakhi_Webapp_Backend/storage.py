@@ -0,0 +1,599 @@
+# storage.py
+"""
+Storage backends behind the supabase_client helpers.
+
+Every module talks to the database through supabase_insert / supabase_select /
+supabase_update / supabase_upsert / supabase_delete / supabase_rpc, using
+PostgREST filter strings ("user_id=eq.<id>&order=created_at.desc"). Those
+helpers delegate to the backend chosen by STORAGE_BACKEND:
+
+- supabase (default): PostgREST over HTTP, under the deadline / retry /
+  circuit-breaker policy in resilience.py.
+- sqlite: an embedded SQLite file (SQLITE_PATH). Tables and columns are
+  created on first write, filter strings are translated to SQL, and the
+  vector RPCs (match_faq, match_sakhi_kb, hierarchical_search) are answered
+  locally with NumPy cosine similarity over the stored embeddings. Use it to
+  run the service, benchmarks and scripts offline.
+
+The SQLite backend covers the PostgREST subset this codebase uses: eq, neq,
+gt, gte, lt, lte, like, ilike, in, is (optionally negated with not.), plus
+order, limit and offset. like/ilike keep Postgres semantics (`*` or `%` for
+any run, `_` for one character, backslash escapes; like is case-sensitive).
+Anything else, including or=/and= groups, raises ValueError rather than being
+ignored. Modules that use the supabase-py client directly (stories, knowledge
+hub) still need Supabase.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote
+
+import numpy as np
+import requests
+
+from resilience import STORAGE_CONNECT_TIMEOUT_SECONDS, TransientError, get_resilience
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "supabase" or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "sakhi_local.db")
+
+# Vector RPCs answered locally by SQLiteBackend: table and returned columns
+LOCAL_VECTOR_RPCS = {
+    "match_sakhi_kb": ("sakhi_bot_knowledge", ("id", "title", "content")),
+    "match_faq": ("faq", ("id", "question", "answer", "youtube_link")),
+    "hierarchical_search": ("section_chunks", ("id", "header_path", "section_content")),
+}
+EMBEDDING_COLUMN = "embedding"
+
+Rows = List[Dict[str, Any]]
+Condition = Tuple[str, str, Any, bool]  # (column, operator, value, negated)
+
+_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+class StorageError(Exception):
+    """Raised by a backend when a read or write fails."""
+
+
+class Query:
+    """A parsed PostgREST query string: conditions, ordering and paging."""
+
+    def __init__(self):
+        self.conditions: List[Condition] = []
+        self.order: List[Tuple[str, bool]] = []  # (column, descending)
+        self.limit: Optional[int] = None
+        self.offset: Optional[int] = None
+
+
+def parse_filters(filters: str) -> Query:
+    """
+    Parse "col=op.value&..." into a Query.
+
+    Examples: "user_id=eq.42", "content_hash=in.(a,b)", "status=not.is.null",
+    "question_key=like.bench_*", "order=created_at.desc,id", "offset=100".
+    """
+    query = Query()
+    for part in (filters or "").split("&"):
+        if not part:
+            continue
+        key, _, raw = part.partition("=")
+        key, raw = unquote(key), unquote(raw)
+        if key in ("or", "and", "not.or", "not.and"):
+            raise ValueError(f"Unsupported filter group: {part}")
+        if key == "order":
+            for term in raw.split(","):
+                column, *modifiers = term.split(".")
+                query.order.append((column, "desc" in modifiers))
+        elif key in ("limit", "offset"):
+            setattr(query, key, int(raw))
+        elif key != "select":
+            negated = raw.startswith("not.")
+            if negated:
+                raw = raw[4:]
+            op, _, value = raw.partition(".")
+            if op == "in":
+                value = [v.strip().strip('"') for v in value.strip("()").split(",") if v.strip()]
+            elif op not in _OPERATORS and op not in ("like", "ilike", "is"):
+                raise ValueError(f"Unsupported filter operator: {part}")
+            query.conditions.append((key, op, value, negated))
+    return query
+
+
+class StorageBackend(abc.ABC):
+    """The operations the supabase_client helpers delegate to."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def insert(self, table: str, data: Union[Dict[str, Any], Rows]) -> Rows:
+        ...
+
+    @abc.abstractmethod
+    def select(self, table: str, select: str = "*", filters: str = "", limit: Optional[int] = None) -> Rows:
+        ...
+
+    @abc.abstractmethod
+    def update(self, table: str, match: str, data: Dict[str, Any], idempotent: bool = False) -> Rows:
+        ...
+
+    @abc.abstractmethod
+    def upsert(self, table: str, rows: Rows, on_conflict: str) -> Rows:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, table: str, match: str) -> Rows:
+        ...
+
+    @abc.abstractmethod
+    def rpc(self, function_name: str, params: Dict[str, Any], idempotent: bool = False) -> Any:
+        ...
+
+    async def async_select(self, table: str, select: str = "*", filters: str = "", limit: Optional[int] = None) -> Rows:
+        return await asyncio.to_thread(self.select, table, select, filters, limit)
+
+    async def async_rpc(self, function_name: str, params: Dict[str, Any], idempotent: bool = False) -> Any:
+        return await asyncio.to_thread(self.rpc, function_name, params, idempotent)
+
+
+class SupabaseBackend(StorageBackend):
+    """
+    PostgREST over HTTP. Every request runs under the resilience policy:
+    a deadline, jittered retries, a breaker per table / RPC and a bulkhead.
+    Selects, upserts and deletes are retried as idempotent; updates and RPCs
+    only when the caller says they are safe to repeat.
+    """
+
+    name = "supabase"
+
+    def __init__(self, url: str, service_role_key: str):
+        self.url = url
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation",
+        }
+
+    def _operation(
+        self,
+        action: str,
+        method: str,
+        path: str,
+        key: str,
+        json_body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Callable[[float], Any]:
+        """One attempt of an HTTP call, as a function of its read timeout."""
+        url = f"{self.url}/rest/v1/{path}"
+
+        def attempt(timeout: float):
+            try:
+                resp = requests.request(
+                    method, url, headers=headers or self.headers, json=json_body,
+                    timeout=(STORAGE_CONNECT_TIMEOUT_SECONDS, timeout),
+                )
+            except requests.exceptions.ConnectTimeout as e:
+                raise TransientError(f"Supabase {action} on {key} failed: {e}", sent=False) from e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise TransientError(f"Supabase {action} on {key} failed: {e}") from e
+            if resp.status_code == 429 or resp.status_code >= 500:
+                raise TransientError(f"Supabase {action} failed: {resp.status_code} - {resp.text}")
+            if resp.status_code >= 300:
+                raise StorageError(f"Supabase {action} failed: {resp.status_code} - {resp.text}")
+            return resp.json()
+
+        return attempt
+
+    def _run(self, key: str, attempt: Callable[[float], Any], idempotent: bool = False, pool: str = "rest"):
+        return get_resilience().call(key, attempt, pool=pool, idempotent=idempotent)
+
+    def insert(self, table, data):
+        return self._run(table, self._operation("insert", "POST", table, table, data))
+
+    def select(self, table, select="*", filters="", limit=None):
+        return self._run(table, self._select_operation(table, select, filters, limit), idempotent=True)
+
+    def _select_operation(self, table, select, filters, limit):
+        query = f"{table}?select={select}"
+        if filters:
+            query = f"{query}&{filters}"
+        if limit:
+            query = f"{query}&limit={limit}"
+        return self._operation("select", "GET", query, table)
+
+    def update(self, table, match, data, idempotent=False):
+        return self._run(table, self._operation("update", "PATCH", f"{table}?{match}", table, data), idempotent=idempotent)
+
+    def upsert(self, table, rows, on_conflict):
+        if not rows:
+            return []
+        headers = {**self.headers, "Prefer": "return=representation,resolution=merge-duplicates"}
+        return self._run(
+            table, self._operation("upsert", "POST", f"{table}?on_conflict={on_conflict}", table, rows, headers),
+            idempotent=True,
+        )
+
+    def delete(self, table, match):
+        return self._run(table, self._operation("delete", "DELETE", f"{table}?{match}", table), idempotent=True)
+
+    def rpc(self, function_name, params, idempotent=False):
+        key = f"rpc:{function_name}"
+        return self._run(
+            key, self._operation("rpc", "POST", f"rpc/{function_name}", key, params or {}), idempotent=idempotent, pool="rpc"
+        )
+
+    async def async_select(self, table, select="*", filters="", limit=None):
+        return await get_resilience().acall(table, self._select_operation(table, select, filters, limit), idempotent=True)
+
+    async def async_rpc(self, function_name, params, idempotent=False):
+        key = f"rpc:{function_name}"
+        return await get_resilience().acall(
+            key, self._operation("rpc", "POST", f"rpc/{function_name}", key, params or {}), pool="rpc", idempotent=idempotent
+        )
+
+
+def _like_pattern(value: str) -> str:
+    """PostgREST like pattern to SQL LIKE: `*` is an alias for `%`, `\\` escapes."""
+    out, escaped = [], False
+    for ch in value:
+        if escaped:
+            out.append("\\" + ch)
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        else:
+            out.append("%" if ch == "*" else ch)
+    if escaped:
+        out.append("\\\\")
+    return "".join(out)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    if isinstance(value, (dict, list, tuple)):
+        return "JSON"
+    if value is None:
+        return ""
+    return "TEXT"
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded SQLite store with the same call surface as SupabaseBackend.
+
+    Every table gets an integer id and a created_at timestamp when rows
+    don't supply them, like the Supabase defaults. Dicts and lists are stored
+    as JSON text and decoded on read.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Postgres LIKE is case-sensitive; ilike lower-cases both sides instead
+        self._conn.execute("PRAGMA case_sensitive_like=ON")
+        self._lock = threading.RLock()
+        self._columns: Dict[str, Dict[str, str]] = {}
+        # Bumped on every write; invalidates the cached embedding matrices
+        self._versions: Dict[str, int] = {}
+        self._matrices: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+
+    # ---------- schema ----------
+
+    def _table_columns(self, table: str) -> Dict[str, str]:
+        if table not in self._columns:
+            info = self._conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+            self._columns[table] = {row["name"]: (row["type"] or "").upper() for row in info}
+        return self._columns[table]
+
+    def _ensure_columns(self, table: str, rows: Rows) -> None:
+        columns = self._table_columns(table)
+        if not columns:
+            self._conn.execute(
+                f"CREATE TABLE {_quote(table)} (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT)"
+            )
+            columns.update({"id": "INTEGER", "created_at": "TEXT"})
+        for row in rows:
+            for name, value in row.items():
+                if name not in columns:
+                    declared = next((_column_type(r[name]) for r in rows if r.get(name) is not None), "")
+                    self._conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(name)} {declared}")
+                    columns[name] = declared
+
+    def _touch(self, table: str) -> None:
+        self._versions[table] = self._versions.get(table, 0) + 1
+
+    def _decode(self, table: str, row: sqlite3.Row) -> Dict[str, Any]:
+        columns = self._table_columns(table)
+        out = {}
+        for name in row.keys():
+            value = row[name]
+            declared = columns.get(name, "")
+            if value is not None and declared == "BOOLEAN":
+                value = bool(value)
+            elif isinstance(value, str) and (declared == "JSON" or (not declared and value[:1] in "[{")):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            out[name] = value
+        return out
+
+    # ---------- filters ----------
+
+    def _where(self, table: str, query: Query) -> Tuple[str, List[Any]]:
+        columns = self._table_columns(table)
+        clauses, params = [], []
+        for column, op, value, negated in query.conditions:
+            # Unknown columns behave like NULL instead of raising
+            target = _quote(column) if column in columns else "NULL"
+            declared = columns.get(column, "")
+
+            def typed(v):
+                if declared == "BOOLEAN" and v in ("true", "false"):
+                    return 1 if v == "true" else 0
+                return v
+
+            if op == "in":
+                clause = f"{target} IN ({','.join('?' * len(value))})" if value else "0"
+                params.extend(typed(v) for v in value)
+            elif op == "is":
+                literal = {"null": "NULL", "true": "1", "false": "0"}.get(value.lower())
+                if literal is None:
+                    raise ValueError(f"Unsupported is. value: {value}")
+                clause = f"{target} IS {literal}"
+            elif op == "like":
+                clause = f"{target} LIKE ? ESCAPE '\\'"
+                params.append(_like_pattern(value))
+            elif op == "ilike":
+                clause = f"LOWER({target}) LIKE LOWER(?) ESCAPE '\\'"
+                params.append(_like_pattern(value))
+            else:
+                clause = f"{target} {_OPERATORS[op]} ?"
+                params.append(typed(value))
+            clauses.append(f"NOT ({clause})" if negated else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select_rows(self, table: str, query: Query, rowids_only: bool = False) -> list:
+        if not self._table_columns(table):
+            return []
+        where, params = self._where(table, query)
+        sql = f"SELECT {'rowid' if rowids_only else '*'} FROM {_quote(table)}{where}"
+        columns = self._table_columns(table)
+        order = [f"{_quote(c)} {'DESC' if desc else 'ASC'}" for c, desc in query.order if c in columns]
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        if query.limit is not None or query.offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [query.limit if query.limit is not None else -1, query.offset or 0]
+        return self._conn.execute(sql, params).fetchall()
+
+    def _by_rowids(self, table: str, rowids: List[int]) -> Rows:
+        if not rowids:
+            return []
+        rows = self._conn.execute(
+            f"SELECT rowid AS _rowid, * FROM {_quote(table)} WHERE rowid IN ({','.join('?' * len(rowids))})", rowids
+        ).fetchall()
+        by_id = {row["_rowid"]: row for row in rows}
+        out = []
+        for rowid in rowids:
+            if rowid in by_id:
+                decoded = self._decode(table, by_id[rowid])
+                decoded.pop("_rowid", None)
+                out.append(decoded)
+        return out
+
+    # ---------- operations ----------
+
+    def insert(self, table, data):
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return []
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [{"created_at": now, **row} for row in rows]
+        with self._lock, self._conn:
+            self._ensure_columns(table, rows)
+            rowids = []
+            for row in rows:
+                names = list(row)
+                cursor = self._conn.execute(
+                    f"INSERT INTO {_quote(table)} ({','.join(map(_quote, names))}) VALUES ({','.join('?' * len(names))})",
+                    [_encode(row[n]) for n in names],
+                )
+                rowids.append(cursor.lastrowid)
+            self._touch(table)
+            return self._by_rowids(table, rowids)
+
+    def select(self, table, select="*", filters="", limit=None):
+        query = parse_filters(filters)
+        if limit:
+            query.limit = limit
+        with self._lock:
+            rows = [self._decode(table, row) for row in self._select_rows(table, query)]
+        fields = [f.strip() for f in (select or "*").split(",") if f.strip()]
+        if "*" in fields:
+            return rows
+        return [{f: row.get(f) for f in fields} for row in rows]
+
+    def update(self, table, match, data, idempotent=False):
+        query = parse_filters(match)
+        with self._lock, self._conn:
+            if not self._table_columns(table):
+                return []
+            rowids = [row[0] for row in self._select_rows(table, query, rowids_only=True)]
+            if rowids and data:
+                self._ensure_columns(table, [data])
+                names = list(data)
+                self._conn.execute(
+                    f"UPDATE {_quote(table)} SET {','.join(f'{_quote(n)} = ?' for n in names)} "
+                    f"WHERE rowid IN ({','.join('?' * len(rowids))})",
+                    [_encode(data[n]) for n in names] + rowids,
+                )
+                self._touch(table)
+            return self._by_rowids(table, rowids)
+
+    def upsert(self, table, rows, on_conflict):
+        if not rows:
+            return []
+        keys = [k.strip() for k in on_conflict.split(",")]
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._ensure_columns(table, rows + [{k: None for k in keys}])
+            index = _quote(f"uq_{table}_{'_'.join(keys)}")
+            self._conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {_quote(table)} ({','.join(map(_quote, keys))})"
+            )
+            rowids = []
+            for row in rows:
+                # created_at is only set on insert unless the caller supplies it
+                updates = [n for n in row if n not in keys] or keys[:1]
+                full = {"created_at": now, **row}
+                names = list(full)
+                self._conn.execute(
+                    f"INSERT INTO {_quote(table)} ({','.join(map(_quote, names))}) VALUES ({','.join('?' * len(names))}) "
+                    f"ON CONFLICT ({','.join(map(_quote, keys))}) DO UPDATE SET "
+                    + ",".join(f"{_quote(n)} = excluded.{_quote(n)}" for n in updates),
+                    [_encode(full[n]) for n in names],
+                )
+                found = self._conn.execute(
+                    f"SELECT rowid FROM {_quote(table)} WHERE " + " AND ".join(f"{_quote(k)} IS ?" for k in keys),
+                    [_encode(row.get(k)) for k in keys],
+                ).fetchone()
+                if found:
+                    rowids.append(found[0])
+            self._touch(table)
+            return self._by_rowids(table, rowids)
+
+    def delete(self, table, match):
+        query = parse_filters(match)
+        with self._lock, self._conn:
+            if not self._table_columns(table):
+                return []
+            rowids = [row[0] for row in self._select_rows(table, query, rowids_only=True)]
+            deleted = self._by_rowids(table, rowids)
+            if rowids:
+                self._conn.execute(
+                    f"DELETE FROM {_quote(table)} WHERE rowid IN ({','.join('?' * len(rowids))})", rowids
+                )
+                self._touch(table)
+            return deleted
+
+    def rpc(self, function_name, params, idempotent=False):
+        if function_name not in LOCAL_VECTOR_RPCS:
+            raise StorageError(f"RPC {function_name} has no local implementation")
+        table, fields = LOCAL_VECTOR_RPCS[function_name]
+        params = params or {}
+        return self.vector_search(
+            table,
+            params["query_embedding"],
+            match_count=int(params.get("match_count") or 5),
+            match_threshold=params.get("match_threshold"),
+            fields=fields,
+        )
+
+    # ---------- vector search ----------
+
+    def _embedding_matrix(self, table: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rowids, unit-normalized float32 embeddings), rebuilt after writes."""
+        version = self._versions.get(table, 0)
+        cached = self._matrices.get(table)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+        rowids, vectors = [], []
+        if EMBEDDING_COLUMN in self._table_columns(table):
+            for rowid, raw in self._conn.execute(
+                f"SELECT rowid, {_quote(EMBEDDING_COLUMN)} FROM {_quote(table)} WHERE {_quote(EMBEDDING_COLUMN)} IS NOT NULL"
+            ):
+                rowids.append(rowid)
+                vectors.append(json.loads(raw) if isinstance(raw, str) else raw)
+        ids = np.asarray(rowids, dtype=np.int64)
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        if len(matrix):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        self._matrices[table] = (version, ids, matrix)
+        return ids, matrix
+
+    def vector_search(
+        self,
+        table: str,
+        query_embedding: List[float],
+        match_count: int = 5,
+        match_threshold: Optional[float] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> Rows:
+        """Top match_count rows by cosine similarity, each with a "similarity" key."""
+        with self._lock:
+            ids, matrix = self._embedding_matrix(table)
+            if not len(ids) or match_count <= 0:
+                return []
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1
+            similarity = matrix @ query
+            top = np.argsort(-similarity)[:match_count]
+            if match_threshold is not None:
+                top = top[similarity[top] >= float(match_threshold)]
+            rows = self._by_rowids(table, ids[top].tolist())
+        out = []
+        for row, score in zip(rows, similarity[top]):
+            picked = {f: row.get(f) for f in fields} if fields else {k: v for k, v in row.items() if k != EMBEDDING_COLUMN}
+            picked["similarity"] = float(score)
+            out.append(picked)
+        return out
+
+
+_storage_backend_instance = None
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Get or create a singleton StorageBackend instance (selected by STORAGE_BACKEND).
+
+    Returns:
+        StorageBackend instance
+    """
+    global _storage_backend_instance
+    if _storage_backend_instance is None:
+        if STORAGE_BACKEND == "sqlite":
+            _storage_backend_instance = SQLiteBackend(SQLITE_PATH)
+        elif STORAGE_BACKEND == "supabase":
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE")
+            if not url or not key:
+                raise Exception("Supabase environment variables missing")
+            _storage_backend_instance = SupabaseBackend(url, key)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+        logger.info(f"Storage backend: {_storage_backend_instance.name}")
+    return _storage_backend_instance
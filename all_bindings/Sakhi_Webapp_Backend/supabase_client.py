@@ -2,11 +2,9 @@
 
 import os
 import uuid
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Union
 
-import requests
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 # Ensure .env is loaded exactly once from this module
 _ENV_LOADED = False
@@ -22,35 +20,53 @@ def _ensure_env_loaded() -> None:
 
 _ensure_env_loaded()
 
+# Imported after .env is loaded so STORAGE_BACKEND / SQLITE_PATH are visible
+from storage import STORAGE_BACKEND, get_storage_backend  # noqa: E402
+from resilience import STORAGE_READ_TIMEOUT_SECONDS  # noqa: E402
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise Exception("Supabase environment variables missing")
+if STORAGE_BACKEND == "supabase":
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        raise Exception("Supabase environment variables missing")
+
+    HEADERS = {
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "Content-Type": "application/json",
+        "Prefer": "return=representation",
+    }
 
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation",
-}
+    from supabase import create_client, Client
+    from supabase.lib.client_options import ClientOptions
 
-from supabase.lib.client_options import ClientOptions
+    opts = ClientOptions().replace(
+        # Per attempt; retries and the overall deadline come from resilience.py
+        postgrest_client_timeout=STORAGE_READ_TIMEOUT_SECONDS,
+        storage_client_timeout=60,  # file uploads
+        schema="public",
+    )
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=opts)
+else:
+    # Local backend: code that uses the supabase-py client directly
+    # (stories, knowledge hub) is unavailable.
+    HEADERS = {}
+    supabase = None
 
-opts = ClientOptions().replace(
-    postgrest_client_timeout=60,  # 60 seconds
-    storage_client_timeout=60,
-    schema="public",
-)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=opts)
+_backend = get_storage_backend()
 
 
-def supabase_insert(table: str, data: Dict[str, Any]):
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
-    resp = requests.post(url, headers=HEADERS, json=data)
-    if resp.status_code >= 300:
-        raise Exception(f"Supabase insert failed: {resp.status_code} - {resp.text}")
-    return resp.json()
+def supabase_insert(table: str, data: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    return _backend.insert(table, data)
+
+
+def supabase_upsert(table: str, rows: List[Dict[str, Any]], on_conflict: str):
+    """
+    Bulk insert-or-update in one request. on_conflict names the unique
+    column(s) rows are matched on, e.g. "content_hash".
+    """
+    return _backend.upsert(table, rows, on_conflict)
 
 
 def supabase_select(
@@ -65,47 +81,53 @@ def supabase_select(
     Fetch rows from a table or call an RPC when rpc is provided.
     """
     if rpc:
-        url = f"{SUPABASE_URL}/rest/v1/rpc/{rpc}"
-        resp = requests.post(url, headers=HEADERS, json=payload or {})
-    else:
-        base_query = f"{SUPABASE_URL}/rest/v1/{table}?select={select}"
-        if filters:
-            base_query = f"{base_query}&{filters}"
-        if limit:
-            base_query = f"{base_query}&limit={limit}"
-        resp = requests.get(base_query, headers=HEADERS)
-
-    if resp.status_code >= 300:
-        raise Exception(f"Supabase select failed: {resp.status_code} - {resp.text}")
-    return resp.json()
-
-
-def supabase_update(table: str, match: str, data: Dict[str, Any]):
+        return _backend.rpc(rpc, payload or {})
+    return _backend.select(table, select=select, filters=filters, limit=limit)
+
+
+def supabase_update(table: str, match: str, data: Dict[str, Any], idempotent: bool = False):
     """
     match example: \"user_id=eq.<id>\"
+    idempotent=True lets a timed-out PATCH be retried; leave it off for
+    guarded or incrementing updates.
     """
-    url = f"{SUPABASE_URL}/rest/v1/{table}?{match}"
-    resp = requests.patch(url, headers=HEADERS, json=data)
-    if resp.status_code >= 300:
-        raise Exception(f"Supabase update failed: {resp.status_code} - {resp.text}")
-    return resp.json()
+    return _backend.update(table, match, data, idempotent=idempotent)
 
 
-def generate_user_id() -> str:
-    return str(uuid.uuid4())
+def supabase_delete(table: str, match: str):
+    """
+    match example: \"source=eq.<source>\"
+    """
+    return _backend.delete(table, match)
+
 
+async def async_supabase_select(
+    table: str,
+    select: str = "*",
+    filters: str = "",
+    limit: Optional[int] = None,
+):
+    """
+    supabase_select for async code: retries back off without blocking the event loop.
+    """
+    return await _backend.async_select(table, select=select, filters=filters, limit=limit)
 
-def supabase_rpc(function_name: str, params: Dict[str, Any]):
+
+async def async_supabase_rpc(function_name: str, params: Dict[str, Any], idempotent: bool = False):
     """
-    Call a Postgres function via Supabase RPC.
+    supabase_rpc for async code: retries back off without blocking the event loop.
     """
-    res = supabase.rpc(function_name, params=params).execute()
+    return await _backend.async_rpc(function_name, params, idempotent=idempotent)
+
 
-    # supabase-py returns data and possibly error on the response object
-    if hasattr(res, "error") and res.error:
-        raise Exception(f"Supabase RPC error: {res.error}")
+def generate_user_id() -> str:
+    return str(uuid.uuid4())
 
-    if hasattr(res, "data"):
-        return res.data
 
-    return res
+def supabase_rpc(function_name: str, params: Dict[str, Any], idempotent: bool = False):
+    """
+    Call a Postgres function via Supabase RPC (answered locally for the
+    vector search functions when STORAGE_BACKEND=sqlite). Pass idempotent=True
+    for read-only functions so timeouts are retried.
+    """
+    return _backend.rpc(function_name, params, idempotent=idempotent)
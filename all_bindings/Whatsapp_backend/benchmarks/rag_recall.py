@@ -0,0 +1,107 @@
+"""
+Offline evaluation: recall@k of vector, lexical and hybrid RAG retrieval.
+
+Runs hierarchical_rag_query in each mode over a labeled query set and reports
+the fraction of queries whose relevant chunks appear in the top k documents.
+Needs the same environment as the server (Supabase + OpenAI keys); the lexical
+mode alone only needs Supabase.
+
+The query set is JSONL, one query per line:
+
+    {"query": "AMH test ante enti?", "english": "What is an AMH test?",
+     "relevant": ["AMH", "Ovarian Reserve > Tests"]}
+
+`relevant` entries match a retrieved chunk when they equal its id or are a
+case-insensitive substring of its header_path. `english` (optional) is the
+translated query the vector side uses; `query` is the raw message.
+
+    python benchmarks/rag_recall.py benchmarks/rag_queries.example.jsonl [--k 4] [--modes vector,lexical,hybrid]
+        [--reranker none,lexical,cross_encoder]
+
+With --reranker, each mode is evaluated once per reranker (over-fetching
+RERANK_CANDIDATES and keeping min(k, RERANK_TOP_N)).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.reranker as reranker_module  # noqa: E402
+from modules.search_hierarchical import RETRIEVAL_MODES, hierarchical_rag_query  # noqa: E402
+
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(item: dict, labels: list) -> bool:
+    header_path = (item.get("header_path") or "").lower()
+    return any(
+        str(item.get("id")) == str(label) or str(label).lower() in header_path
+        for label in labels
+    )
+
+
+async def evaluate(queries: list, mode: str, k: int) -> dict:
+    hits = 0
+    reciprocal_ranks = 0.0
+    latencies = []
+    misses = []
+    for case in queries:
+        started = time.perf_counter()
+        results, _ = await hierarchical_rag_query(
+            case.get("english") or case["query"],
+            match_count=k,
+            mode=mode,
+            lexical_query=case["query"],
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        docs = [item for item in results if item.get("source_type") == "DOCUMENT"][:k]
+        rank = next((i for i, item in enumerate(docs) if is_relevant(item, case["relevant"])), None)
+        if rank is None:
+            misses.append(case["query"])
+        else:
+            hits += 1
+            reciprocal_ranks += 1.0 / (rank + 1)
+    n = len(queries) or 1
+    latencies.sort()
+    return {
+        "recall": hits / n,
+        "mrr": reciprocal_ranks / n,
+        "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "misses": misses,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("queries", help="labeled query set (JSONL)")
+    parser.add_argument("--k", type=int, default=4, help="documents per query (server default: 4)")
+    parser.add_argument("--modes", default=",".join(RETRIEVAL_MODES))
+    parser.add_argument("--reranker", default="none", help="comma-separated: none, lexical, cross_encoder")
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    print(f"{len(queries)} queries, k={args.k}\n")
+    print(f"{'mode':<10} {'reranker':<14} {'recall@k':>9} {'MRR':>7} {'p50 ms':>8}")
+    for kind in args.reranker.split(","):
+        reranker = reranker_module.Reranker(kind.strip())
+        if isinstance(reranker._scorer, reranker_module._CrossEncoderScorer):
+            reranker._scorer._get_model()  # load up front, not inside the first query's budget
+        reranker_module._reranker_instance = reranker
+        for mode in args.modes.split(","):
+            report = await evaluate(queries, mode.strip(), args.k)
+            print(f"{mode:<10} {kind:<14} {report['recall']:9.3f} {report['mrr']:7.3f} {report['p50_ms']:8.1f}")
+            if args.show_misses:
+                for query in report["misses"]:
+                    print(f"    miss: {query}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
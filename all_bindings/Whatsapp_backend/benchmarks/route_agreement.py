@@ -0,0 +1,193 @@
+"""
+Offline evaluation: raw-message routing vs. the translate-first pipeline.
+
+For each message, routes it the way the chat turn does now and the way it used
+to, then compares the two:
+
+- Now: score the raw message (Tinglish / Telugu messages, as detect_language
+  labels them, also against that language's anchors and thresholds). Below
+  ROUTE_CONFIDENCE_MARGIN, re-route on the translation.
+- Before (the baseline): translate_query first, then score the English text
+  with the English-only mean anchors and thresholds. This is the scorer every
+  turn used before the multilingual anchors existed; the fallback uses it too.
+
+Reports, per language, how often the two agree, how often the fallback was
+needed, the routing latency of each path and, when labeled, accuracy against
+the expected route. Needs the same OpenAI key as the server.
+
+--sweep re-scores the same embeddings with MULTILINGUAL_THRESHOLDS shifted by
+each offset, to tune them without further API calls.
+
+The message set is JSONL, one message per line:
+
+    {"message": "IVF cost entha avutundi?", "language": "tinglish", "expected": "slm_rag"}
+
+`language` groups the report (default "unlabeled"); `expected` (optional) is
+a Route value (slm_direct, slm_rag, openai_rag).
+
+    python benchmarks/route_agreement.py benchmarks/route_messages.example.jsonl [--margin 0.05] [--sweep] [--show-disagreements]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.model_gateway as model_gateway_module  # noqa: E402
+from modules.detect_lang import detect_language  # noqa: E402
+from modules.model_gateway import get_model_gateway  # noqa: E402
+from modules.translation_service import translate_query  # noqa: E402
+from rag import async_generate_embedding  # noqa: E402
+
+SWEEP_OFFSETS = (-0.10, -0.05, 0.0, 0.05, 0.10)
+
+
+def load_messages(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def embed_case(case: dict) -> dict:
+    """Translate and embed a message once; every scoring pass reuses the result."""
+    message = case["message"]
+
+    started = time.perf_counter()
+    english = await translate_query(message, target_lang="en")
+    english_vector = await async_generate_embedding(english)
+    translate_first_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    raw_vector = await async_generate_embedding(message)
+    raw_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "case": case,
+        "english": english,
+        "detected": detect_language(message),
+        "english_vector": english_vector,
+        "raw_vector": raw_vector,
+        "raw_ms": raw_ms,
+        "translate_first_ms": translate_first_ms,
+    }
+
+
+async def route_case(gateway, prepared: dict) -> dict:
+    # Baseline: English-only scoring of the translation (also the low-confidence fallback)
+    translated = await gateway.score_route(prepared["english"], query_vector=prepared["english_vector"])
+    raw = await gateway.score_route(
+        prepared["case"]["message"], query_vector=prepared["raw_vector"], language=prepared["detected"]
+    )
+    return {
+        **prepared,
+        "raw": raw,
+        "translated": translated,
+        "final": raw if raw.confident else translated,
+        # A fallback waits for the translation, as the translate-first path does
+        "final_ms": prepared["raw_ms"] if raw.confident else max(prepared["raw_ms"], prepared["translate_first_ms"]),
+    }
+
+
+def summarize(rows: list) -> dict:
+    n = len(rows)
+    labeled = [r for r in rows if r["case"].get("expected")]
+
+    def accuracy(key: str):
+        if not labeled:
+            return None
+        return sum(r[key].route.value == r["case"]["expected"] for r in labeled) / len(labeled)
+
+    return {
+        "n": n,
+        "raw_agree": sum(r["raw"].route == r["translated"].route for r in rows) / n,
+        "final_agree": sum(r["final"].route == r["translated"].route for r in rows) / n,
+        "fallback": sum(not r["raw"].confident for r in rows) / n,
+        "final_ms": statistics.median(r["final_ms"] for r in rows),
+        "translate_first_ms": statistics.median(r["translate_first_ms"] for r in rows),
+        "final_acc": accuracy("final"),
+        "translated_acc": accuracy("translated"),
+    }
+
+
+def group_rows(rows: list) -> dict:
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row["case"].get("language", "unlabeled")].append(row)
+    if len(groups) > 1:
+        groups["all"] = rows
+    return groups
+
+
+fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+
+
+def print_report(rows: list) -> None:
+    print(
+        f"{'language':<10} {'n':>4} {'raw agree':>10} {'final agree':>12} {'fallback':>9} "
+        f"{'p50 ms':>8} {'xlate-1st ms':>13} {'acc':>6} {'xlate acc':>10}"
+    )
+    for language, group in group_rows(rows).items():
+        s = summarize(group)
+        print(
+            f"{language:<10} {s['n']:>4} {s['raw_agree']:10.3f} {s['final_agree']:12.3f} {s['fallback']:9.3f} "
+            f"{s['final_ms']:8.1f} {s['translate_first_ms']:13.1f} {fmt(s['final_acc']):>6} {fmt(s['translated_acc']):>10}"
+        )
+
+
+async def sweep(gateway, prepared: list) -> None:
+    """Re-score with MULTILINGUAL_THRESHOLDS shifted by each offset (English thresholds unchanged)."""
+    base = copy.deepcopy(gateway.MULTILINGUAL_THRESHOLDS)
+    print(f"\n{'offset':>7} {'language':<10} {'n':>4} {'final agree':>12} {'fallback':>9} {'acc':>6}")
+    for offset in SWEEP_OFFSETS:
+        gateway.MULTILINGUAL_THRESHOLDS = {
+            language: {category: value + offset for category, value in thresholds.items()}
+            for language, thresholds in base.items()
+        }
+        rows = [await route_case(gateway, p) for p in prepared]
+        for language, group in group_rows(rows).items():
+            s = summarize(group)
+            print(
+                f"{offset:+7.2f} {language:<10} {s['n']:>4} {s['final_agree']:12.3f} "
+                f"{s['fallback']:9.3f} {fmt(s['final_acc']):>6}"
+            )
+    gateway.MULTILINGUAL_THRESHOLDS = base
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("messages", help="message set (JSONL)")
+    parser.add_argument("--margin", type=float, help="override ROUTE_CONFIDENCE_MARGIN")
+    parser.add_argument("--sweep", action="store_true", help="also try MULTILINGUAL_THRESHOLDS offsets")
+    parser.add_argument("--show-disagreements", action="store_true")
+    args = parser.parse_args()
+
+    if args.margin is not None:
+        model_gateway_module.ROUTE_CONFIDENCE_MARGIN = args.margin
+    gateway = get_model_gateway()
+    prepared = [await embed_case(case) for case in load_messages(args.messages)]
+    rows = [await route_case(gateway, p) for p in prepared]
+
+    print(f"{len(rows)} messages, confidence margin {model_gateway_module.ROUTE_CONFIDENCE_MARGIN}\n")
+    print_report(rows)
+
+    if args.sweep:
+        await sweep(gateway, prepared)
+
+    if args.show_disagreements:
+        print()
+        for row in rows:
+            if row["final"].route != row["translated"].route:
+                print(
+                    f"    {row['case']['message']!r} ({row['detected']}): raw {row['final'].route.value} "
+                    f"({row['final'].reason}, margin {row['final'].margin}) vs "
+                    f"translated {row['translated'].route.value} ({row['english']!r})"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
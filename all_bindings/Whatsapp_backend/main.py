@@ -1,6 +1,7 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import asyncio
 
@@ -12,6 +13,7 @@ from modules.user_profile import (
     get_user_profile,
     resolve_user_id_by_phone,
     get_user_by_phone,
+    get_chat_identity,
     create_partial_user,
     update_user_profile,
     login_user,
@@ -28,10 +30,24 @@ from modules.response_builder import (
 from modules.conversation import save_user_message, save_sakhi_message, get_last_messages
 from modules.user_answers import save_bulk_answers
 from modules.model_gateway import get_model_gateway, Route
+from modules.detect_lang import detect_language
 from modules.slm_client import get_slm_client
 from modules.guardrails import get_guardrails
-from modules.search_hierarchical import hierarchical_rag_query, format_hierarchical_context
-from modules.lead_manager import handle_lead_flow, _get_chat_state
+from modules.search_hierarchical import (
+    hierarchical_rag_query,
+    format_hierarchical_context,
+    retrieval_mode_for,
+    shared_retrieval_mode,
+    get_speculation_stats,
+)
+from modules.lead_manager import handle_lead_flow, _get_chat_state, get_chat_state_store
+from modules.message_gate import get_message_gate
+from modules.admission_control import get_governor, Backend, Overloaded
+from modules.openai_client import get_openai
+from modules.reranker import get_reranker
+from modules.pipeline import Pipeline, Stage
+from rag import async_generate_embedding
+from resilience import get_resilience
 from modules.user_rewards import (
     award_points,
     store_new_question,
@@ -58,6 +74,18 @@ app.add_middleware(
 model_gateway = get_model_gateway()
 slm_client = get_slm_client()
 guardrails = get_guardrails()
+message_gate = get_message_gate()
+governor = get_governor()
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Shed load explicitly instead of surfacing provider rate limits as 500s
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Sakhi is busy right now, please try again shortly ({exc.backend.value})"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 class RegisterRequest(BaseModel):
@@ -80,6 +108,8 @@ class ChatRequest(BaseModel):
     phone_number: str | None = None
     message: str
     language: str = "en"
+    message_id: str | None = None  # provider message id, used for de-duplication
+    timestamp: str | None = None   # provider message timestamp
 
 
 class AnswerItem(BaseModel):
@@ -107,6 +137,37 @@ def home():
     return {"message": "Sakhi API working!"}
 
 
+@app.get("/metrics/admission")
+def admission_metrics():
+    """
+    Queue depth, in-flight calls and shed counts per model backend,
+    plus the shared OpenAI rate budget, chat state cache counters,
+    chat turn pipeline timings (per-stage means and critical paths),
+    speculative retrieval outcomes (used vs. wasted, time saved) and how
+    often routing fell back to the translated message.
+    """
+    openai_client = get_openai()
+    return {
+        "admission": governor.stats(),
+        "message_gate": message_gate.stats(),
+        "openai": openai_client.stats() if openai_client else None,
+        "reranker": get_reranker().stats(),
+        "chat_state": get_chat_state_store().stats(),
+        "chat_pipeline": chat_pipeline.stats(),
+        "speculative_retrieval": get_speculation_stats().stats(),
+        "routing": model_gateway.stats(),
+    }
+
+
+@app.get("/metrics/storage")
+def storage_metrics():
+    """
+    Circuit breaker state per table / RPC and bulkhead usage per pool
+    for database calls.
+    """
+    return get_resilience().stats()
+
+
 @app.post("/user/register")
 def register_user(req: RegisterRequest):
     try:
@@ -177,26 +238,81 @@ def register_user(req: RegisterRequest):
 
 @app.post("/sakhi/chat")
 async def sakhi_chat(req: ChatRequest):
-    # 1. Resolve or Create User
-    user = None
-    if req.user_id:
-        user = get_user_profile(req.user_id)
-    elif req.phone_number:
-        user = get_user_by_phone(req.phone_number)
+    # Serialize turns per user, drop duplicate deliveries and coalesce bursts
+    user_key = req.user_id or req.phone_number
+    if not user_key:
+        raise HTTPException(status_code=400, detail="user_id or phone_number is required")
+
+    idempotency_key = message_gate.idempotency_key(
+        user_key, req.message, message_id=req.message_id, timestamp=req.timestamp
+    )
+
+    async def run_turn(message: str):
+        # Every model call made for this turn shares one deadline
+        with governor.turn():
+            return await _run_chat_turn(req.model_copy(update={"message": message}))
+
+    return await message_gate.submit(user_key, req.message, idempotency_key, run_turn)
+
+
+# ===== Chat turn pipeline =====
+# Each stage declares its inputs; the pipeline runs every stage as soon as
+# they resolve. The gate stage answers onboarding, /rewards, the lead flow and
+# out-of-scope messages by raising EarlyReply, which also stops everything
+# downstream of it. Generation stages are lazy: only the chosen route's runs.
+
+class EarlyReply(Exception):
+    """Raised by the gate stage when the turn is answered before the normal flow."""
+
+    def __init__(self, reply: dict):
+        super().__init__(reply.get("mode") if reply else None)
+        self.reply = reply
+
+
+def _log_lead_flow_error(e: Exception):
+    print(f"❌ ERROR in Lead Flow: {e}")
+    # Improve error visibility - likely DB schema missing
+    if "sakhi_chat_states" in str(e):
+        print("⚠️ HINT: Did you run setup_leads_strict.sql? The 'sakhi_chat_states' table might be missing.")
+
+
+def _load_identity(req: ChatRequest):
+    return get_chat_identity(user_id=req.user_id, phone_number=req.phone_number)
+
+
+def _load_chat_state(identity):
+    # Check separate state table, do NOT rely on user['context']
+    if not identity:
+        return {}
+    try:
+        return _get_chat_state(identity.get("user_id")) or {}
+    except Exception as e:
+        _log_lead_flow_error(e)
+        return {}
+
+
+def _check_scope(req: ChatRequest):
+    # Off-topic questions (sports, movies, etc.) get a polite redirect
+    return guardrails.get_redirect_for_out_of_scope(req.message)
+
+
+def _gate_turn(req: ChatRequest, identity, chat_state, out_of_scope):
+    """Return the user row for the normal flow, or raise EarlyReply."""
+    user = identity
 
     # If new user (by phone), create them
     if not user:
         if req.phone_number:
             try:
                 user = create_partial_user(req.phone_number)
-                # Return Welcome Message
-                return {
-                    "reply": "Welcome to Sakhi! I'm here to support you on your health journey. ❤️ \n Let's get started! What should I call you? (Please type just your name, e.g., Deepthi)",
-                    "mode": "onboarding",
-                    "intent": "The intent is to onboarding the user"
-                }
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to register user: {e}")
+            # Return Welcome Message
+            raise EarlyReply({
+                "reply": "Welcome to Sakhi! I'm here to support you on your health journey. ❤️ \n Let's get started! What should I call you? (Please type just your name, e.g., Deepthi)",
+                "mode": "onboarding",
+                "intent": "The intent is to onboarding the user"
+            })
         else:
              raise HTTPException(status_code=400, detail="user_id or phone_number is required")
 
@@ -215,20 +331,20 @@ async def sakhi_chat(req: ChatRequest):
     # STATE 1: WAITING FOR NAME (User sent Name)
     if not current_name:
         update_user_profile(user_id, {"name": msg})
-        return {
+        raise EarlyReply({
             "reply": f"Nice to meet you, {msg}! Can you let me know your gender ? (Please reply with 'Male' or 'Female')",
             "mode": "onboarding",
             "intent": "The intent is to ask for gender"
-        }
+        })
 
     # STATE 2: WAITING FOR GENDER (User sent Gender)
     elif not current_gender:
         update_user_profile(user_id, {"gender": msg})
-        return {
+        raise EarlyReply({
             "reply": "Got it. And finally, what's your location (City/Town)? (e.g., Vizag)",
             "mode": "onboarding",
             "intent": "The intent is to ask for location"
-        }
+        })
 
     # STATE 3: WAITING FOR LOCATION (User sent Location)
     elif not current_location:
@@ -247,257 +363,533 @@ async def sakhi_chat(req: ChatRequest):
             "My goal is to restore your faith and give you strength when you need it most. I am ready to listen whenever you are ready to talk.\n\n"
         )
         
-        return {
+        raise EarlyReply({
             "reply": long_intro,
             "mode": "onboarding_complete",
             "image": "Sakhi_intro.png",
             "intent": "The intent is to complete the onboarding"
-        }
+        })
 
     # 2.0 Check /rewards command
     if msg.lower() == "/rewards":
         total = get_user_rewards(user_id)
-        return {
+        raise EarlyReply({
             "reply": f"🏆 You have earned {total} reward points! Keep asking questions to earn more.",
             "mode": "rewards",
             "intent": "The intent is to show rewards"
-        }
+        })
 
     # 2.1 Check Lead Feature Flow (/newlead or in-progress)
+    lead_reply = None
     try:
-        # Check separate state table, do NOT rely on user['context']
-        chat_state = _get_chat_state(user_id)
-        if chat_state is None:
-             chat_state = {}
-        
         # Check if user triggered new lead OR is currently in a lead flow step
         if msg.lower() == "/newlead" or (chat_state.get("lead_flow") and chat_state["lead_flow"].get("step")):
-             return handle_lead_flow(user_id, msg, user)
+             lead_reply = handle_lead_flow(user_id, msg, user)
     except Exception as e:
-        print(f"❌ ERROR in Lead Flow: {e}")
-        # Improve error visibility - likely DB schema missing
-        if "sakhi_chat_states" in str(e):
-             print("⚠️ HINT: Did you run setup_leads_strict.sql? The 'sakhi_chat_states' table might be missing.")
-        pass
+        _log_lead_flow_error(e)
+    if lead_reply is not None:
+        raise EarlyReply(lead_reply)
 
-    # 3. Normal Flow
-    
-    # ===== GUARDRAILS: Detect Intent & Handle Out-of-Scope =====
-    # Check if user is asking about off-topic things (sports, movies, etc.)
-    redirect_response = guardrails.get_redirect_for_out_of_scope(req.message)
-    if redirect_response:
+    # ===== GUARDRAILS: Handle Out-of-Scope =====
+    if out_of_scope:
         # Politely redirect to fertility/pregnancy topics
         try:
             save_user_message(user_id, req.message, req.language)
-            save_sakhi_message(user_id, redirect_response, req.language)
+            save_sakhi_message(user_id, out_of_scope, req.language)
         except:
             pass
-        return {
-            "reply": redirect_response,
+        raise EarlyReply({
+            "reply": out_of_scope,
             "mode": "general",
             "language": req.language,
             "intent": "out_of_scope"
-        }
-    
-    try:
-        save_user_message(user_id, req.message, req.language)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+        })
 
-    # STEP 0: Decide routing using Model Gateway
-    # NOTE: Router works best with English. Translate first for routing check?
-    from modules.translation_service import translate_query 
-    # STEP 0: Parallelize Translation and Classification
-    # To reduce latency, we run these independent tasks concurrently.
-    
-    # 1. Start Translation (Independent)
-    # Translate for internal logic only (routing + search)
-    translation_task = asyncio.create_task(translate_query(req.message, target_lang="en"))
-    
-    # 2. Start Classification (Independent)
-    classification_task = asyncio.create_task(classify_message(req.message))
-
-    # 3. Start Intent Label Generation (Independent)
-    # Just initiate it here, we will gather it later
-    # Use detected lang if available, else default to 'en' first, but we don't have it yet.
-    # So we can pass 'en' or wait.
-    # BETTER: Wait for classification/translation first? 
-    # Actually, let's run it parallel with just the raw message. SLM can handle language.
-    # We'll pass the requested language if user explicitly sent one, or just 'en' for now.
-    intent_task = asyncio.create_task(slm_client.generate_intent_label(req.message, language=req.language))
-
-    # Wait for all to complete
+    return user
+
+
+def _save_user_message(req: ChatRequest, gate):
+    save_user_message(gate.get("user_id"), req.message, req.language)
+
+
+async def _translate(req: ChatRequest, gate):
+    # Translate for internal logic only: search, and routing when the raw
+    # message routes with low confidence. Pruned on SLM_DIRECT.
+    from modules.translation_service import translate_query
+    return await translate_query(req.message, target_lang="en")
+
+
+async def _classify(req: ChatRequest, gate):
+    return await classify_message(req.message)
+
+
+async def _generate_intent(req: ChatRequest, gate):
+    # Runs on the raw message: the SLM can handle the language, and waiting
+    # for classification would put it on the critical path.
+    return await slm_client.generate_intent_label(req.message, language=req.language)
+
+
+def _load_history(gate):
+    # Only OPENAI_RAG uses it; pruned once another route is chosen
+    return get_last_messages(gate.get("user_id"), limit=5)
+
+
+async def _embed_message(req: ChatRequest, gate):
+    async with governor.slot(Backend.EMBEDDINGS):
+        return await async_generate_embedding(req.message)
+
+
+async def _embed_search_query(req: ChatRequest, translation, embedding):
+    # English messages translate to themselves: reuse the routing embedding
+    if not translation or translation.strip().lower() == req.message.strip().lower():
+        return embedding
+    async with governor.slot(Backend.EMBEDDINGS):
+        return await async_generate_embedding(translation)
+
+
+async def _route_message(req: ChatRequest, embedding):
+    # A raw Tinglish or Telugu message is also scored against that language's
+    # anchors, so it routes without waiting for translation. English uses the
+    # English anchors only.
+    language = detect_language(req.message)
+    return await model_gateway.score_route(req.message, query_vector=embedding, language=language)
+
+
+async def _route_translation(translation, search_embedding):
+    # Low-confidence fallback: route the English translation on the English anchors, as before
+    return await model_gateway.score_route(translation, query_vector=search_embedding)
+
+
+def _degrade_under_pressure(route):
+    # Graceful degradation: under OpenAI pressure, answer simple-enough turns via SLM RAG
+    if (
+        route == Route.OPENAI_RAG
+        and governor.under_pressure(Backend.OPENAI_CHAT)
+        and not governor.under_pressure(Backend.SLM)
+    ):
+        print("⚠️ OpenAI backend under pressure. Downgrading OPENAI_RAG -> SLM_RAG.")
+        governor.record_downgrade()
+        route = Route.SLM_RAG
+    return route
+
+
+async def _retrieve(req: ChatRequest, query: str, query_vector, label: str):
+    mode = shared_retrieval_mode()
+    if mode is None:
+        return None
     try:
-        english_intent_query, classification, intent_label = await asyncio.gather(
-            translation_task, 
-            classification_task, 
-            intent_task
-        )
+        return await hierarchical_rag_query(query, mode=mode, lexical_query=req.message, query_vector=query_vector)
+    except Overloaded:
+        raise
     except Exception as e:
-         # If classification fails, we might still have translation, but better to fail safe
-         raise HTTPException(status_code=500, detail=f"Failed during initial processing: {e}")
-    
-    # Pass English query to router for better accuracy on non-English inputs
-    route = await model_gateway.decide_route(english_intent_query)
+        # Not fatal: the generation stage retrieves again on its own
+        print(f"⚠️ {label} retrieval failed, generation will retrieve itself: {e}")
+        get_speculation_stats().record_failed()
+        return None
+
+
+async def _speculative_retrieval(req: ChatRequest, embedding):
+    # Same inputs as the route, so it runs alongside the decision: both RAG
+    # routes use it, SLM_DIRECT and the low-confidence fallback cancel it
+    return await _retrieve(req, req.message, embedding, "Speculative")
+
+
+async def _translated_retrieval(req: ChatRequest, translation, search_embedding):
+    # Low-confidence fallback only: search with the English translation, as before
+    return await _retrieve(req, translation or req.message, search_embedding, "Translated")
+
+
+def _uses_speculation(stage: str) -> bool:
+    return "retrieval" in chat_pipeline.stages[stage].inputs
+
+
+async def _record_speculation(run, stage: str) -> None:
+    """
+    Book the speculative retrieval as wasted (call right after the prune) or,
+    once `stage` has run, as used with the time it saved.
+    """
+    if shared_retrieval_mode() is None:
+        return
+    t = run.timing("retrieval")
+    if t["started"] is None:
+        return
+    inputs = chat_pipeline.stages[stage].inputs
+    if not _uses_speculation(stage):
+        # SLM_DIRECT or the translated fallback: cancelled by the prune, or finished for nothing
+        finished = t["finished"] is not None
+        end = t["finished"] if finished else run.elapsed()
+        get_speculation_stats().record_discarded(end - t["started"], finished)
+        return
+    # Already resolved: the generation stage took it as an input
+    if t["finished"] is None or await run.result("retrieval") is None:
+        return
+    # Without speculation, retrieval would have started once the generation
+    # stage's other inputs were ready; only stages that ran count
+    ready = [
+        run.timing(name)["finished"] for name in inputs
+        if name in chat_pipeline.stages and name != "retrieval" and run.timing(name)["finished"] is not None
+    ]
+    overlap = max(ready) - t["started"] if ready else 0.0
+    get_speculation_stats().record_used(max(0.0, min(t["finished"] - t["started"], overlap)))
+
+
+def _target_language(classification):
     # STEP: Decide FINAL response language (single source of truth)
     detected_lang = classification.get("language", "en").lower()
-    signal = classification.get("signal", "NO")
 
     if detected_lang == "tinglish":
-        target_lang = "Tinglish"   # respond in Tinglish
+        return "Tinglish"   # respond in Tinglish
     elif detected_lang in ["telugu", "te"]:
-        target_lang = "Telugu"
-    else:
-        target_lang = "English"
+        return "Telugu"
+    return "English"
+
+
+def _user_name(user):
+    # User name for personalization (already loaded with the chat identity)
+    name = user.get("name")
+    return name if name and name.strip() else None
 
 
-    # Fetch user name for personalization
-    user_name = None
+async def _generate_slm_direct(req: ChatRequest, gate, language):
+    user_name = _user_name(gate)
     try:
-        profile = get_user_profile(user_id)
-        if profile:
-            user_name = profile.get("name")
-            if user_name and not user_name.strip():
-                user_name = None
-    except Exception as e:
-        print(f"DEBUGGING ERROR: Failed to fetch profile for name: {e}")
-        user_name = None
+        final_ans = await slm_client.generate_chat(
+            message=req.message,
+            language=language,
+            user_name=user_name,
+        )
 
-    print(f"DEBUG: Final user_name passed to LLM: '{user_name}'")
+        # HARD ENFORCEMENT: Tinglish check for SLM
+        if language.lower() == "tinglish":
+             if contains_telugu_unicode(final_ans) or is_mostly_english(final_ans):
+                 print("⚠️ SLM Validation Failure. Forcing Rewrite.")
+                 final_ans = await force_rewrite_to_tinglish(final_ans, user_name=user_name)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
+    return final_ans
 
-    # Conversation history for both modes
-    history = get_last_messages(user_id, limit=5)
 
-    # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
-    if route == Route.SLM_DIRECT:
-        try:
-            final_ans = await slm_client.generate_chat(
-                message=req.message,
-                language=target_lang,
-                user_name=user_name,
+async def _generate_slm_rag(req: ChatRequest, gate, translation, language, retrieval):
+    user_name = _user_name(gate)
+    # Perform RAG search using TRANSLATED QUERY for better recall
+    try:
+        if retrieval is not None:
+            kb_results, rag_best_similarity = retrieval
+        else:
+            # Use english_intent_query for RAG search as it yields better semantic matches
+            search_query = translation if translation else req.message
+            # The raw message feeds the keyword side, so exact terms survive translation
+            kb_results, rag_best_similarity = await hierarchical_rag_query(
+                search_query,
+                mode=retrieval_mode_for(Route.SLM_RAG),
+                lexical_query=req.message,
             )
+        context_text = format_hierarchical_context(kb_results)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
 
-            # HARD ENFORCEMENT: Tinglish check for SLM
-            if target_lang.lower() == "tinglish":
-                 if contains_telugu_unicode(final_ans) or is_mostly_english(final_ans):
-                     print("⚠️ SLM Validation Failure. Forcing Rewrite.")
-                     final_ans = await force_rewrite_to_tinglish(final_ans, user_name=user_name)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM chat response: {e}")
-        
+    # Generate response using SLM with context
+    try:
+        # STRATEGY CHANGE for Tinglish & Telugu:
+        # 1. Ask SLM for English (Ensures factual accuracy from RAG)
+        # 2. Use GPT-4o-mini to translate to natural Tinglish/Telugu
+        effective_lang = "English" if language in ["Tinglish", "Telugu"] else language
+
+        final_ans = await slm_client.generate_rag_response(
+            context=context_text,
+            message=req.message, # Keep original message for personality/tone matching
+            language=effective_lang,
+            user_name=user_name,
+        )
+
+        # FORCE REWRITE
+        if language == "Tinglish":
+             print(f"ℹ️  Tinglish requested. Converting English SLM response to Tinglish...")
+             final_ans = await force_rewrite_to_tinglish(final_ans, user_name=user_name)
+        elif language == "Telugu":
+             print(f"ℹ️  Telugu requested. Converting English SLM response to Telugu...")
+             final_ans = await force_rewrite_to_telugu(final_ans, user_name=user_name)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
+    return final_ans, kb_results, rag_best_similarity
+
+
+async def _generate_slm_rag_translated(req: ChatRequest, gate, translation, language, translated_retrieval):
+    return await _generate_slm_rag(req, gate, translation, language, translated_retrieval)
+
+
+async def _generate_openai_rag(req: ChatRequest, gate, language, history, retrieval):
+    try:
+        return await generate_medical_response(
+            prompt=req.message,
+            target_lang=language,
+            history=history,
+            user_name=_user_name(gate),
+            retrieval_mode=retrieval_mode_for(Route.OPENAI_RAG),
+            kb_results=retrieval[0] if retrieval is not None else None,
+        )
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
+
+
+async def _generate_openai_rag_translated(req: ChatRequest, gate, language, history, translated_retrieval):
+    return await _generate_openai_rag(req, gate, language, history, translated_retrieval)
+
+
+chat_pipeline = Pipeline(
+    "chat_turn",
+    [
+        Stage("identity", _load_identity, inputs=("req",), blocking=True),
+        Stage("out_of_scope", _check_scope, inputs=("req",)),
+        Stage("chat_state", _load_chat_state, inputs=("identity",), blocking=True),
+        Stage("gate", _gate_turn, inputs=("req", "identity", "chat_state", "out_of_scope"), blocking=True),
+        Stage("save_user_message", _save_user_message, inputs=("req", "gate"), blocking=True),
+        Stage("translation", _translate, inputs=("req", "gate")),
+        Stage("classification", _classify, inputs=("req", "gate")),
+        Stage("intent", _generate_intent, inputs=("req", "gate")),
+        Stage("history", _load_history, inputs=("gate",), blocking=True),
+        Stage("embedding", _embed_message, inputs=("req", "gate")),
+        Stage("route", _route_message, inputs=("req", "embedding")),
+        Stage("search_embedding", _embed_search_query, inputs=("req", "translation", "embedding")),
+        Stage("translated_route", _route_translation, inputs=("translation", "search_embedding"), lazy=True),
+        Stage("retrieval", _speculative_retrieval, inputs=("req", "embedding")),
+        Stage(
+            "translated_retrieval",
+            _translated_retrieval,
+            inputs=("req", "translation", "search_embedding"),
+            lazy=True,
+        ),
+        Stage("language", _target_language, inputs=("classification",)),
+        Stage("slm_direct", _generate_slm_direct, inputs=("req", "gate", "language"), lazy=True),
+        Stage("slm_rag", _generate_slm_rag, inputs=("req", "gate", "translation", "language", "retrieval"), lazy=True),
+        Stage(
+            "openai_rag",
+            _generate_openai_rag,
+            inputs=("req", "gate", "language", "history", "retrieval"),
+            lazy=True,
+        ),
+        # Used when the route came from the translation: retrieval re-queried with it
+        Stage(
+            "slm_rag_translated",
+            _generate_slm_rag_translated,
+            inputs=("req", "gate", "translation", "language", "translated_retrieval"),
+            lazy=True,
+        ),
+        Stage(
+            "openai_rag_translated",
+            _generate_openai_rag_translated,
+            inputs=("req", "gate", "language", "history", "translated_retrieval"),
+            lazy=True,
+        ),
+    ],
+    seeds=("req",),
+)
+
+# Generation stage per route
+ROUTE_STAGES = {
+    Route.SLM_DIRECT: "slm_direct",
+    Route.SLM_RAG: "slm_rag",
+    Route.OPENAI_RAG: "openai_rag",
+}
+# ... when the route was decided on the translation (low-confidence fallback)
+TRANSLATED_ROUTE_STAGES = {
+    Route.SLM_DIRECT: "slm_direct",
+    Route.SLM_RAG: "slm_rag_translated",
+    Route.OPENAI_RAG: "openai_rag_translated",
+}
+
+
+async def _intent_label(run) -> str:
+    try:
+        return await run.result("intent")
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed during initial processing: {e}")
+
+
+async def _run_chat_turn(req: ChatRequest):
+    async with chat_pipeline.run(req=req) as run:
+        # 1. Resolve user, onboarding, /rewards, lead flow and guardrails
         try:
-            save_sakhi_message(user_id, final_ans, target_lang)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Light cleanup of output
-        final_ans = guardrails.clean_output(final_ans)
-        
-        # STRIP FOLLOW-UP QUESTIONS for small talk (SLM_DIRECT should not have follow-ups)
-        import re
-        final_ans = re.sub(r'(?i)\n\s*follow\s*-?\s*ups?\s*:.*$', '', final_ans, flags=re.DOTALL).strip()
-        
-        # NUCLEAR CLEANUP for specific banned words
-        final_ans = re.sub(r'(?i)\b(aam|aayi)\b[,.]*', '', final_ans).strip()
+            user = await run.result("gate")
+        except EarlyReply as e:
+            return e.reply
 
-        # Award points asynchronously (CONVERSATIONAL = 1 pt)
-        asyncio.create_task(award_points(user_id, RewardType.CONVERSATIONAL))
+        user_id = user.get("user_id")
+        user_name = _user_name(user)
+        print(f"DEBUG: Final user_name passed to LLM: '{user_name}'")
 
-        return {
-            "reply": final_ans,
-            "mode": "general",
-            "language": target_lang,
-            "reply": final_ans,
-            "mode": "general",
-            "language": target_lang,
-            "route": "slm_direct",
-            "intent": intent_label
-        }
-    
-    # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
-    elif route == Route.SLM_RAG:
-        # Perform RAG search using TRANSLATED QUERY for better recall
+        # 2. Route the raw message as soon as it is embedded; classification, intent
+        # and translation keep running. Only a low-confidence route waits for the
+        # translation and is decided on the English text instead.
         try:
-            # We pass the translated english query to the search function
-            # Use english_intent_query for RAG search as it yields better semantic matches
-            search_query = english_intent_query if english_intent_query else req.message
-            kb_results, rag_best_similarity = await hierarchical_rag_query(search_query) 
-            context_text = format_hierarchical_context(kb_results)
+            decision = await run.result("route")
+            translated = None
+            if not decision.confident:
+                translated = await run.result("translated_route")
+            model_gateway.record_decision(decision, translated)
+            route = _degrade_under_pressure((translated or decision).route)
+            # Drop work only other routes need (history; the raw-message retrieval
+            # on SLM_DIRECT or when the route came from the translation)
+            stage = (TRANSLATED_ROUTE_STAGES if translated is not None else ROUTE_STAGES)[route]
+            run.prune(keep=(stage, "save_user_message", "intent"))
+            if translated is not None:
+                # Re-query with the translation now, alongside classification
+                run.start("translated_retrieval")
+            if not _uses_speculation(stage):
+                await _record_speculation(run, stage)
+            target_lang = await run.result("language")
+        except Overloaded:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to perform RAG search: {e}")
-        
-        # Generate response using SLM with context
-        try:
-            # STRATEGY CHANGE for Tinglish & Telugu:
-            # 1. Ask SLM for English (Ensures factual accuracy from RAG)
-            # 2. Use GPT-4o-mini to translate to natural Tinglish/Telugu
-            effective_lang = "English" if target_lang in ["Tinglish", "Telugu"] else target_lang
-
-            final_ans = await slm_client.generate_rag_response(
-                context=context_text,
-                message=req.message, # Keep original message for personality/tone matching
-                language=effective_lang,
-                user_name=user_name,
-            )
+             raise HTTPException(status_code=500, detail=f"Failed during initial processing: {e}")
 
-            # FORCE REWRITE
-            if target_lang == "Tinglish":
-                 print(f"ℹ️  Tinglish requested. Converting English SLM response to Tinglish...")
-                 final_ans = await force_rewrite_to_tinglish(final_ans, user_name=user_name)
-            elif target_lang == "Telugu":
-                 print(f"ℹ️  Telugu requested. Converting English SLM response to Telugu...")
-                 final_ans = await force_rewrite_to_telugu(final_ans, user_name=user_name)
+        try:
+            await run.result("save_user_message")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to generate SLM RAG response: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to save user message: {e}")
+
+        # ===== ROUTE 1: SLM_DIRECT (Small talk, no RAG) =====
+        if route == Route.SLM_DIRECT:
+            final_ans = await run.result("slm_direct")
+
+            try:
+                save_sakhi_message(user_id, final_ans, target_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            # Light cleanup of output
+            final_ans = guardrails.clean_output(final_ans)
+            
+            # STRIP FOLLOW-UP QUESTIONS for small talk (SLM_DIRECT should not have follow-ups)
+            import re
+            final_ans = re.sub(r'(?i)\n\s*follow\s*-?\s*ups?\s*:.*$', '', final_ans, flags=re.DOTALL).strip()
+            
+            # NUCLEAR CLEANUP for specific banned words
+            final_ans = re.sub(r'(?i)\b(aam|aayi)\b[,.]*', '', final_ans).strip()
+
+            # Award points asynchronously (CONVERSATIONAL = 1 pt)
+            asyncio.create_task(award_points(user_id, RewardType.CONVERSATIONAL))
+
+            return {
+                "reply": final_ans,
+                "mode": "general",
+                "language": target_lang,
+                "route": "slm_direct",
+                "intent": await _intent_label(run)
+            }
         
+        # ===== ROUTE 2: SLM_RAG (Simple medical, RAG + SLM) =====
+        elif route == Route.SLM_RAG:
+            final_ans, kb_results, rag_best_similarity = await run.result(stage)
+            if _uses_speculation(stage):
+                await _record_speculation(run, stage)
+            
+            try:
+                save_sakhi_message(user_id, final_ans, target_lang)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
+            
+            # Extract metadata from KB results
+            infographic_url = None
+            youtube_link = None
+            if kb_results:
+                for item in kb_results:
+                    if item.get("source_type") == "FAQ":
+                        if item.get("infographic_url"):
+                            infographic_url = item["infographic_url"]
+                        if item.get("youtube_link"):
+                            youtube_link = item["youtube_link"]
+                        if infographic_url or youtube_link:
+                            break
+            
+            response_payload = {
+                "reply": final_ans,
+                "mode": "medical",
+                "language": target_lang,
+                "youtube_link": youtube_link,
+                "infographic_url": infographic_url,
+                "route": "slm_rag",
+                "intent": await _intent_label(run)
+            }
+            
+            # Light cleanup of output
+            cleaned_reply = guardrails.clean_output(final_ans)
+            
+            # NUCLEAR CLEANUP
+            import re
+            cleaned_reply = re.sub(r'(?i)\b(aam|aayi)\b[,.]*', '', cleaned_reply).strip()
+            response_payload["reply"] = cleaned_reply
+            
+            # Award points asynchronously
+            # (similarity over all retrieved candidates, before reranking trims them)
+            best_similarity = rag_best_similarity if kb_results else 0.0
+
+            reward_type = classify_for_reward(route="slm_rag", rag_similarity=best_similarity)
+            asyncio.create_task(award_points(user_id, reward_type))
+            
+            # Store new questions for KB expansion
+            if reward_type == RewardType.NEW_QUESTION:
+                asyncio.create_task(store_new_question(user_id, req.message, best_similarity))
+            
+            # Safe logging to avoid Unicode errors on Windows console
+            try:
+                print(f"Response Payload: {response_payload}")
+            except UnicodeEncodeError:
+                print(f"Response Payload sent (contains special characters)")
+            return response_payload
+
+        # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
+        # Model gateway has already decided this should go to OpenAI RAG
+        # Trust the model gateway decision - don't override with signal check
+        final_ans, _kb = await run.result(stage)
+        if _uses_speculation(stage):
+            await _record_speculation(run, stage)
+
         try:
             save_sakhi_message(user_id, final_ans, target_lang)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-        
-        # Extract metadata from KB results
+
+        # Extract infographic_url and youtube_link if available in kb_results
         infographic_url = None
         youtube_link = None
-        if kb_results:
-            for item in kb_results:
+
+        if _kb:
+            for item in _kb:
                 if item.get("source_type") == "FAQ":
                     if item.get("infographic_url"):
                         infographic_url = item["infographic_url"]
                     if item.get("youtube_link"):
                         youtube_link = item["youtube_link"]
+                    # If we found an FAQ match, we likely want to use its metadata
                     if infographic_url or youtube_link:
                         break
-        
+
         response_payload = {
-            "reply": final_ans,
-            "mode": "medical",
+            "reply": final_ans, 
+            "mode": "medical", 
             "language": target_lang,
             "youtube_link": youtube_link,
             "infographic_url": infographic_url,
-            "infographic_url": infographic_url,
-            "route": "slm_rag",
-            "intent": intent_label
+            "route": "openai_rag",
+            "intent": await _intent_label(run)
         }
         
         # Light cleanup of output
-        cleaned_reply = guardrails.clean_output(final_ans)
-        
-        # NUCLEAR CLEANUP
-        import re
-        cleaned_reply = re.sub(r'(?i)\b(aam|aayi)\b[,.]*', '', cleaned_reply).strip()
-        response_payload["reply"] = cleaned_reply
+        response_payload["reply"] = guardrails.clean_output(final_ans)
         
-        # Award points asynchronously
-        best_similarity = 0.0
-        if kb_results:
-             best_similarity = max((item.get("similarity", 0) for item in kb_results), default=0.0)
-
-        reward_type = classify_for_reward(route="slm_rag", rag_similarity=best_similarity)
-        asyncio.create_task(award_points(user_id, reward_type))
-        
-        # Store new questions for KB expansion
-        if reward_type == RewardType.NEW_QUESTION:
-            asyncio.create_task(store_new_question(user_id, req.message, best_similarity))
+        # Award points asynchronously (MEDICAL = 3 pts for OpenAI RAG)
+        asyncio.create_task(award_points(user_id, RewardType.MEDICAL))
         
         # Safe logging to avoid Unicode errors on Windows console
         try:
@@ -506,66 +898,6 @@ async def sakhi_chat(req: ChatRequest):
             print(f"Response Payload sent (contains special characters)")
         return response_payload
 
-    # ===== ROUTE 3: OPENAI_RAG (Complex medical, ambiguous, or default queries) =====
-    # Model gateway has already decided this should go to OpenAI RAG
-    # Trust the model gateway decision - don't override with signal check
-
-    # ===== ROUTE 3: OPENAI_RAG (Complex medical or default, RAG + GPT-4) =====
-    # Medical mode: RAG
-    try:
-        final_ans, _kb = await generate_medical_response(
-            prompt=req.message,
-            target_lang=target_lang,
-            history=history,
-            user_name=user_name,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate medical response: {e}")
-
-    try:
-        save_sakhi_message(user_id, final_ans, target_lang)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save Sakhi message: {e}")
-
-    # Extract infographic_url and youtube_link if available in kb_results
-    infographic_url = None
-    youtube_link = None
-
-    if _kb:
-        for item in _kb:
-            if item.get("source_type") == "FAQ":
-                if item.get("infographic_url"):
-                    infographic_url = item["infographic_url"]
-                if item.get("youtube_link"):
-                    youtube_link = item["youtube_link"]
-                # If we found an FAQ match, we likely want to use its metadata
-                if infographic_url or youtube_link:
-                    break
-
-    response_payload = {
-        "reply": final_ans, 
-        "mode": "medical", 
-        "language": target_lang,
-        "youtube_link": youtube_link,
-        "infographic_url": infographic_url,
-        "infographic_url": infographic_url,
-        "route": "openai_rag",
-        "intent": intent_label
-    }
-    
-    # Light cleanup of output
-    response_payload["reply"] = guardrails.clean_output(final_ans)
-    
-    # Award points asynchronously (MEDICAL = 3 pts for OpenAI RAG)
-    asyncio.create_task(award_points(user_id, RewardType.MEDICAL))
-    
-    # Safe logging to avoid Unicode errors on Windows console
-    try:
-        print(f"Response Payload: {response_payload}")
-    except UnicodeEncodeError:
-        print(f"Response Payload sent (contains special characters)")
-    return response_payload
-
 
 @app.post("/user/answers")
 def save_user_answers(req: UserAnswersRequest):
@@ -0,0 +1,244 @@
+# modules/admission_control.py
+"""
+Admission control and backpressure for expensive model backends.
+
+A single chat turn can fan out to several OpenAI / SLM calls. Without a limit,
+a traffic spike runs straight into provider rate limits and the failures
+surface as 500s. The governor gives each backend its own semaphore plus a
+bounded wait queue:
+
+- At most `limit` calls per backend run at once.
+- At most `max_queue` calls wait for a slot; beyond that requests are shed.
+- Waiting never outlives the turn deadline; late requests are shed instead of
+  producing a reply nobody is waiting for anymore.
+
+Callers can ask `under_pressure()` to degrade gracefully (e.g. send an
+OPENAI_RAG turn to SLM_RAG) before queues fill up.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import Enum
+from typing import Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Backend(Enum):
+    """Model backends guarded by the governor."""
+    OPENAI_CHAT = "openai_chat"
+    EMBEDDINGS = "embeddings"
+    SLM = "slm"
+
+
+# Concurrent calls allowed per backend
+BACKEND_LIMITS = {
+    Backend.OPENAI_CHAT: int(os.getenv("OPENAI_CHAT_CONCURRENCY", "16")),
+    Backend.EMBEDDINGS: int(os.getenv("EMBEDDINGS_CONCURRENCY", "32")),
+    Backend.SLM: int(os.getenv("SLM_CONCURRENCY", "8")),
+}
+
+# Calls allowed to wait for a slot, as a multiple of the backend limit
+QUEUE_FACTOR = int(os.getenv("ADMISSION_QUEUE_FACTOR", "4"))
+
+# Total time budget for one chat turn (seconds)
+TURN_DEADLINE_SECONDS = float(os.getenv("SAKHI_TURN_DEADLINE_SECONDS", "25"))
+
+# A backend is "under pressure" once this share of its queue is occupied
+PRESSURE_QUEUE_RATIO = float(os.getenv("ADMISSION_PRESSURE_RATIO", "0.25"))
+
+_turn_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "sakhi_turn_deadline", default=None
+)
+
+
+class Overloaded(Exception):
+    """Raised when a call is shed instead of being admitted."""
+
+    def __init__(self, backend: Backend, reason: str, retry_after: int = 5):
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{backend.value} overloaded ({reason})")
+
+
+class _Bulkhead:
+    """Semaphore plus bounded wait queue and counters for one backend."""
+
+    def __init__(self, backend: Backend, limit: int, max_queue: int):
+        self.backend = backend
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.semaphore = asyncio.Semaphore(self.limit)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.total_wait_seconds = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.admitted, 2) if self.admitted else 0.0,
+        }
+
+
+async def _acquire_within(semaphore: asyncio.Semaphore, timeout: float) -> bool:
+    """
+    Acquire the semaphore within timeout; False if it timed out.
+
+    Unlike wait_for(semaphore.acquire()), a permit granted just as the
+    timeout (or a cancellation of the caller) fires is released, not leaked.
+    """
+    acquire = asyncio.ensure_future(semaphore.acquire())
+    try:
+        await asyncio.wait_for(asyncio.shield(acquire), timeout=timeout)
+        return True
+    except BaseException as e:
+        if acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+            semaphore.release()
+        else:
+            acquire.cancel()
+        if isinstance(e, asyncio.TimeoutError):
+            return False
+        raise
+
+
+class ConcurrencyGovernor:
+    """
+    Global per-backend concurrency governor with deadline-aware shedding.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[Backend, int]] = None,
+        queue_factor: int = QUEUE_FACTOR,
+        turn_deadline: float = TURN_DEADLINE_SECONDS,
+        pressure_ratio: float = PRESSURE_QUEUE_RATIO,
+    ):
+        limits = limits or BACKEND_LIMITS
+        self.turn_deadline = turn_deadline
+        self.pressure_ratio = pressure_ratio
+        self._bulkheads = {
+            backend: _Bulkhead(backend, limit, limit * queue_factor)
+            for backend, limit in limits.items()
+        }
+        self.downgrades = 0
+
+    # ------------------------------------------------------------------
+    # Turn deadlines
+    # ------------------------------------------------------------------
+    @contextmanager
+    def turn(self, budget: Optional[float] = None):
+        """Attach a deadline to the current chat turn (and tasks it spawns)."""
+        deadline = time.monotonic() + (budget if budget is not None else self.turn_deadline)
+        token = _turn_deadline.set(deadline)
+        try:
+            yield
+        finally:
+            _turn_deadline.reset(token)
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        """Seconds left in the current turn, or None outside a turn."""
+        deadline = _turn_deadline.get()
+        if deadline is None:
+            return None
+        return deadline - time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+    def _shed(self, bulkhead: _Bulkhead, reason: str) -> Overloaded:
+        if reason == "queue_full":
+            bulkhead.shed_queue_full += 1
+        else:
+            bulkhead.shed_deadline += 1
+        logger.warning(
+            f"Shedding {bulkhead.backend.value} call ({reason}); "
+            f"in_flight={bulkhead.in_flight}, queue_depth={bulkhead.waiting}"
+        )
+        return Overloaded(bulkhead.backend, reason)
+
+    @asynccontextmanager
+    async def slot(self, backend: Backend):
+        """
+        Hold one concurrency slot for `backend` for the duration of the block.
+
+        Raises:
+            Overloaded: if the wait queue is full or the turn deadline passes
+                        before a slot frees up.
+        """
+        bulkhead = self._bulkheads[backend]
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise self._shed(bulkhead, "deadline")
+
+        if bulkhead.semaphore.locked() and bulkhead.waiting >= bulkhead.max_queue:
+            raise self._shed(bulkhead, "queue_full")
+
+        bulkhead.waiting += 1
+        started = time.monotonic()
+        try:
+            if remaining is None:
+                await bulkhead.semaphore.acquire()
+            elif not await _acquire_within(bulkhead.semaphore, remaining):
+                raise self._shed(bulkhead, "deadline")
+        finally:
+            bulkhead.waiting -= 1
+
+        bulkhead.admitted += 1
+        bulkhead.total_wait_seconds += time.monotonic() - started
+        bulkhead.in_flight += 1
+        try:
+            yield
+        finally:
+            bulkhead.in_flight -= 1
+            bulkhead.semaphore.release()
+
+    def under_pressure(self, backend: Backend) -> bool:
+        """True when the backend is saturated and its queue is building up."""
+        bulkhead = self._bulkheads[backend]
+        if bulkhead.in_flight < bulkhead.limit:
+            return False
+        threshold = max(1, int(bulkhead.max_queue * self.pressure_ratio))
+        return bulkhead.waiting >= threshold
+
+    def record_downgrade(self) -> None:
+        self.downgrades += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backends": {b.value: bh.stats() for b, bh in self._bulkheads.items()},
+            "route_downgrades": self.downgrades,
+        }
+
+
+# Module-level singleton instance
+_governor_instance = None
+
+
+def get_governor() -> ConcurrencyGovernor:
+    """
+    Get or create a singleton ConcurrencyGovernor instance.
+
+    Returns:
+        ConcurrencyGovernor instance
+    """
+    global _governor_instance
+    if _governor_instance is None:
+        _governor_instance = ConcurrencyGovernor()
+    return _governor_instance
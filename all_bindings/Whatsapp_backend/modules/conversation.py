@@ -2,7 +2,7 @@
 from datetime import datetime
 import uuid
 
-from supabase_client import supabase_insert, supabase_select
+from storage import supabase_insert, supabase_select
 
 
 def _save_message(user_id: str, message: str, lang: str, message_type: str, chat_id: str | None = None):
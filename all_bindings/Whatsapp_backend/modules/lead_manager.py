@@ -1,8 +1,29 @@
 # modules/lead_manager.py
+"""
+Conversational lead capture (/newlead) and the per-user chat state it runs on.
+
+Chat state lives in sakhi_chat_states (user_id unique, context jsonb,
+version integer not null default 0, added by
+all_bindings/migrations/20261019_sakhi_chat_states_version.sql) behind
+ChatStateStore:
+- Reads go through a per-user in-process cache. Users with no row are cached
+  too (negative entries), so the "no lead flow active" check that every
+  normal turn makes costs no network call.
+- Writes are one round-trip: an insert when the user has no row, otherwise an
+  update guarded by version=eq.<cached version>. A guarded update that
+  matches nothing, or an insert rejected by the user_id unique constraint,
+  means another worker wrote first; the store reloads, re-applies the change
+  and retries.
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
-from supabase_client import supabase_insert, supabase_select, supabase_update
+from storage import supabase_insert, supabase_select, supabase_update
 
 # Steps in the onboarding flow
 STEP_NAME = "ask_name"
@@ -12,34 +33,159 @@ STEP_GENDER = "ask_gender"
 STEP_PROBLEM = "ask_problem"
 STEP_COMPLETE = "complete"
 
+CHAT_STATE_TABLE = "sakhi_chat_states"
+# How long a cached state (or a cached "no row") is trusted. The cache is per
+# process; with several workers behind a non-sticky balancer keep this short.
+CHAT_STATE_CACHE_TTL_SECONDS = float(os.getenv("CHAT_STATE_CACHE_TTL_SECONDS", "300"))
+# Users kept in the cache (least recently used are evicted first)
+CHAT_STATE_CACHE_SIZE = int(os.getenv("CHAT_STATE_CACHE_SIZE", "10000"))
+# Attempts for a write that keeps losing the version check
+CHAT_STATE_MAX_RETRIES = 3
+
+
+class ChatStateConflict(Exception):
+    """Raised when a chat state write loses the version check on every attempt."""
+
+
+class ChatStateStore:
+    """
+    Cached, version-checked access to sakhi_chat_states.
+
+    Cache entries are (context, version, exists, expires_at). `version` is the
+    stored value as read (None for rows written before the column existed);
+    `exists` is False for users with no row yet.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = CHAT_STATE_CACHE_TTL_SECONDS,
+        max_users: int = CHAT_STATE_CACHE_SIZE,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._cache: "OrderedDict[str, Tuple[dict, Optional[int], bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "negative_hits": 0, "misses": 0, "writes": 0, "conflicts": 0}
+
+    def _cached(self, user_id: str) -> Optional[Tuple[dict, Optional[int], bool]]:
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is None or entry[3] < time.monotonic():
+                return None
+            self._cache.move_to_end(user_id)
+            self._counters["hits" if entry[2] else "negative_hits"] += 1
+            return entry[0], entry[1], entry[2]
+
+    def _remember(self, user_id: str, context: dict, version: Optional[int], exists: bool) -> None:
+        with self._lock:
+            self._cache[user_id] = (context, version, exists, time.monotonic() + self.ttl_seconds)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "cached_users": len(self._cache)}
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _load(self, user_id: str) -> Tuple[dict, Optional[int], bool]:
+        self._counters["misses"] += 1
+        rows = supabase_select(CHAT_STATE_TABLE, select="context,version", filters=f"user_id=eq.{user_id}")
+        if rows and isinstance(rows, list):
+            # Ensure we return a dict, even if DB has None/null
+            context = rows[0].get("context") or {}
+            version, exists = rows[0].get("version"), True
+        else:
+            context, version, exists = {}, None, False
+        self._remember(user_id, context, version, exists)
+        return context, version, exists
+
+    def get(self, user_id: str) -> dict:
+        """Current context for the user ({} when there is none). Returns a deep copy."""
+        cached = self._cached(user_id)
+        context, _, _ = cached if cached is not None else self._load(user_id)
+        return copy.deepcopy(context)
+
+    def _insert(self, user_id: str, context: dict) -> bool:
+        """Create the user's row. False when another worker created it first."""
+        try:
+            supabase_insert(CHAT_STATE_TABLE, {"user_id": user_id, "context": context, "version": 1})
+            return True
+        except Exception:
+            # A unique-constraint rejection means we lost the race; anything else is re-raised
+            self.invalidate(user_id)
+            if self._load(user_id)[2]:
+                return False
+            raise
+
+    def update(self, user_id: str, changes: dict) -> dict:
+        """
+        Merge changes into the user's context and persist it.
+
+        Returns the stored context. Raises ChatStateConflict if concurrent
+        writers win the version check CHAT_STATE_MAX_RETRIES times.
+        """
+        cached = self._cached(user_id)
+        current, version, exists = cached if cached is not None else self._load(user_id)
+
+        for _ in range(CHAT_STATE_MAX_RETRIES):
+            merged = copy.deepcopy({**current, **changes})
+            self._counters["writes"] += 1
+            if not exists:
+                written = self._insert(user_id, merged)
+                new_version = 1
+            else:
+                # Rows written before the version column existed hold NULL
+                guard = f"version=eq.{version}" if version is not None else "version=is.null"
+                new_version = (version or 0) + 1
+                written = bool(supabase_update(
+                    CHAT_STATE_TABLE,
+                    f"user_id=eq.{user_id}&{guard}",
+                    {"context": merged, "version": new_version},
+                ))
+            if written:
+                self._remember(user_id, merged, new_version, True)
+                return copy.deepcopy(merged)
+
+            # Lost the race: someone else created the row or bumped the version since we read it
+            self._counters["conflicts"] += 1
+            self.invalidate(user_id)
+            current, version, exists = self._load(user_id)
+
+        raise ChatStateConflict(f"chat state for {user_id} kept changing; gave up after {CHAT_STATE_MAX_RETRIES} attempts")
+
+
+_chat_state_store_instance = None
+
+
+def get_chat_state_store() -> ChatStateStore:
+    """
+    Get or create a singleton ChatStateStore instance.
+
+    Returns:
+        ChatStateStore instance
+    """
+    global _chat_state_store_instance
+    if _chat_state_store_instance is None:
+        _chat_state_store_instance = ChatStateStore()
+    return _chat_state_store_instance
+
+
 def _get_chat_state(user_id: str) -> dict:
     """Retrieve the chat state from sakhi_chat_states table."""
     try:
-        rows = supabase_select("sakhi_chat_states", select="context", filters=f"user_id=eq.{user_id}")
-        if rows and isinstance(rows, list) and len(rows) > 0:
-            val = rows[0].get("context")
-            # Ensure we return a dict, even if DB has None/null
-            if val is None:
-                return {}
-            return val
+        return get_chat_state_store().get(user_id)
     except Exception as e:
         print(f"Error fetching chat state: {e}")
         return {}
-    return {}
+
 
 def _update_chat_state(user_id: str, context: dict):
-    """Update or insert the chat state in sakhi_chat_states table."""
-    # Check if exists
-    rows = supabase_select("sakhi_chat_states", select="user_id", filters=f"user_id=eq.{user_id}")
-    if rows:
-        match = f"user_id=eq.{user_id}"
-        # We merge with existing context ideally, but here we can just overwrite or merge
-        # For safety, let's fetch current, merge, and save
-        current = _get_chat_state(user_id)
-        current.update(context)
-        return supabase_update("sakhi_chat_states", match, {"context": current})
-    else:
-        return supabase_insert("sakhi_chat_states", {"user_id": user_id, "context": context})
+    """Merge context into the chat state in sakhi_chat_states table."""
+    return get_chat_state_store().update(user_id, context)
 
 def handle_lead_flow(user_id: str, message: str, user_profile: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -0,0 +1,218 @@
+# modules/lexical_index.py
+"""
+Local BM25 index over the RAG corpus, for hybrid retrieval.
+
+Embedding search alone misses exact-term queries (clinic names, drug names,
+"AMH", "hCG"), especially when they arrive inside Tinglish sentences. This
+module keeps an in-memory inverted index over:
+
+- section_chunks: header_path + section_content (header terms weighted up)
+- the FAQ table: question (+ answer, weighted down)
+
+and ranks with BM25. search_hierarchical fuses these rankings with the vector
+results via reciprocal-rank fusion.
+
+The index is loaded from Supabase on first use and reloaded in the background
+every LEXICAL_INDEX_REFRESH_SECONDS.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import supabase_select
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SECTION_CHUNKS_TABLE = os.getenv("SECTION_CHUNKS_TABLE", "section_chunks")
+FAQ_TABLE = os.getenv("FAQ_TABLE", "faq")
+REFRESH_SECONDS = float(os.getenv("LEXICAL_INDEX_REFRESH_SECONDS", "900"))
+PAGE_SIZE = 1000
+
+# Field weights
+HEADER_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+QUESTION_WEIGHT = 2.0
+ANSWER_WEIGHT = 0.5
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Latin word characters plus the Telugu block (vowel signs are not matched by \w)
+_TOKEN_RE = re.compile(r"[\w\u0C00-\u0C7F]+", re.UNICODE)
+# English function words plus the most common Tinglish fillers
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "with", "you", "your",
+    "ante", "enti", "emiti", "naku", "nenu", "ela", "entha", "ga", "ki", "lo", "ni", "em", "cheppandi",
+}
+
+
+def _normalize(token: str) -> str:
+    token = token.lower()
+    # Light plural folding for English ("embryos" -> "embryo")
+    if token.isascii() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [
+        term for term in (_normalize(t) for t in _TOKEN_RE.findall(text))
+        if term not in _STOPWORDS
+    ]
+
+
+def result_key(item: Dict[str, Any]) -> str:
+    """
+    Stable identity of a retrieved row, shared by vector and lexical results.
+    Content-based, since the RPCs do not necessarily return row ids.
+    """
+    basis = f"{item.get('header_path', '')}|{item.get('section_content') or item.get('question') or ''}"
+    return f"{item.get('source_type', '')}:{hashlib.sha1(basis.encode('utf-8')).hexdigest()}"
+
+
+class _BM25:
+    """Static BM25 index over weighted term counts."""
+
+    def __init__(self, docs: List[Tuple[Dict[str, Any], Counter]]):
+        self.rows = [row for row, _ in docs]
+        self.lengths = [sum(terms.values()) for _, terms in docs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc_index, (_, terms) in enumerate(docs):
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((doc_index, tf))
+
+    def search(self, terms: List[str], limit: int) -> List[Tuple[Dict[str, Any], float]]:
+        n_docs = len(self.rows)
+        if not n_docs or not terms:
+            return []
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_index] / (self.avg_length or 1.0))
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(self.rows[i], score) for i, score in ranked]
+
+
+def _weighted_terms(*fields: Tuple[Optional[str], float]) -> Counter:
+    terms: Counter = Counter()
+    for text, weight in fields:
+        for term in tokenize(text):
+            terms[term] += weight
+    return terms
+
+
+class LexicalIndex:
+    """
+    BM25 indexes over document chunks and FAQ questions.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._chunks = _BM25([])
+        self._faqs = _BM25([])
+        self._loaded_at = 0.0
+        self._loading: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _fetch(table: str, select: str) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            batch = supabase_select(table, select=select, filters=f"order=id&offset={offset}", limit=PAGE_SIZE)
+            if not isinstance(batch, list):
+                return rows
+            rows.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def load(self) -> None:
+        """Fetch the corpus and rebuild both indexes (blocking)."""
+        started = time.perf_counter()
+        chunks = self._fetch(SECTION_CHUNKS_TABLE, "id,header_path,section_content")
+        faqs = self._fetch(FAQ_TABLE, "id,question,answer,youtube_link,infographic_url")
+
+        chunk_docs = []
+        for row in chunks:
+            row = dict(row, source_type="DOCUMENT")
+            chunk_docs.append((row, _weighted_terms(
+                (row.get("header_path"), HEADER_WEIGHT),
+                (row.get("section_content"), CONTENT_WEIGHT),
+            )))
+        faq_docs = []
+        for row in faqs:
+            row = dict(row, source_type="FAQ")
+            faq_docs.append((row, _weighted_terms(
+                (row.get("question"), QUESTION_WEIGHT),
+                (row.get("answer"), ANSWER_WEIGHT),
+            )))
+
+        self._chunks = _BM25(chunk_docs)
+        self._faqs = _BM25(faq_docs)
+        self._loaded_at = time.monotonic()
+        logger.info(
+            f"Lexical index built: {len(chunk_docs)} chunks, {len(faq_docs)} FAQs "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    async def ensure_loaded(self) -> None:
+        """Load on first use (awaited); afterwards refresh in the background."""
+        if self._loaded_at and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(asyncio.to_thread(self.load))
+        if not self._loaded_at:
+            await asyncio.shield(self._loading)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def search_chunks(self, query: str, limit: int) -> List[Tuple[Dict[str, Any], float]]:
+        return self._chunks.search(tokenize(query), limit)
+
+    def search_faqs(self, query: str, limit: int) -> List[Tuple[Dict[str, Any], float]]:
+        return self._faqs.search(tokenize(query), limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self._chunks.rows),
+            "faqs": len(self._faqs.rows),
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+        }
+
+
+# Module-level singleton instance
+_index_instance = None
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Get or create a singleton LexicalIndex instance.
+
+    Returns:
+        LexicalIndex instance
+    """
+    global _index_instance
+    if _index_instance is None:
+        _index_instance = LexicalIndex()
+    return _index_instance
@@ -0,0 +1,259 @@
+# modules/message_gate.py
+"""
+Per-user message gate for the /sakhi/chat webhook.
+
+WhatsApp retries deliveries and fast-typing users send several short messages
+in a row. Without coordination each call runs the full pipeline concurrently,
+which lets the onboarding steps (name -> gender -> location) and the lead flow
+interleave and corrupt state.
+
+The gate guarantees, per user:
+1. Duplicate deliveries (same message id, or same text within a few seconds)
+   are dropped.
+2. Messages are processed one at a time, in arrival order.
+3. Bursts are coalesced: messages that arrive while an earlier turn for the
+   same user is still running are answered together as the next turn. A
+   message that arrives when nothing is running is answered at once, and
+   commands ("/rewards", "/newlead") are never merged with other text.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long a processed idempotency key is remembered
+DEDUPE_TTL_SECONDS = float(os.getenv("SAKHI_DEDUPE_TTL_SECONDS", "300"))
+# Bucket size used when no message id is supplied (content + time hash)
+CONTENT_DEDUPE_WINDOW_SECONDS = float(os.getenv("SAKHI_CONTENT_DEDUPE_WINDOW_SECONDS", "10"))
+# Set to 0 to answer every message of a burst as its own turn
+COALESCE_BURSTS = int(os.getenv("SAKHI_COALESCE_BURSTS", "1"))
+# How often expired coalescing pauses are swept
+PAUSE_SWEEP_SECONDS = 60.0
+# Upper bound on remembered keys (oldest are evicted first)
+DEDUPE_MAX_KEYS = 10000
+
+# Reply modes where the next message is a direct answer to a question
+# (onboarding, lead capture) and must not be merged with anything else.
+NO_COALESCE_MODES = ("onboarding", "lead_input")
+
+DUPLICATE_RESPONSE = {"reply": None, "mode": "duplicate"}
+COALESCED_RESPONSE = {"reply": None, "mode": "coalesced"}
+
+
+class _UserLane:
+    """Serialization state for a single user."""
+
+    __slots__ = ("lock", "buffer", "active")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Open while a leader request waits behind a running turn, collecting
+        # (message, idempotency_key) pairs of the burst
+        self.buffer: Optional[List[Tuple[str, str]]] = None
+        # Number of in-flight requests holding a reference to this lane
+        self.active = 0
+
+
+class MessageGate:
+    """
+    Serializes, de-duplicates and coalesces chat messages per user.
+    """
+
+    def __init__(
+        self,
+        dedupe_ttl: float = DEDUPE_TTL_SECONDS,
+        coalesce: bool = bool(COALESCE_BURSTS),
+        no_coalesce_modes: Iterable[str] = NO_COALESCE_MODES,
+        max_keys: int = DEDUPE_MAX_KEYS,
+    ):
+        self.dedupe_ttl = dedupe_ttl
+        self.coalesce = coalesce
+        self.no_coalesce_modes = set(no_coalesce_modes)
+        self.max_keys = max_keys
+
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lanes: Dict[str, _UserLane] = {}
+        # user_key -> expiry; set while the user is answering a direct question
+        self._coalesce_paused: Dict[str, float] = {}
+        self._next_pause_sweep = time.monotonic() + PAUSE_SWEEP_SECONDS
+
+        self.duplicates_dropped = 0
+        self.messages_coalesced = 0
+
+    # ------------------------------------------------------------------
+    # Idempotency
+    # ------------------------------------------------------------------
+    def idempotency_key(
+        self,
+        user_key: str,
+        message: str,
+        message_id: Optional[str] = None,
+        timestamp: Optional[str] = None,
+    ) -> str:
+        """
+        Build an idempotency key for an inbound message.
+
+        Prefers the provider message id. Otherwise hashes user + text + timestamp,
+        falling back to a coarse time bucket so quick retries collide.
+        """
+        if message_id:
+            return f"id:{message_id}"
+        if not timestamp:
+            timestamp = str(int(time.time() // CONTENT_DEDUPE_WINDOW_SECONDS))
+        digest = hashlib.sha256(f"{user_key}|{message.strip()}|{timestamp}".encode("utf-8")).hexdigest()
+        return f"h:{digest}"
+
+    def _purge_expired(self, now: float) -> None:
+        while self._seen:
+            key, expiry = next(iter(self._seen.items()))
+            if expiry > now and len(self._seen) <= self.max_keys:
+                break
+            self._seen.popitem(last=False)
+
+    def _check_and_record(self, key: str) -> bool:
+        """Return True if key was already seen (duplicate); record it otherwise."""
+        now = time.monotonic()
+        self._purge_expired(now)
+        expiry = self._seen.get(key)
+        if expiry is not None and expiry > now:
+            return True
+        self._seen[key] = now + self.dedupe_ttl
+        self._seen.move_to_end(key)
+        return False
+
+    def forget(self, key: str) -> None:
+        """Drop a recorded key so a retry of a failed message is processed again."""
+        self._seen.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Coalescing hints
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _is_command(message: str) -> bool:
+        return message.strip().startswith("/")
+
+    def _sweep_paused(self, now: float) -> None:
+        """Drop expired pauses of users who never came back to clear them."""
+        if now < self._next_pause_sweep:
+            return
+        self._next_pause_sweep = now + PAUSE_SWEEP_SECONDS
+        for user_key in [k for k, expiry in self._coalesce_paused.items() if expiry <= now]:
+            del self._coalesce_paused[user_key]
+
+    def _can_coalesce(self, user_key: str) -> bool:
+        if not self.coalesce:
+            return False
+        expiry = self._coalesce_paused.get(user_key)
+        if expiry is None:
+            return True
+        if expiry <= time.monotonic():
+            del self._coalesce_paused[user_key]
+            return True
+        return False
+
+    def _update_coalesce_hint(self, user_key: str, result: Any) -> None:
+        mode = result.get("mode") if isinstance(result, dict) else None
+        if mode in self.no_coalesce_modes:
+            self._coalesce_paused[user_key] = time.monotonic() + self.dedupe_ttl
+        else:
+            self._coalesce_paused.pop(user_key, None)
+
+    # ------------------------------------------------------------------
+    # Main entry point
+    # ------------------------------------------------------------------
+    async def submit(
+        self,
+        user_key: str,
+        message: str,
+        idempotency_key: str,
+        handler: Callable[[str], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Run handler(message) for this user, serialized behind any earlier turns.
+
+        Returns DUPLICATE_RESPONSE for repeated deliveries and COALESCED_RESPONSE
+        for messages folded into a burst that another request is answering.
+        """
+        if self._check_and_record(idempotency_key):
+            self.duplicates_dropped += 1
+            logger.info(f"Duplicate message dropped for {user_key} ({idempotency_key[:20]})")
+            return dict(DUPLICATE_RESPONSE)
+
+        self._sweep_paused(time.monotonic())
+        lane = self._lanes.get(user_key)
+        if lane is None:
+            lane = self._lanes[user_key] = _UserLane()
+        command = self._is_command(message)
+
+        # A leader is waiting behind a running turn: fold the message into its burst
+        if lane.buffer is not None and not command:
+            lane.buffer.append((message, idempotency_key))
+            self.messages_coalesced += 1
+            logger.info(f"Coalesced message for {user_key} into pending turn ({len(lane.buffer)} parts)")
+            return dict(COALESCED_RESPONSE)
+        if command:
+            # Later messages must not jump ahead of the command into the open burst
+            lane.buffer = None
+
+        lane.active += 1
+        batch = [(message, idempotency_key)]
+        try:
+            # A burst: an earlier turn is still running, so this message waits
+            # anyway; collect whatever else arrives until it finishes
+            if lane.lock.locked() and not command and self._can_coalesce(user_key):
+                lane.buffer = batch
+                try:
+                    await lane.lock.acquire()
+                finally:
+                    lane.buffer = None
+            else:
+                await lane.lock.acquire()
+
+            try:
+                result = await handler("\n".join(text for text, _ in batch))
+            finally:
+                lane.lock.release()
+
+            self._update_coalesce_hint(user_key, result)
+            return result
+        except BaseException:
+            # Let the provider's redelivery of every merged message through again
+            for _, key in batch:
+                self.forget(key)
+            raise
+        finally:
+            lane.active -= 1
+            if lane.active == 0 and lane.buffer is None:
+                self._lanes.pop(user_key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_users": len(self._lanes),
+            "dedupe_keys": len(self._seen),
+            "duplicates_dropped": self.duplicates_dropped,
+            "messages_coalesced": self.messages_coalesced,
+        }
+
+
+# Module-level singleton instance
+_gate_instance = None
+
+
+def get_message_gate() -> MessageGate:
+    """
+    Get or create a singleton MessageGate instance.
+
+    Returns:
+        MessageGate instance
+    """
+    global _gate_instance
+    if _gate_instance is None:
+        _gate_instance = MessageGate()
+    return _gate_instance
@@ -1,21 +1,39 @@
 # modules/model_gateway.py
 import logging
-from enum import Enum
-from typing import List, Dict, Union
+import os
+from collections import Counter
+from typing import Any, List, Dict, Optional, Union
 import numpy as np
 
 from rag import generate_embedding, async_generate_embedding
+from modules.admission_control import get_governor, Backend
+from modules.routing import Route
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class Route(Enum):
-    """Routing destinations for user queries."""
-    SLM_DIRECT = "slm_direct"  # Small talk, no RAG needed
-    SLM_RAG = "slm_rag"  # Simple medical, RAG + SLM
-    OPENAI_RAG = "openai_rag"  # Complex medical, RAG + OpenAI
+# A route decided by less than this (distance of the deciding similarity from
+# its threshold or from the competing category) is low confidence: the chat
+# turn then re-routes on the English translation.
+ROUTE_CONFIDENCE_MARGIN = float(os.getenv("ROUTE_CONFIDENCE_MARGIN", "0.05"))
+
+
+class RouteDecision:
+    """A route plus how clearly it won and the similarity scores behind it."""
+
+    __slots__ = ("route", "margin", "reason", "scores")
+
+    def __init__(self, route: Route, margin: float, reason: str, scores: Dict[str, float]):
+        self.route = route
+        self.margin = margin
+        self.reason = reason
+        self.scores = scores
+
+    @property
+    def confident(self) -> bool:
+        return self.margin >= ROUTE_CONFIDENCE_MARGIN
 
 
 class ModelGateway:
@@ -235,6 +253,119 @@ class ModelGateway:
         ],
     }
     
+    # Tinglish (romanised Telugu) and Telugu-script anchors, so raw messages
+    # route without being translated first. Each language gets its own anchor
+    # per category (averaging them into the English anchor would blur both).
+    # Only a raw message detected as that language is scored against them
+    # (a category then scores the best of its English and language anchors);
+    # English messages and translations keep the English-only scoring.
+    MULTILINGUAL_EXAMPLES = {
+        "TINGLISH": {
+            "small_talk": [
+                "namaste",
+                "namaskaram",
+                "hi andi",
+                "ela unnaru",
+                "ela unnav",
+                "bagunnara",
+                "nenu bagunnanu",
+                "thanks andi",
+                "chala thanks",
+                "dhanyavadalu",
+                "mee peru enti",
+                "meeru evaru",
+                "good morning andi",
+                "subhodayam",
+                "malli kaluddam",
+                "sare andi",
+                "ok andi",
+                "parledu",
+            ],
+            "medical_simple": [
+                "ivf ante enti",
+                "ivf cost entha avutundi",
+                "iui ela chestaru",
+                "pcos lakshanalu enti",
+                "pcod ki treatment enti",
+                "pregnancy lo em tinali",
+                "pregnancy ela vastundi",
+                "sperm count ela penchali",
+                "egg freezing ela chestaru",
+                "folic acid enduku vadali",
+                "fertility ela improve cheyali",
+                "c section tarvata recovery ki entha time",
+                "pregnancy lo yoga cheyocha",
+                "amh test ante enti",
+                "meeru e treatments chestaru",
+            ],
+            "medical_complex": [
+                "chala bleeding avutundi",
+                "pregnancy lo heavy bleeding avutundi",
+                "baby kadalatledu",
+                "kadupu lo bhayankaramaina noppi",
+                "tala noppi ekkuva ga undi kallu sariga kanipinchatledu",
+                "chest noppi ga undi swasa aadatledu",
+                "miscarriage lakshanalu",
+                "pregnancy lo bp chala ekkuva undi",
+            ],
+            "facility_info": [
+                "vizag lo clinic ekkada undi",
+                "clinic address cheppandi",
+                "hyderabad branch phone number enti",
+                "clinic timings enti",
+                "appointment kosam number ivvandi",
+                "daggarlo clinic ekkada undi",
+                "vijayawada branch ki ela ravali",
+            ],
+        },
+        "TELUGU": {
+            "small_talk": [
+                "నమస్కారం",
+                "నమస్తే",
+                "ఎలా ఉన్నారు",
+                "బాగున్నారా",
+                "ధన్యవాదాలు",
+                "చాలా థాంక్స్",
+                "మీ పేరు ఏమిటి",
+                "మీరు ఎవరు",
+                "శుభోదయం",
+                "శుభ రాత్రి",
+                "సరే",
+                "మళ్ళీ కలుద్దాం",
+            ],
+            "medical_simple": [
+                "ఐవీఎఫ్ అంటే ఏమిటి",
+                "ఐవీఎఫ్ ఖర్చు ఎంత",
+                "పీసీఓఎస్ లక్షణాలు ఏమిటి",
+                "గర్భధారణ సమయంలో ఏమి తినాలి",
+                "గర్భం ఎలా వస్తుంది",
+                "వీర్య కణాల సంఖ్య ఎలా పెంచాలి",
+                "సంతానలేమికి కారణాలు ఏమిటి",
+                "ఫోలిక్ యాసిడ్ ఎందుకు తీసుకోవాలి",
+                "సిజేరియన్ తర్వాత కోలుకోవడానికి ఎంత సమయం పడుతుంది",
+                "గర్భధారణ సమయంలో యోగా చేయవచ్చా",
+                "ఏ చికిత్సలు అందుబాటులో ఉన్నాయి",
+            ],
+            "medical_complex": [
+                "చాలా రక్తస్రావం అవుతోంది",
+                "గర్భంలో బిడ్డ కదలడం లేదు",
+                "కడుపులో తీవ్రమైన నొప్పి",
+                "గర్భధారణలో అధిక రక్తస్రావం",
+                "తీవ్రమైన తలనొప్పి, చూపు మసకగా ఉంది",
+                "ఛాతీ నొప్పి, ఊపిరి ఆడటం లేదు",
+                "గర్భస్రావం లక్షణాలు",
+            ],
+            "facility_info": [
+                "విశాఖపట్నంలో క్లినిక్ ఎక్కడ ఉంది",
+                "క్లినిక్ చిరునామా చెప్పండి",
+                "హైదరాబాద్ బ్రాంచ్ ఫోన్ నంబర్ ఏమిటి",
+                "క్లినిక్ సమయాలు ఏమిటి",
+                "అపాయింట్‌మెంట్ కోసం నంబర్ ఇవ్వండి",
+                "దగ్గరలో ఉన్న క్లినిక్ ఎక్కడ ఉంది",
+            ],
+        },
+    }
+
     MEDICAL_COMPLEX_EXAMPLES = [
         "severe bleeding",
         "baby not moving",
@@ -276,6 +407,16 @@ class ModelGateway:
     SMALL_TALK_THRESHOLD = 0.45  # Was 0.75, then 0.50
     MEDICAL_SIMPLE_THRESHOLD = 0.45  # Was 0.60
     FACILITY_INFO_THRESHOLD = 0.40  # Was 0.50
+
+    # Thresholds for raw Tinglish / Telugu messages scored with their language's
+    # anchors. Same-language text scores higher against its own anchors whatever
+    # the intent (Telugu script most of all), so these sit above the English
+    # ones; a message that clears them only narrowly is low confidence and
+    # re-routes on the translation. Tune with benchmarks/route_agreement.py --sweep.
+    MULTILINGUAL_THRESHOLDS = {
+        "TINGLISH": {"small_talk": 0.50, "medical_simple": 0.50, "facility_info": 0.45},
+        "TELUGU": {"small_talk": 0.55, "medical_simple": 0.55, "facility_info": 0.50},
+    }
     
     def __init__(self):
         """Initialize the gateway by computing anchor vectors."""
@@ -294,6 +435,16 @@ class ModelGateway:
             
         self.medical_complex_anchor = self._compute_mean_vector(self.MEDICAL_COMPLEX_EXAMPLES)
         self.facility_info_anchor = self._compute_mean_vector(self.FACILITY_INFO_EXAMPLES)
+
+        # Per-language anchors: category -> {language: vector}
+        logger.info("Computing Tinglish and Telugu anchors...")
+        self.multilingual_anchors = {}
+        for language, categories in self.MULTILINGUAL_EXAMPLES.items():
+            for category, examples in categories.items():
+                self.multilingual_anchors.setdefault(category, {})[language] = self._compute_mean_vector(examples)
+
+        # Raw-message decisions vs. low-confidence fallbacks to the translation
+        self._route_stats = Counter()
         
         logger.info("ModelGateway initialized successfully")
     
@@ -342,33 +493,89 @@ class ModelGateway:
         
         return dot_product / (norm1 * norm2)
     
-    async def decide_route(self, user_text: str) -> Route:
+    def _best_similarity(
+        self, user_vector: np.ndarray, category: str, english_anchor: np.ndarray, language: Optional[str]
+    ) -> float:
+        """Similarity to a category: the best of its English anchor and the language's anchor, if any."""
+        anchors = [english_anchor]
+        if language in self.MULTILINGUAL_EXAMPLES:
+            anchors.append(self.multilingual_anchors[category][language])
+        return max(self._cosine_similarity(user_vector, anchor) for anchor in anchors)
+    
+    async def decide_route(self, user_text: str, query_vector: Optional[List[float]] = None) -> Route:
         """
         Determine the appropriate route for a user query based on semantic similarity.
         
         Args:
             user_text: User's input message
+            query_vector: Embedding of user_text, if the caller already has it
             
         Returns:
             Route enum indicating which model to use
         """
+        return (await self.score_route(user_text, query_vector)).route
+    
+    async def score_route(
+        self, user_text: str, query_vector: Optional[List[float]] = None, language: Optional[str] = None
+    ) -> RouteDecision:
+        """
+        Like decide_route, but also report how confident the decision is.
+        
+        With language "tinglish" or "telugu" (a raw message, as detect_language
+        labels it), that language's anchors and MULTILINGUAL_THRESHOLDS are
+        used too, so the message can be routed without translating it first.
+        Otherwise only the English anchors and thresholds are used. The margin
+        is the smallest gap between a similarity and the threshold or
+        competing score that decided the route; the low-confidence default to
+        OPENAI_RAG has margin 0.
+        
+        Args:
+            user_text: User's input message (raw or translated)
+            query_vector: Embedding of user_text, if the caller already has it
+            language: Detected language of a raw message, if not English
+            
+        Returns:
+            RouteDecision with the route, margin, reason and similarity scores
+        """
+        language = (language or "").upper()
+        thresholds = self.MULTILINGUAL_THRESHOLDS.get(language, {})
         # Generate embedding for user input
-        user_vector = np.array(await async_generate_embedding(user_text))
+        if query_vector is None:
+            async with get_governor().slot(Backend.EMBEDDINGS):
+                query_vector = await async_generate_embedding(user_text)
+        user_vector = np.array(query_vector)
         
         # Calculate similarities to each anchor
-        small_talk_sim = self._cosine_similarity(user_vector, self.small_talk_anchor)
+        small_talk_sim = self._best_similarity(user_vector, "small_talk", self.small_talk_anchor, language)
         
         # Calculate MAX similarity across all simple medical categories
         simple_sims = {}
         for key, anchor in self.medical_simple_anchors.items():
             simple_sims[key] = self._cosine_similarity(user_vector, anchor)
+        if language in self.MULTILINGUAL_EXAMPLES:
+            simple_sims[language] = self._cosine_similarity(user_vector, self.multilingual_anchors["medical_simple"][language])
         
         # Get the best matching category and score
         best_simple_category = max(simple_sims, key=simple_sims.get) if simple_sims else "NONE"
         medical_simple_sim = simple_sims[best_simple_category] if simple_sims else 0.0
         
-        medical_complex_sim = self._cosine_similarity(user_vector, self.medical_complex_anchor)
-        facility_info_sim = self._cosine_similarity(user_vector, self.facility_info_anchor)
+        medical_complex_sim = self._best_similarity(user_vector, "medical_complex", self.medical_complex_anchor, language)
+        facility_info_sim = self._best_similarity(user_vector, "facility_info", self.facility_info_anchor, language)
+        scores = {
+            "small_talk": round(float(small_talk_sim), 3),
+            "medical_simple": round(float(medical_simple_sim), 3),
+            "medical_complex": round(float(medical_complex_sim), 3),
+            "facility_info": round(float(facility_info_sim), 3),
+        }
+
+        def decision(route: Route, reason: str, *gaps: float) -> RouteDecision:
+            return RouteDecision(route, round(float(min(gaps)), 3), reason, scores)
+
+        # Signed distances from each decision boundary (>= 0 means that branch fires)
+        small_talk_gap = small_talk_sim - thresholds.get("small_talk", self.SMALL_TALK_THRESHOLD)
+        facility_gap = facility_info_sim - thresholds.get("facility_info", self.FACILITY_INFO_THRESHOLD)
+        complex_gap = medical_complex_sim - medical_simple_sim
+        simple_gap = medical_simple_sim - thresholds.get("medical_simple", self.MEDICAL_SIMPLE_THRESHOLD)
         
         # Log similarity scores for debugging
         logger.info(f"Query: '{user_text[:50]}...'")
@@ -378,29 +585,46 @@ class ModelGateway:
                    f"Facility Info: {facility_info_sim:.3f}")
         
         # Routing logic based on thresholds and highest similarity
-        if small_talk_sim >= self.SMALL_TALK_THRESHOLD:
+        if small_talk_gap >= 0:
             logger.info(f"→ Routing to: SLM_DIRECT (small talk detected)")
-            return Route.SLM_DIRECT
+            return decision(Route.SLM_DIRECT, "small_talk", small_talk_gap)
         
         # Check for facility/location queries FIRST - route to SLM since it has this info
         # This takes priority over medical queries to ensure clinic info is retrieved
-        if facility_info_sim >= self.FACILITY_INFO_THRESHOLD:
+        if facility_gap >= 0:
             logger.info(f"→ Routing to: SLM_RAG (facility/location info query)")
-            return Route.SLM_RAG
+            return decision(Route.SLM_RAG, "facility_info", -small_talk_gap, facility_gap)
         
         # Only check medical queries if it's not a facility query
-        if medical_complex_sim >= medical_simple_sim:
+        if complex_gap >= 0:
             # Complex medical or default to safest option
             logger.info(f"→ Routing to: OPENAI_RAG (complex medical or default)")
-            return Route.OPENAI_RAG
+            return decision(Route.OPENAI_RAG, "medical_complex", -small_talk_gap, -facility_gap, complex_gap)
         
-        if medical_simple_sim >= self.MEDICAL_SIMPLE_THRESHOLD:
+        if simple_gap >= 0:
             logger.info(f"→ Routing to: SLM_RAG (simple medical query)")
-            return Route.SLM_RAG
+            return decision(Route.SLM_RAG, "medical_simple", -small_talk_gap, -facility_gap, -complex_gap, simple_gap)
         
         # Default to OpenAI for safety when confidence is low
         logger.info(f"→ Routing to: OPENAI_RAG (low confidence, defaulting to safe option)")
-        return Route.OPENAI_RAG
+        return decision(Route.OPENAI_RAG, "default", 0.0)
+
+    def record_decision(self, raw: RouteDecision, translated: Optional[RouteDecision] = None) -> None:
+        """Count a chat turn's routing: raw message only, or raw plus the translated fallback."""
+        if translated is None:
+            self._route_stats["raw"] += 1
+            return
+        self._route_stats["translated_fallback"] += 1
+        if translated.route != raw.route:
+            self._route_stats["fallback_changed_route"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "confidence_margin": ROUTE_CONFIDENCE_MARGIN,
+            "raw": self._route_stats["raw"],
+            "translated_fallback": self._route_stats["translated_fallback"],
+            "fallback_changed_route": self._route_stats["fallback_changed_route"],
+        }
 
 
 # Module-level singleton instance
@@ -3,9 +3,8 @@ import os
 from typing import List, Dict
 
 import supabase_client  # ensures .env is loaded once
-from openai import OpenAI
-
-from supabase_client import supabase_rpc, supabase_insert
+from storage import supabase_rpc, supabase_insert
+from modules.openai_client import get_openai, Priority
 
 EMBEDDING_MODEL = "text-embedding-3-small"
 
@@ -13,16 +12,16 @@ _api_key = os.getenv("OPENAI_API_KEY")
 if not _api_key:
     raise Exception("OPENAI_API_KEY missing")
 
-_client = OpenAI(api_key=_api_key)
+_client = get_openai()
 
 
 def _clean_text(text: str) -> str:
     return (text or "").strip().replace("\n", " ")
 
 
-def _generate_embedding(text: str) -> List[float]:
+def _generate_embedding(text: str, priority: Priority = Priority.INTERACTIVE) -> List[float]:
     cleaned = _clean_text(text)
-    resp = _client.embeddings.create(model=EMBEDDING_MODEL, input=cleaned)
+    resp = _client.embed_sync(priority=priority, model=EMBEDDING_MODEL, input=cleaned)
     return resp.data[0].embedding
 
 
@@ -35,8 +34,8 @@ def search_sakhi_kb(text: str, limit: int = 3) -> List[dict]:
 
     payload = {"query_embedding": embedding, "match_count": limit}
 
-    kb_results = supabase_rpc("match_sakhi_kb", payload)
-    faq_results = supabase_rpc("match_faq", payload)
+    kb_results = supabase_rpc("match_sakhi_kb", payload, idempotent=True)
+    faq_results = supabase_rpc("match_faq", payload, idempotent=True)
 
     merged: List[Dict] = []
 
@@ -63,7 +62,7 @@ def add_kb_entry(title: str, content: str):
     """
     if not content.strip():
         return None
-    emb = _generate_embedding(content)
+    emb = _generate_embedding(content, priority=Priority.BACKGROUND)
     payload = {
         "title": title[:120] if title else "Sakhi note",
         "content": content,
@@ -0,0 +1,321 @@
+# modules/reranker.py
+"""
+Optional second-stage reranker for RAG document chunks.
+
+hierarchical_rag_query over-fetches candidates (RERANK_CANDIDATES) and this
+module reorders them so only the best few (RERANK_TOP_N) reach the prompt.
+Two scorers are available, selected with RAG_RERANKER:
+
+- "lexical": IDF-weighted query-term coverage of header_path and content,
+  blended with the first-stage rank. Pure Python, well under a millisecond.
+- "cross_encoder": a small CPU cross-encoder (sentence-transformers, optional
+  dependency; RERANK_MODEL). All (query, chunk) pairs of a call, or of a batch
+  of queries, go through a single predict() call.
+- "none" (default): no reranking, the first-stage order is kept.
+
+Every call has a latency budget (RERANK_BUDGET_MS). A scorer that overruns it
+is abandoned for that call (first-stage order is returned), and while its
+moving-average latency stays above budget it is bypassed, with one probe call
+every RERANK_PROBE_EVERY requests to notice recovery.
+
+Cross-encoder calls run on one executor of RERANK_WORKERS threads. An abandoned
+call keeps its thread until predict() returns, so while every worker is still
+busy new calls are bypassed instead of queueing behind it. A failed model load
+is retried with exponential backoff, not on every request.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from modules.lexical_index import tokenize
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # optional dependency
+    CrossEncoder = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RERANKERS = ("none", "lexical", "cross_encoder")
+RERANKER = os.getenv("RAG_RERANKER", "none")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched for reranking, and how many are kept
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_PROBE_EVERY = int(os.getenv("RERANK_PROBE_EVERY", "20"))
+CROSS_ENCODER_BATCH_SIZE = 32
+# Threads running cross-encoder predict() calls (including abandoned ones)
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+# Model load retry backoff after a failure: doubles per failure up to the max
+LOAD_RETRY_SECONDS = 30.0
+LOAD_RETRY_MAX_SECONDS = 1800.0
+# Characters of chunk text given to the cross-encoder (it truncates anyway)
+CROSS_ENCODER_MAX_CHARS = 1200
+
+# Lexical scorer weights
+HEADER_WEIGHT = 2.0
+# Weight of the first-stage rank in the lexical score (0..1)
+PRIOR_WEIGHT = 0.3
+# Smoothing of the latency moving average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def _chunk_text(item: Dict[str, Any]) -> str:
+    return f"{item.get('header_path') or ''}\n{item.get('section_content') or item.get('answer') or ''}"
+
+
+class _LexicalScorer:
+    """Query-term coverage, IDF-weighted within the candidate set."""
+
+    def score(self, query: str, candidates: Sequence[Dict[str, Any]]) -> List[float]:
+        terms = set(tokenize(query))
+        if not terms or not candidates:
+            return [0.0] * len(candidates)
+        fields = [
+            (set(tokenize(item.get("header_path"))), set(tokenize(item.get("section_content") or item.get("answer"))))
+            for item in candidates
+        ]
+        n = len(candidates)
+        idf = {
+            term: math.log(1 + (n + 1) / (1 + sum(1 for header, body in fields if term in header or term in body)))
+            for term in terms
+        }
+        total = sum(idf.values()) * (1 + HEADER_WEIGHT) or 1.0
+
+        scores = []
+        for rank, (header, body) in enumerate(fields):
+            coverage = sum(
+                weight * ((1.0 if term in body else 0.0) + (HEADER_WEIGHT if term in header else 0.0))
+                for term, weight in idf.items()
+            ) / total
+            prior = 1.0 - rank / n
+            scores.append((1 - PRIOR_WEIGHT) * coverage + PRIOR_WEIGHT * prior)
+        return scores
+
+
+class _CrossEncoderScorer:
+    """Lazily loaded sentence-transformers cross-encoder."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self._loading = False
+        self._load_failures = 0
+        self._next_load_at = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="reranker")
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if CrossEncoder is None:
+                        raise RuntimeError("sentence-transformers is not installed")
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    logger.info(f"Loaded reranker model {self.model_name}")
+        return self._model
+
+    def _load(self) -> None:
+        try:
+            self._get_model()
+            self._load_failures = 0
+        except Exception as e:
+            self._load_failures += 1
+            delay = min(LOAD_RETRY_SECONDS * 2 ** (self._load_failures - 1), LOAD_RETRY_MAX_SECONDS)
+            self._next_load_at = time.monotonic() + delay
+            logger.warning(f"Loading reranker model {self.model_name} failed, retrying in {delay:.0f}s: {e}")
+        finally:
+            self._loading = False
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def warm(self) -> None:
+        """Load the model in a background thread (first load takes seconds)."""
+        with self._lock:
+            if self._model is not None or self._loading or time.monotonic() < self._next_load_at:
+                return
+            self._loading = True
+        threading.Thread(target=self._load, name="reranker-load", daemon=True).start()
+
+    def score_pairs(self, pairs: List[List[str]]) -> List[float]:
+        if not pairs:
+            return []
+        return [float(s) for s in self._get_model().predict(pairs, batch_size=CROSS_ENCODER_BATCH_SIZE)]
+
+    def score(self, query: str, candidates: Sequence[Dict[str, Any]]) -> List[float]:
+        return self.score_pairs([[query, _chunk_text(item)[:CROSS_ENCODER_MAX_CHARS]] for item in candidates])
+
+
+class Reranker:
+    """
+    Budgeted reranking with automatic bypass.
+    """
+
+    def __init__(self, kind: str = RERANKER, budget_ms: float = RERANK_BUDGET_MS):
+        if kind not in RERANKERS:
+            logger.warning(f"Unknown RAG_RERANKER '{kind}', reranking disabled")
+            kind = "none"
+        if kind == "cross_encoder" and CrossEncoder is None:
+            logger.warning("sentence-transformers is not installed, using the lexical reranker")
+            kind = "lexical"
+        self.kind = kind
+        self.budget_ms = budget_ms
+        self._scorer = (
+            _LexicalScorer() if kind == "lexical"
+            else _CrossEncoderScorer(RERANK_MODEL) if kind == "cross_encoder"
+            else None
+        )
+        self._latency_ewma_ms = 0.0
+        self._calls_since_probe = 0
+        # Cross-encoder calls submitted and not yet finished (abandoned ones included)
+        self._in_flight = 0
+        self._stats = {"reranked": 0, "bypassed": 0, "busy": 0, "over_budget": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._scorer is not None
+
+    def _should_bypass(self) -> bool:
+        if self._latency_ewma_ms <= self.budget_ms:
+            return False
+        self._calls_since_probe += 1
+        if self._calls_since_probe >= RERANK_PROBE_EVERY:
+            self._calls_since_probe = 0
+            return False
+        return True
+
+    def _record_latency(self, elapsed_ms: float) -> None:
+        if self._latency_ewma_ms == 0.0:
+            self._latency_ewma_ms = elapsed_ms
+        else:
+            self._latency_ewma_ms += LATENCY_EWMA_ALPHA * (elapsed_ms - self._latency_ewma_ms)
+
+    async def _score_within_budget(self, fn, *args) -> Optional[Any]:
+        """Run a scorer (in a worker thread); None when it fails or overruns the budget."""
+        if isinstance(self._scorer, _CrossEncoderScorer) and not self._scorer.ready:
+            # Model load must not count against the per-call budget
+            self._scorer.warm()
+            self._stats["bypassed"] += 1
+            return None
+        if self._should_bypass():
+            self._stats["bypassed"] += 1
+            return None
+        started = time.perf_counter()
+        if isinstance(self._scorer, _LexicalScorer):
+            # Cheaper than a thread hop; measured but never preempted
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Reranker failed, keeping first-stage order: {e}")
+                return None
+            self._record_latency((time.perf_counter() - started) * 1000)
+            return result
+        if self._in_flight >= RERANK_WORKERS:
+            # Every worker is still busy (with overrun calls); do not queue behind them
+            self._stats["busy"] += 1
+            return None
+        self._in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self._scorer.executor, fn, *args)
+
+        def finished(f) -> None:
+            self._in_flight -= 1
+            if not f.cancelled():
+                f.exception()  # retrieved here so an abandoned call's error is not logged as unhandled
+
+        future.add_done_callback(finished)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            self._stats["over_budget"] += 1
+            # Let the thread finish so the moving average sees the real latency
+            future.add_done_callback(lambda _f: self._record_latency((time.perf_counter() - started) * 1000))
+            return None
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Reranker failed, keeping first-stage order: {e}")
+            return None
+        self._record_latency((time.perf_counter() - started) * 1000)
+        return result
+
+    async def rerank(self, query: str, candidates: List[Dict[str, Any]], top_n: int = RERANK_TOP_N) -> List[Dict[str, Any]]:
+        """
+        Reorder `candidates` (best first) and keep `top_n`. Falls back to the
+        incoming order when disabled, bypassed or over budget.
+        """
+        if not self.enabled or len(candidates) <= 1:
+            return candidates[:top_n]
+        scores = await self._score_within_budget(self._scorer.score, query, candidates)
+        if scores is None:
+            return candidates[:top_n]
+        self._stats["reranked"] += 1
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [dict(candidates[i], rerank_score=round(scores[i], 4)) for i in order]
+
+    async def rerank_batch(
+        self,
+        queries: List[str],
+        candidate_lists: List[List[Dict[str, Any]]],
+        top_n: int = RERANK_TOP_N,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Rerank several queries at once. With the cross-encoder, all pairs share
+        one predict() call (one budget for the whole batch).
+        """
+        if not isinstance(self._scorer, _CrossEncoderScorer):
+            return [await self.rerank(q, c, top_n) for q, c in zip(queries, candidate_lists)]
+
+        pairs, owners = [], []
+        for qi, (query, candidates) in enumerate(zip(queries, candidate_lists)):
+            for item in candidates:
+                pairs.append([query, _chunk_text(item)[:CROSS_ENCODER_MAX_CHARS]])
+                owners.append(qi)
+        flat = await self._score_within_budget(self._scorer.score_pairs, pairs)
+        if flat is None:
+            return [candidates[:top_n] for candidates in candidate_lists]
+
+        self._stats["reranked"] += len(queries)
+        per_query: List[List[float]] = [[] for _ in queries]
+        for qi, score in zip(owners, flat):
+            per_query[qi].append(score)
+        results = []
+        for candidates, scores in zip(candidate_lists, per_query):
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_n]
+            results.append([dict(candidates[i], rerank_score=round(scores[i], 4)) for i in order])
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reranker": self.kind,
+            "latency_ewma_ms": round(self._latency_ewma_ms, 2),
+            "budget_ms": self.budget_ms,
+            "in_flight": self._in_flight,
+            **self._stats,
+        }
+
+
+# Module-level singleton instance
+_reranker_instance = None
+
+
+def get_reranker() -> Reranker:
+    """
+    Get or create a singleton Reranker instance.
+
+    Returns:
+        Reranker instance
+    """
+    global _reranker_instance
+    if _reranker_instance is None:
+        _reranker_instance = Reranker()
+    return _reranker_instance
@@ -2,13 +2,14 @@ import os
 import re
 from typing import List, Dict, Optional, Tuple, Any
 
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 # Internal module imports
 from modules.detect_lang import detect_language
 from modules.text_utils import truncate_response
 from modules.search_hierarchical import hierarchical_rag_query, format_hierarchical_context
+from modules.admission_control import get_governor, Backend, Overloaded
+from modules.openai_client import get_openai
 
 # Load env variables (ensure .env is loaded)
 load_dotenv()
@@ -17,7 +18,8 @@ _api_key = os.getenv("OPENAI_API_KEY")
 if not _api_key:
     raise Exception("OPENAI_API_KEY missing")
 
-client = AsyncOpenAI(api_key=_api_key)
+client = get_openai()
+governor = get_governor()
 
 # =============================================================================
 # CONSTANTS & PROMPTS
@@ -74,6 +76,14 @@ Return ONLY a JSON object:
 # HELPER FUNCTIONS
 # =============================================================================
 
+async def _create_completion(**kwargs):
+    """
+    Chat completion guarded by the OpenAI chat concurrency slot and the
+    shared rate budget. Raises Overloaded if the call is shed.
+    """
+    async with governor.slot(Backend.OPENAI_CHAT):
+        return await client.chat(**kwargs)
+
 def contains_telugu_unicode(text: str) -> bool:
     """
     Check if text contains any characters in the Telugu Unicode block (0x0C00 - 0x0C7F).
@@ -179,7 +189,7 @@ async def force_rewrite_to_tinglish(text: str, user_name: Optional[str] = None)
          system_prompt_body += "9. The user's name is UNKNOWN. Do NOT use any name or title (like Ma'am/Sir/Aayi). Just start the sentence.\n"
 
     try:
-        completion = await client.chat.completions.create(
+        completion = await _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt_body},
@@ -229,7 +239,7 @@ async def force_rewrite_to_tinglish(text: str, user_name: Optional[str] = None)
         )
         
         try:
-            completion_fu = await client.chat.completions.create(
+            completion_fu = await _create_completion(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": system_prompt_fu},
@@ -290,7 +300,7 @@ async def force_rewrite_to_telugu(text: str, user_name: Optional[str] = None) ->
          system_prompt_body += f"5. Greeting: Start with 'హాయ్ {user_name},'. Do NOT translate the name (keep it if simple, or transliterate).\n"
 
     try:
-        completion_body = await client.chat.completions.create(
+        completion_body = await _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt_body},
@@ -318,7 +328,7 @@ async def force_rewrite_to_telugu(text: str, user_name: Optional[str] = None) ->
         )
         
         try:
-            completion_fu = await client.chat.completions.create(
+            completion_fu = await _create_completion(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": system_prompt_fu},
@@ -381,7 +391,7 @@ async def classify_message(message: str) -> Dict[str, Any]:
 
     # Use LLM for both Signal and Language detection
     try:
-        completion = await client.chat.completions.create(
+        completion = await _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": CLASSIFIER_SYS_PROMPT},
@@ -441,7 +451,7 @@ async def generate_smalltalk_response(
     )
 
     try:
-        completion = await client.chat.completions.create(
+        completion = await _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_content},
@@ -470,10 +480,13 @@ async def generate_medical_response(
     target_lang: str,
     history: Optional[List[Dict[str, str]]],
     user_name: Optional[str] = None,
+    retrieval_mode: Optional[str] = None,
+    kb_results: Optional[List[dict]] = None,
 ) -> Tuple[str, List[dict]]:
     
-    # 1. RAG Retrieval
-    kb_results, _similarity = await hierarchical_rag_query(prompt)
+    # 1. RAG Retrieval (skipped when the caller already retrieved for this turn)
+    if kb_results is None:
+        kb_results, _similarity = await hierarchical_rag_query(prompt, mode=retrieval_mode)
     context_text = format_hierarchical_context(kb_results)
     has_history = bool(history)
     history_block = _build_history_block(history)
@@ -520,7 +533,7 @@ async def generate_medical_response(
 
     # 3. LLM Generation
     try:
-        completion = await client.chat.completions.create(
+        completion = await _create_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_content},
@@ -540,6 +553,9 @@ async def generate_medical_response(
             
         return response_text, kb_results
 
+    except Overloaded:
+        # Let the caller surface backpressure (503) instead of a fake answer
+        raise
     except Exception as e:
         print(f"Medical gen error: {e}")
         return "I encountered an error processing your medical query.", []
\ No newline at end of file
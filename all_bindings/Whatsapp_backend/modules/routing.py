@@ -0,0 +1,13 @@
+# modules/routing.py
+"""
+Chat route identifiers, shared by the model gateway (which picks a route) and
+retrieval (which is configured per route) without importing one another.
+"""
+from enum import Enum
+
+
+class Route(Enum):
+    """Routing destinations for user queries."""
+    SLM_DIRECT = "slm_direct"  # Small talk, no RAG needed
+    SLM_RAG = "slm_rag"  # Simple medical, RAG + SLM
+    OPENAI_RAG = "openai_rag"  # Complex medical, RAG + OpenAI
@@ -1,69 +1,271 @@
-from typing import List, Dict, Any, Tuple
+import os
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 
-from supabase_client import async_supabase_rpc
+from storage import async_supabase_rpc
 from rag import async_generate_embedding
+from modules.admission_control import get_governor, Backend
+from modules.lexical_index import get_lexical_index, result_key
+from modules.reranker import get_reranker, RERANK_CANDIDATES, RERANK_TOP_N
+from modules.routing import Route
 
-async def hierarchical_rag_query(user_question: str, match_threshold: float = 0.3, match_count: int = 4) -> Tuple[List[Dict[str, Any]], float]:
+# Retrieval modes: embeddings only, local BM25 only, or both fused with RRF
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("RAG_MODE_DEFAULT", "hybrid")
+# Per-route override, e.g. RAG_MODE_SLM_RAG=vector
+ROUTE_RETRIEVAL_MODES = {
+    Route.SLM_RAG: os.getenv("RAG_MODE_SLM_RAG", DEFAULT_RETRIEVAL_MODE),
+    Route.OPENAI_RAG: os.getenv("RAG_MODE_OPENAI_RAG", DEFAULT_RETRIEVAL_MODE),
+}
+# Reciprocal-rank fusion constant
+RRF_K = 60
+# In hybrid mode each ranking contributes match_count * this many candidates
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("RAG_HYBRID_CANDIDATE_FACTOR", "3"))
+# FAQ candidates per ranking before fusion (only the top one is used)
+FAQ_CANDIDATES = 3
+
+
+def retrieval_mode_for(route: Route) -> str:
+    """Configured retrieval mode for a chat route."""
+    mode = ROUTE_RETRIEVAL_MODES.get(route, DEFAULT_RETRIEVAL_MODE)
+    return mode if mode in RETRIEVAL_MODES else "vector"
+
+
+def shared_retrieval_mode() -> Optional[str]:
     """
-    Performs a hierarchical search:
-    1. Embeds the user question.
-    2. Searches 'section_chunks' for matches (Hierarchical) -> Primary Source for Answer.
-    3. Searches 'faq' table for matches (FAQ) -> Primary Source for YouTube Link.
-    4. Merges and returns results.
-    
+    The retrieval mode both RAG routes use, or None when they are configured
+    differently. Speculative retrieval (started before the route is known)
+    only runs when there is one mode to speculate with.
+    """
+    modes = {retrieval_mode_for(Route.SLM_RAG), retrieval_mode_for(Route.OPENAI_RAG)}
+    return modes.pop() if len(modes) == 1 else None
+
+
+class SpeculationStats:
+    """
+    Outcomes of speculative retrievals. A used one saved the part of its run
+    that overlapped the generation stage's other inputs (classification,
+    translation, history); a discarded one (SLM_DIRECT, or a route decided on
+    the translation) was wasted work, cancelled mid-flight or already finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.used = 0
+        self.cancelled = 0
+        self.wasted_completed = 0
+        self.failed = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+
+    def record_used(self, saved_seconds: float) -> None:
+        with self._lock:
+            self.used += 1
+            self.saved_seconds += max(0.0, saved_seconds)
+
+    def record_discarded(self, elapsed_seconds: float, finished: bool) -> None:
+        with self._lock:
+            if finished:
+                self.wasted_completed += 1
+            else:
+                self.cancelled += 1
+            self.wasted_seconds += max(0.0, elapsed_seconds)
+
+    def record_failed(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        discarded = self.cancelled + self.wasted_completed
+        return {
+            "mode": shared_retrieval_mode(),
+            "used": self.used,
+            "cancelled": self.cancelled,
+            "wasted_completed": self.wasted_completed,
+            "failed": self.failed,
+            # Each used speculation also shares the routing embedding
+            "embedding_calls_saved": self.used,
+            "saved_ms_total": round(self.saved_seconds * 1000),
+            "saved_ms_mean": round(self.saved_seconds * 1000 / self.used, 1) if self.used else None,
+            "wasted_ms_total": round(self.wasted_seconds * 1000),
+            "wasted_ms_mean": round(self.wasted_seconds * 1000 / discarded, 1) if discarded else None,
+        }
+
+
+_speculation_stats = None
+
+
+def get_speculation_stats() -> SpeculationStats:
+    """
+    Get or create a singleton SpeculationStats instance.
+
     Returns:
-        Tuple of (results_list, best_similarity_score)
+        SpeculationStats instance
     """
-    print(f"Querying: {user_question}...")
-    
-    # 1. Embed user query
-    query_vector = await async_generate_embedding(user_question)
-    
+    global _speculation_stats
+    if _speculation_stats is None:
+        _speculation_stats = SpeculationStats()
+    return _speculation_stats
+
+
+def _fuse(rankings: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Reciprocal-rank fusion of result lists. When a row appears in several lists,
+    the first list's copy is kept (the vector one, which carries `similarity`).
+    """
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            key = result_key(item)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            items.setdefault(key, item)
+    top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [dict(items[key], rrf_score=round(score, 5)) for key, score in top]
+
+
+async def _vector_search(
+    user_question: str,
+    match_threshold: float,
+    doc_count: int,
+    faq_count: int,
+    query_vector: Optional[List[float]] = None,
+):
+    # 1. Embed user query (unless the caller already has the embedding)
+    if query_vector is None:
+        async with get_governor().slot(Backend.EMBEDDINGS):
+            query_vector = await async_generate_embedding(user_question)
+
     # 2. Call Supabase RPC functions
     params = {
         "query_embedding": query_vector,
         "match_threshold": match_threshold,
-        "match_count": match_count
+        "match_count": doc_count
     }
-    
-    merged_results = []
+
+    doc_results, faq_results = [], []
 
     # A. Search Hierarchical Docs (Primary Content)
     try:
-        doc_results = await async_supabase_rpc("hierarchical_search", params)
-        if doc_results:
-            for item in doc_results:
-                item["source_type"] = "DOCUMENT"
-                merged_results.append(item)
+        for item in await async_supabase_rpc("hierarchical_search", params, idempotent=True) or []:
+            item["source_type"] = "DOCUMENT"
+            doc_results.append(item)
     except Exception as e:
         print(f"Hierarchical search failed: {e}")
 
     # B. Search FAQ (For YouTube Link)
-    # We only need the top match to find a relevant video
     # match_faq likely only accepts query_embedding and match_count
     faq_params = {
         "query_embedding": query_vector,
-        "match_count": 1
+        "match_count": faq_count
     }
-    
+
     try:
-        faq_results = await async_supabase_rpc("match_faq", faq_params)
-        if faq_results:
-            for item in faq_results:
-                # Only add if it has a YouTube link or if we have no other results
-                if item.get("youtube_link") or not merged_results:
-                    item["source_type"] = "FAQ"
-                    # Ensure infographic_url is preserved if present
-                    if "infographic_url" not in item:
-                        item["infographic_url"] = None 
-                    
-                    merged_results.append(item)
+        for item in await async_supabase_rpc("match_faq", faq_params, idempotent=True) or []:
+            item["source_type"] = "FAQ"
+            faq_results.append(item)
     except Exception as e:
         print(f"FAQ search failed: {e}")
-    
-    # Calculate best similarity score for reward system
-    best_similarity = max((r.get("similarity", 0) for r in merged_results), default=0.0)
-    
+
+    return doc_results, faq_results
+
+
+async def _lexical_search(query: str, doc_count: int, faq_count: int):
+    try:
+        index = get_lexical_index()
+        await index.ensure_loaded()
+        docs = [dict(row) for row, _score in index.search_chunks(query, doc_count)]
+        faqs = [dict(row) for row, _score in index.search_faqs(query, faq_count)]
+        return docs, faqs
+    except Exception as e:
+        print(f"Lexical search failed: {e}")
+        return [], []
+
+
+async def hierarchical_rag_query(
+    user_question: str,
+    match_threshold: float = 0.3,
+    match_count: int = 4,
+    mode: Optional[str] = None,
+    lexical_query: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    query_vector: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Performs a hierarchical search:
+    1. Embeds the user question and/or runs the local BM25 index (see `mode`).
+    2. Searches 'section_chunks' for matches (Hierarchical) -> Primary Source for Answer.
+    3. Searches 'faq' table for matches (FAQ) -> Primary Source for YouTube Link.
+    4. Merges and returns results.
+
+    mode: "vector", "lexical" or "hybrid" (RRF of both); defaults to RAG_MODE_DEFAULT.
+    lexical_query: text for the BM25 side, typically the raw user message, so exact
+        terms (test names, clinic names) survive translation. Defaults to user_question.
+    rerank: over-fetch RERANK_CANDIDATES chunks and keep the RERANK_TOP_N best per
+        the configured reranker (RAG_RERANKER). Defaults to on when one is configured.
+    query_vector: embedding of user_question when the caller already computed it
+        (the chat turn shares the routing embedding), saving one embeddings call.
+
+    Returns:
+        Tuple of (results_list, best_similarity_score). best_similarity is computed
+        from the vector hits alone, the same in every mode, so switching mode does
+        not move the rewards threshold.
+    """
+    mode = mode or DEFAULT_RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    print(f"Querying ({mode}): {user_question}...")
+
+    reranker = get_reranker()
+    rerank = reranker.enabled if rerank is None else rerank and reranker.enabled
+    candidate_count = max(match_count, RERANK_CANDIDATES) if rerank else match_count
+
+    doc_rankings, faq_rankings = [], []
+    vector_docs, vector_faqs = [], []
+    if mode == "vector":
+        vector_docs, vector_faqs = await _vector_search(user_question, match_threshold, candidate_count, 1, query_vector)
+        doc_rankings.append(vector_docs)
+        faq_rankings.append(vector_faqs)
+    else:
+        doc_depth = max(match_count * HYBRID_CANDIDATE_FACTOR, candidate_count)
+        if mode == "hybrid":
+            vector_docs, vector_faqs = await _vector_search(user_question, match_threshold, doc_depth, FAQ_CANDIDATES, query_vector)
+            doc_rankings.append(vector_docs)
+            faq_rankings.append(vector_faqs)
+        # Search the raw and the translated wording together
+        keywords = lexical_query or user_question
+        if lexical_query and lexical_query != user_question:
+            keywords = f"{lexical_query} {user_question}"
+        docs, faqs = await _lexical_search(keywords, doc_depth, FAQ_CANDIDATES)
+        doc_rankings.append(docs)
+        faq_rankings.append(faqs)
+
+    candidates = _fuse(doc_rankings, candidate_count)
+    if rerank:
+        rerank_query = f"{lexical_query} {user_question}" if lexical_query and lexical_query != user_question else user_question
+        merged_results = await reranker.rerank(rerank_query, candidates, top_n=min(match_count, RERANK_TOP_N))
+    else:
+        merged_results = candidates[:match_count]
+
+    # We only need the top match to find a relevant video
+    for item in _fuse(faq_rankings, 1):
+        # Only add if it has a YouTube link or if we have no other results
+        if item.get("youtube_link") or not merged_results:
+            # Ensure infographic_url is preserved if present
+            if "infographic_url" not in item:
+                item["infographic_url"] = None
+
+            merged_results.append(item)
+
+    # Calculate best similarity score for reward system. Taken from the raw vector
+    # hits exactly as vector-only retrieval returns them (top match_count chunks,
+    # plus the top FAQ if it has a video or no chunk matched), so neither fusion
+    # nor reranking changes the reward signal.
+    reward_hits = vector_docs[:match_count] + [
+        r for r in vector_faqs[:1] if r.get("youtube_link") or not vector_docs
+    ]
+    best_similarity = max((r.get("similarity", 0) for r in reward_hits), default=0.0)
+
     return merged_results, best_similarity
 
 def format_hierarchical_context(results: List[Dict[str, Any]]) -> str:
@@ -96,10 +298,12 @@ def format_hierarchical_context(results: List[Dict[str, Any]]) -> str:
             # Document source
             path = match.get("header_path", "Unknown Path")
             content = match.get("section_content", "")
-            similarity = match.get("similarity", 0)
+            similarity = match.get("similarity")
+            # Keyword-only (BM25) matches have no vector similarity
+            relevance = f"{similarity:.2f}" if similarity is not None else "keyword match"
             
             doc_context += f"""
---- SOURCE: DOCUMENT (Relevance: {similarity:.2f}) ---
+--- SOURCE: DOCUMENT (Relevance: {relevance}) ---
 Path: {path}
 Content: {content}
 --------------------------------------------------
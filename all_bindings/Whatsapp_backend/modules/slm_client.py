@@ -7,6 +7,7 @@ import httpx
 from fastapi import HTTPException
 
 from modules.text_utils import truncate_response
+from modules.admission_control import get_governor, Backend, Overloaded
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -257,7 +258,7 @@ class SLMClient:
         if self.endpoint_url:
             # Real API call to SLM endpoint
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                async with get_governor().slot(Backend.SLM), httpx.AsyncClient(timeout=30.0) as client:
                     # Build system instruction with guardrails
                     system_instruction = self._build_system_instruction("direct", language, user_name)
                     
@@ -303,6 +304,8 @@ class SLMClient:
                     logger.info(f"SLM response received: {response_text[:100]}...")
                     return response_text
                     
+            except Overloaded:
+                raise
             except httpx.HTTPStatusError as e:
                 logger.error(f"SLM API error: {e.response.status_code} - {e.response.text}")
                 raise HTTPException(status_code=502, detail=f"SLM API error: {e.response.status_code}")
@@ -351,7 +354,7 @@ class SLMClient:
         if self.endpoint_url:
             # Real API call to SLM endpoint for RAG
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                async with get_governor().slot(Backend.SLM), httpx.AsyncClient(timeout=30.0) as client:
                     # Build system instruction with guardrails
                     system_instruction = self._build_system_instruction("rag", language, user_name)
                     
@@ -398,6 +401,8 @@ class SLMClient:
                     logger.info(f"SLM RAG response received: {response_text[:100]}...")
                     return response_text
                     
+            except Overloaded:
+                raise
             except httpx.HTTPStatusError as e:
                 logger.error(f"SLM API error: {e.response.status_code} - {e.response.text}")
                 raise HTTPException(status_code=502, detail=f"SLM API error: {e.response.status_code}")
@@ -449,7 +454,7 @@ class SLMClient:
         
         if self.endpoint_url:
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
+                async with get_governor().slot(Backend.SLM), httpx.AsyncClient(timeout=10.0) as client:
                     # Construct prompt
                     system_instruction = f"{SLM_INTENT_PROMPT}\nTARGET LANGUAGE: {language.upper()}"
                     
@@ -5,9 +5,11 @@ Used for routing and internal processing.
 """
 import os
 import logging
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from modules.admission_control import get_governor, Backend
+from modules.openai_client import get_openai
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +20,8 @@ _api_key = os.getenv("OPENAI_API_KEY")
 if not _api_key:
     raise Exception("OPENAI_API_KEY missing")
 
-client = AsyncOpenAI(api_key=_api_key)
+client = get_openai()
+governor = get_governor()
 
 
 async def translate_query(text: str, target_lang: str = "en") -> str:
@@ -39,25 +42,27 @@ async def translate_query(text: str, target_lang: str = "en") -> str:
     # For routing, we mainly need English translation
     if target_lang.lower() == "en":
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a translator. Translate the following text to English. "
-                            "If the text is already in English, return it as is. "
-                            "Only return the translated text, nothing else."
-                        )
-                    },
-                    {
-                        "role": "user", 
-                        "content": text
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=500,
-            )
+            # If shed under load, fall through to the original text below
+            async with governor.slot(Backend.OPENAI_CHAT):
+                response = await client.chat(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": (
+                                "You are a translator. Translate the following text to English. "
+                                "If the text is already in English, return it as is. "
+                                "Only return the translated text, nothing else."
+                            )
+                        },
+                        {
+                            "role": "user", 
+                            "content": text
+                        }
+                    ],
+                    temperature=0.1,
+                    max_tokens=500,
+                )
             
             translated = response.choices[0].message.content.strip()
             logger.info(f"Translated '{text[:30]}...' to '{translated[:30]}...'")
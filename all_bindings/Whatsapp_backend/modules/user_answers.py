@@ -1,13 +1,16 @@
 # modules/user_answers.py
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+from urllib.parse import quote
 
-from supabase_client import supabase_insert
+from storage import supabase_insert, supabase_select, supabase_update
 
+ANSWERS_TABLE = "sakhi_users_answer"
+# Answers per chunk (one lookup and one insert request each); larger
+# submissions are written in chunks of this size
+ANSWER_BATCH_SIZE = 500
 
-def save_user_answer(user_id: str, question_key: str, selected_options: List[str]):
-    """
-    Save a single answer row to sakhi_users_answer.
-    """
+
+def _answer_row(user_id: str, question_key: str, selected_options: List[str]) -> dict:
     if not user_id:
         raise ValueError("user_id is required")
     if not question_key:
@@ -15,31 +18,91 @@ def save_user_answer(user_id: str, question_key: str, selected_options: List[str
     if not selected_options or not isinstance(selected_options, list):
         raise ValueError("selected_options must be a non-empty list of strings")
 
-    payload = {
+    return {
         "user_id": user_id,
         "question_key": question_key,
         "selected_options": selected_options,
     }
 
-    return supabase_insert("sakhi_users_answer", payload)
+
+def _in_list(values: List[str]) -> str:
+    """PostgREST in.(...) operand with each value quoted and URL-encoded."""
+    items = ",".join('"' + v.replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return quote(f"({items})", safe="")
+
+
+def _write_chunk(user_id: str, chunk: List[dict]) -> Dict[str, dict]:
+    """
+    Insert the answers this user has not given yet in one request, and update
+    the ones already stored. Returns the stored rows by question_key.
+    """
+    existing = supabase_select(
+        ANSWERS_TABLE,
+        select="question_key",
+        filters=f"user_id=eq.{quote(user_id, safe='')}&question_key=in.{_in_list([row['question_key'] for row in chunk])}",
+    ) or []
+    known = {row.get("question_key") for row in existing}
+
+    stored = {}
+    new_rows = [row for row in chunk if row["question_key"] not in known]
+    if new_rows:
+        inserted = supabase_insert(ANSWERS_TABLE, new_rows)
+        for row, result in zip(new_rows, inserted if isinstance(inserted, list) else []):
+            stored[row["question_key"]] = result
+        for row in new_rows:
+            stored.setdefault(row["question_key"], row)
+    for row in chunk:
+        if row["question_key"] in known:
+            match = f"user_id=eq.{quote(user_id, safe='')}&question_key=eq.{quote(row['question_key'], safe='')}"
+            result = supabase_update(ANSWERS_TABLE, match, {"selected_options": row["selected_options"]}) or []
+            stored[row["question_key"]] = result[0] if result else row
+    return stored
+
+
+def save_user_answer(user_id: str, question_key: str, selected_options: List[str]):
+    """
+    Save a single answer row to sakhi_users_answer.
+    """
+    return supabase_insert(ANSWERS_TABLE, _answer_row(user_id, question_key, selected_options))
 
 
 def save_bulk_answers(user_id: str, answers: List[dict]) -> Tuple[int, List]:
     """
     Save multiple answers for a user. Returns (saved_count, raw_results).
+
+    Rows are keyed on (user_id, question_key) (unique; see
+    all_bindings/migrations), so resubmitting replaces earlier answers
+    instead of duplicating them. Per ANSWER_BATCH_SIZE answers, one lookup
+    finds the keys already stored, new answers go in one array insert and
+    the others are updated in place. raw_results has one entry per answer, in
+    order: the stored row, or {"question_key", "error"} if its chunk failed.
     """
     if not answers:
         raise ValueError("answers cannot be empty")
 
-    saved = 0
-    results = []
-
+    # Validate everything before writing anything; a repeated question_key
+    # keeps its last answer (one insert cannot add the same key twice).
+    rows = {}
     for answer in answers:
-        q_key = answer.get("question_key")
-        opts = answer.get("selected_options")
+        row = _answer_row(user_id, answer.get("question_key"), answer.get("selected_options"))
+        rows.pop(row["question_key"], None)
+        rows[row["question_key"]] = row
+
+    stored = {}
+    last_error = None
+    pending = list(rows.values())
+    for start in range(0, len(pending), ANSWER_BATCH_SIZE):
+        chunk = pending[start:start + ANSWER_BATCH_SIZE]
+        try:
+            stored.update(_write_chunk(user_id, chunk))
+        except Exception as e:
+            last_error = e
+            for row in chunk:
+                stored[row["question_key"]] = {"question_key": row["question_key"], "error": str(e)}
 
-        result = save_user_answer(user_id, q_key, opts)
-        results.append(result)
-        saved += 1
+    saved = sum(1 for result in stored.values() if "error" not in result)
+    if not saved and last_error is not None:
+        raise last_error
 
+    results = [stored.get(answer["question_key"], rows[answer["question_key"]]) for answer in answers]
     return saved, results
@@ -1,7 +1,8 @@
 # modules/user_profile.py
 import re
+from typing import Optional, TypedDict
 
-from supabase_client import (
+from storage import (
     generate_user_id,
     supabase_insert,
     supabase_select,
@@ -9,6 +10,39 @@ from supabase_client import (
 )
 
 
+# Column projections for sakhi_users reads. Callers ask for the view they need
+# instead of select="*", which also pulls the context JSON and password_hash.
+CHAT_IDENTITY_COLUMNS = "user_id,name,gender,location"
+PROFILE_COLUMNS = (
+    "user_id,name,email,phone_number,role,preferred_language,relation_to_patient,"
+    "gender,location,rewards,sakhi_journey_stage,sakhi_journey_date,sakhi_journey_date_type"
+)
+REWARDS_COLUMNS = "rewards"
+# Login also reads password_hash to check it; it is never returned
+LOGIN_COLUMNS = f"{PROFILE_COLUMNS},password_hash"
+
+
+class ChatIdentity(TypedDict, total=False):
+    """What a chat turn needs: who the user is and whether onboarding is done."""
+    user_id: str
+    name: Optional[str]
+    gender: Optional[str]
+    location: Optional[str]
+
+
+class UserProfile(ChatIdentity, total=False):
+    """The user's profile as returned to clients (no password_hash or context)."""
+    email: Optional[str]
+    phone_number: Optional[str]
+    role: Optional[str]
+    preferred_language: Optional[str]
+    relation_to_patient: Optional[str]
+    rewards: Optional[int]
+    sakhi_journey_stage: Optional[str]
+    sakhi_journey_date: Optional[str]
+    sakhi_journey_date_type: Optional[str]
+
+
 def _normalize_phone(phone: str | None) -> str | None:
     """
     Strip non-digits, remove leading +91/91 for consistency, keep remaining digits.
@@ -76,11 +110,11 @@ def update_preferred_language(user_id: str, preferred_language: str):
     return supabase_update("sakhi_users", match, {"preferred_language": preferred_language})
 
 
-def get_user_profile(user_id: str):
+def get_user_profile(user_id: str, columns: str = PROFILE_COLUMNS) -> Optional[UserProfile]:
     """
-    Fetch complete user profile.
+    Fetch the user profile (PROFILE_COLUMNS unless another projection is given).
     """
-    rows = supabase_select("sakhi_users", select="*", filters=f"user_id=eq.{user_id}")
+    rows = supabase_select("sakhi_users", select=columns, filters=f"user_id=eq.{user_id}")
 
     if not rows or not isinstance(rows, list):
         return None
@@ -88,7 +122,7 @@ def get_user_profile(user_id: str):
     return rows[0]
 
 
-def get_user_by_phone(phone_number: str):
+def get_user_by_phone(phone_number: str, columns: str = PROFILE_COLUMNS) -> Optional[UserProfile]:
     """
     Fetch user by phone_number (or phone).
     """
@@ -98,14 +132,23 @@ def get_user_by_phone(phone_number: str):
     if not norm:
         return None
     # try phone_number first
-    rows = supabase_select("sakhi_users", select="*", filters=f"phone_number=eq.{norm}")
+    rows = supabase_select("sakhi_users", select=columns, filters=f"phone_number=eq.{norm}")
     if rows and isinstance(rows, list) and rows:
         return rows[0]
     return None
 
 
+def get_chat_identity(user_id: str | None = None, phone_number: str | None = None) -> Optional[ChatIdentity]:
+    """
+    Fetch only what a chat turn needs (CHAT_IDENTITY_COLUMNS), by user_id or phone.
+    """
+    if user_id:
+        return get_user_profile(user_id, columns=CHAT_IDENTITY_COLUMNS)
+    return get_user_by_phone(phone_number, columns=CHAT_IDENTITY_COLUMNS)
+
+
 def resolve_user_id_by_phone(phone_number: str) -> str | None:
-    user = get_user_by_phone(phone_number)
+    user = get_user_by_phone(phone_number, columns="user_id")
     if user:
         return user.get("user_id")
     return None
@@ -152,7 +195,7 @@ def update_user_context(user_id: str, context: dict):
         raise ValueError("user_id is required")
 
     # Fetch existing
-    profile = get_user_profile(user_id)
+    profile = get_user_profile(user_id, columns="context")
     if not profile:
         raise ValueError("User not found")
     
@@ -174,7 +217,7 @@ def update_user_context(user_id: str, context: dict):
 def login_user(email: str, password: str):
     """
     Authenticate user by email and password.
-    Returns user profile if credentials are valid, None otherwise.
+    Returns the user profile (without password_hash) if credentials are valid, None otherwise.
     """
     if not email:
         raise ValueError("email is required")
@@ -182,7 +225,7 @@ def login_user(email: str, password: str):
         raise ValueError("password is required")
     
     # Fetch user by email
-    rows = supabase_select("sakhi_users", select="*", filters=f"email=eq.{email}")
+    rows = supabase_select("sakhi_users", select=LOGIN_COLUMNS, filters=f"email=eq.{email}")
     
     if not rows or not isinstance(rows, list) or len(rows) == 0:
         return None
@@ -194,6 +237,7 @@ def login_user(email: str, password: str):
     
     if stored_password != password:
         return None
+    user.pop("password_hash", None)
     
     # Authentication successful
     return user
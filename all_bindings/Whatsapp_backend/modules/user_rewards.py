@@ -13,7 +13,8 @@ from enum import Enum
 from typing import Optional
 import asyncio
 
-from supabase_client import supabase_update, supabase_insert, supabase_select
+from storage import supabase_update, supabase_insert, supabase_select
+from modules.user_profile import REWARDS_COLUMNS
 
 
 class RewardType(Enum):
@@ -86,7 +87,7 @@ async def award_points(user_id: str, reward_type: RewardType) -> None:
         # Fetch current rewards
         rows = supabase_select(
             "sakhi_users",
-            select="rewards",
+            select=REWARDS_COLUMNS,
             filters=f"user_id=eq.{user_id}"
         )
         
@@ -143,7 +144,7 @@ def get_user_rewards(user_id: str) -> int:
     try:
         rows = supabase_select(
             "sakhi_users",
-            select="rewards",
+            select=REWARDS_COLUMNS,
             filters=f"user_id=eq.{user_id}"
         )
         
@@ -0,0 +1,60 @@
+# storage.py
+"""
+The supabase_client helpers, run under the resilience policy.
+
+Modules import supabase_insert / supabase_select / supabase_update /
+supabase_rpc / async_supabase_rpc from here rather than from supabase_client.
+Each call gets a deadline, a per-attempt timeout, jittered retries, a circuit
+breaker per table / RPC and a bulkhead (see resilience.py).
+
+Selects are retried on any transient failure. Inserts, updates and RPCs are
+retried only when the request never reached the server, unless the caller
+passes idempotent=True (e.g. read-only search RPCs).
+"""
+from typing import Any, Dict, List, Optional, Union
+
+import supabase_client
+from supabase_client import generate_user_id  # noqa: F401  (re-exported)
+from resilience import client_attempt, get_resilience
+
+
+def supabase_insert(table: str, data: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    return get_resilience().call(table, client_attempt(lambda: supabase_client.supabase_insert(table, data)))
+
+
+def supabase_select(table: str, select: str = "*", filters: str = "", limit: Optional[int] = None):
+    def run():
+        if limit is None:
+            return supabase_client.supabase_select(table, select=select, filters=filters)
+        return supabase_client.supabase_select(table, select=select, filters=filters, limit=limit)
+
+    return get_resilience().call(table, client_attempt(run), idempotent=True)
+
+
+def supabase_update(table: str, match: str, data: Dict[str, Any], idempotent: bool = False):
+    """
+    match example: "user_id=eq.<id>"
+    idempotent=True lets a timed-out PATCH be retried; leave it off for
+    guarded or incrementing updates.
+    """
+    return get_resilience().call(
+        table, client_attempt(lambda: supabase_client.supabase_update(table, match, data)), idempotent=idempotent
+    )
+
+
+def supabase_rpc(function_name: str, params: Dict[str, Any], idempotent: bool = False):
+    key = f"rpc:{function_name}"
+    return get_resilience().call(
+        key, client_attempt(lambda: supabase_client.supabase_rpc(function_name, params)), pool="rpc", idempotent=idempotent
+    )
+
+
+async def async_supabase_rpc(function_name: str, params: Dict[str, Any], idempotent: bool = False):
+    """
+    supabase_rpc for async code: attempts run on a worker thread and retries
+    back off without blocking the event loop.
+    """
+    key = f"rpc:{function_name}"
+    return await get_resilience().acall(
+        key, client_attempt(lambda: supabase_client.supabase_rpc(function_name, params)), pool="rpc", idempotent=idempotent
+    )
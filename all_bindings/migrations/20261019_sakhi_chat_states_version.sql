@@ -0,0 +1,25 @@
+-- Version column for optimistic concurrency on sakhi_chat_states.
+--
+-- The WhatsApp backend's ChatStateStore reads `context,version` and writes
+-- with an update guarded by version=eq.<version it read>, bumping it by one.
+-- Without the column every chat-state read fails, the lead flow sees an
+-- empty state and restarts on every message.
+--
+-- Existing rows start at version 0. A column added earlier by hand as
+-- nullable is backfilled and tightened to match.
+--
+-- Run once, in the Supabase SQL editor or with psql, before deploying the
+-- chat-state change. Safe to re-run.
+
+begin;
+
+alter table sakhi_chat_states
+    add column if not exists version integer not null default 0;
+
+update sakhi_chat_states set version = 0 where version is null;
+
+alter table sakhi_chat_states
+    alter column version set default 0,
+    alter column version set not null;
+
+commit;
@@ -0,0 +1,19 @@
+-- Shared session-token revocations for the web app backend.
+--
+-- Profile and language updates revoke the user's outstanding session
+-- tokens: any token issued before revoked_at (epoch seconds) is rejected.
+-- Every worker writes here and re-reads the recent rows, so a revocation
+-- made by one worker applies in all of them. /user/session/refresh checks
+-- this table directly.
+--
+-- Run once, in the Supabase SQL editor or with psql, before deploying the
+-- session-token change. Safe to re-run.
+
+create table if not exists sakhi_session_revocations (
+    user_id text primary key,
+    revoked_at double precision not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists sakhi_session_revocations_revoked_at_idx
+    on sakhi_session_revocations (revoked_at);
@@ -0,0 +1,40 @@
+-- One answer per (user_id, question_key) in sakhi_users_answer.
+--
+-- save_bulk_answers in both backends treats a resubmitted answer as a
+-- replacement: the web app upserts on (user_id, question_key), and the
+-- WhatsApp backend looks the keys up and updates them. Both rely on this
+-- constraint. Earlier code inserted a new row on every submission, so
+-- existing data can contain duplicates. Those are removed first, keeping
+-- the most recent row per key.
+--
+-- Run once, in the Supabase SQL editor or with psql, before deploying the
+-- bulk-answer change. Safe to re-run.
+
+begin;
+
+delete from sakhi_users_answer
+where ctid in (
+    select ctid
+    from (
+        select
+            ctid,
+            row_number() over (
+                partition by user_id, question_key
+                order by created_at desc nulls last, ctid desc
+            ) as position
+        from sakhi_users_answer
+    ) ranked
+    where ranked.position > 1
+);
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_constraint where conname = 'sakhi_users_answer_user_id_question_key_key'
+    ) then
+        alter table sakhi_users_answer
+            add constraint sakhi_users_answer_user_id_question_key_key unique (user_id, question_key);
+    end if;
+end $$;
+
+commit;
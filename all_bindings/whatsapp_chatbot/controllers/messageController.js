@@ -131,6 +131,8 @@ async function handleChatAndReply(messageInfo) {
     phone_number: phoneNumber,
     message: messageInfo.text,
     language: "en",
+    message_id: messageInfo.id,
+    timestamp: messageInfo.raw?.timestamp || null,
   };
 
   console.log("Calling support API", { url: SUPPORT_API_URL });
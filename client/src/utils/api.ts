@@ -1,6 +1,33 @@
 // Use proxy routes to avoid mixed content errors (HTTPS -> HTTP)
 const API_BASE_URL = 'http://localhost:8101/api/proxy';
 
+// Sakhi session token: sent as a bearer token so chat turns skip the profile read
+const SESSION_TOKEN_KEY = 'sakhiSessionToken';
+
+export function getSessionToken(): string | null {
+  return localStorage.getItem(SESSION_TOKEN_KEY);
+}
+
+function storeSessionToken(token: string | null | undefined) {
+  if (token) {
+    localStorage.setItem(SESSION_TOKEN_KEY, token);
+  }
+}
+
+export function clearSessionToken() {
+  localStorage.removeItem(SESSION_TOKEN_KEY);
+}
+
+function sessionTokenExpired(token: string): boolean {
+  try {
+    const payload = token.split('.')[0].replace(/-/g, '+').replace(/_/g, '/');
+    const claims = JSON.parse(atob(payload + '='.repeat((4 - (payload.length % 4)) % 4)));
+    return Date.now() / 1000 >= claims.exp;
+  } catch {
+    return true;
+  }
+}
+
 export interface RegisterUserData {
   name: string;
   email: string;
@@ -37,6 +64,8 @@ export interface RegisterResponse {
 export interface LoginResponse {
   status: string;
   user_id: string;
+  session_token?: string;
+  expires_in?: number;
   user: {
     user_id: string;
     name: string;
@@ -133,13 +162,42 @@ export async function loginUser(data: LoginUserData): Promise<LoginResponse> {
     throw new Error(result.detail || result.error || 'Login failed');
   }
 
+  storeSessionToken(result.session_token);
   return result;
 }
 
+export async function refreshSession(): Promise<boolean> {
+  const token = getSessionToken();
+  if (!token) {
+    return false;
+  }
+  const response = await fetch(`${API_BASE_URL}/user/session/refresh`, {
+    method: 'POST',
+    headers: { 'Authorization': `Bearer ${token}` },
+  });
+  if (!response.ok) {
+    // Revoked, or past the refresh window: chat falls back to user_id until the next login
+    clearSessionToken();
+    return false;
+  }
+  const result = await response.json();
+  storeSessionToken(result.session_token);
+  return true;
+}
+
 export async function sendChatMessage(userId: string, message: string, language: string = 'en'): Promise<ChatResponse> {
+  const stored = getSessionToken();
+  if (stored && sessionTokenExpired(stored)) {
+    await refreshSession().catch(() => false);
+  }
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+  const token = getSessionToken();
+  if (token) {
+    headers['Authorization'] = `Bearer ${token}`;
+  }
   const response = await fetch(`${API_BASE_URL}/sakhi/chat`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers,
     body: JSON.stringify({
       user_id: userId,
       message: message,
@@ -152,6 +210,7 @@ export async function sendChatMessage(userId: string, message: string, language:
     throw new Error(result.error || 'Chat request failed');
   }
 
+  storeSessionToken(response.headers.get('X-Session-Token'));
   return await response.json();
 }
 
@@ -970,6 +970,23 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // Proxy: Session Refresh
+  app.post("/api/proxy/user/session/refresh", async (req, res) => {
+    try {
+      const response = await fetch(`${SAKHI_API_BASE}/user/session/refresh`, {
+        method: "POST",
+        headers: { Authorization: req.headers.authorization || "" },
+      });
+      const data = await response.json();
+      res.status(response.status).json(data);
+    } catch (error: any) {
+      console.error("Proxy session refresh error:", error);
+      res
+        .status(500)
+        .json({ error: "Failed to connect to authentication server" });
+    }
+  });
+
   // Proxy: User Register
   app.post("/api/proxy/user/register", async (req, res) => {
     try {
@@ -994,11 +1011,20 @@ export async function registerRoutes(app: Express): Promise<Server> {
       console.log(`📡 Proxying chat to: ${SAKHI_API_BASE}/sakhi/chat`);
       console.log(`📦 Request body:`, JSON.stringify(req.body));
 
+      const headers: Record<string, string> = { "Content-Type": "application/json" };
+      if (req.headers.authorization) {
+        headers.Authorization = req.headers.authorization;
+      }
       const response = await fetch(`${SAKHI_API_BASE}/sakhi/chat`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers,
         body: JSON.stringify(req.body),
       });
+      // Sakhi sends a fresh session token whenever it had to read the profile
+      const sessionToken = response.headers.get("X-Session-Token");
+      if (sessionToken) {
+        res.setHeader("X-Session-Token", sessionToken);
+      }
       const data = await response.json();
       res.status(response.status).json(data);
     } catch (error: any) {